@@ -0,0 +1,3 @@
+class FhirPathError(Exception):
+    """Custom exception for FHIRPath expressions that cannot be parsed or evaluated"""
+    pass
@@ -0,0 +1,3 @@
+class InvalidTestScriptError(Exception):
+    """Custom exception for TestScripts that are rejected before any request is sent"""
+    pass
\ No newline at end of file
@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+
+MANIFEST_FILENAME = ".manifest.json"
+
+
+class DownloadManifest:
+    """
+    Remembers ETag and Last-Modified of every downloaded file of one folder,
+    so the next sync can send conditional requests and skip unchanged files.
+    """
+
+    def __init__(self, json_dir):
+        self.json_dir = json_dir
+        self.path = os.path.join(json_dir, MANIFEST_FILENAME)
+        self.entries = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        Loads the manifest of the folder.
+
+        :return: Dictionary filename -> {"url", "etag", "lastModified"} or empty dict.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    def conditional_headers(self, filename):
+        """
+        Builds If-None-Match / If-Modified-Since headers for a file.
+        Only if the file still exists locally, otherwise it has to be downloaded again.
+
+        :param filename: Name of the file inside the folder.
+        :return: Dictionary of request headers.
+        """
+        entry = self.entries.get(filename)
+        if not entry or not os.path.exists(os.path.join(self.json_dir, filename)):
+            return {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+    def update(self, filename, url, response):
+        """
+        Stores the validators of a successful download.
+
+        :param filename: Name of the file inside the folder.
+        :param url: URL the file was downloaded from.
+        :param response: HTTP response of the download.
+        """
+        with self._lock:
+            self.entries[filename] = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "lastModified": response.headers.get("Last-Modified"),
+            }
+
+    def save(self):
+        """Writes the manifest into the folder."""
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
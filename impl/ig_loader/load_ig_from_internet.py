@@ -1,16 +1,54 @@
-import requests
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 import re
+import sys
+
+from download_manifest import DownloadManifest
+
+# The modules of test_script_evaluator import each other by name, like the modules of this folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_script_evaluator"))
+from http_client import FhirHttpClient
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+
+_config = None
+_http_client = None
+
+
+def read_config():
+    global _config
+    if _config is None:
+        with open("../config.json", "r") as f:
+            _config = json.load(f)
+    return _config
 
 
 def read_config_file():
-    with open("../config.json", "r") as f:
-        config = json.load(f)
-    url = config["url"]
+    url = read_config()["url"]
     return url
 
+
+def get_download_workers():
+    """
+    :return: Number of parallel downloads ("downloadWorkers" in config.json).
+    """
+    return read_config().get("downloadWorkers", DEFAULT_DOWNLOAD_WORKERS)
+
+
+def get_http_client():
+    """
+    Returns the pooled HTTP client shared by all downloads.
+    The pool keeps at least one connection per download worker alive.
+    """
+    global _http_client
+    if _http_client is None:
+        settings = dict(read_config().get("http", {}))
+        settings["poolMaxsize"] = max(settings.get("poolMaxsize", 10), get_download_workers())
+        _http_client = FhirHttpClient(settings)
+    return _http_client
+
 def save_example_instances():
     # Use the specific directory path
     json_dir = os.path.join("..", "Example_Instances")
@@ -22,7 +60,7 @@ def save_example_instances():
     base_url = read_config_file()
 
     # Get the artifacts page
-    response = requests.get(f"{base_url}/artifacts.html")
+    response = get_http_client().get(f"{base_url}/artifacts.html")
 
     soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -56,7 +94,7 @@ def save_profiles():
     base_url = read_config_file()
 
     # Get the artifacts page
-    response = requests.get(f"{base_url}/artifacts.html")
+    response = get_http_client().get(f"{base_url}/artifacts.html")
 
     soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -83,20 +121,59 @@ def save_profiles():
 
 
 def save_links(links, json_dir, url):
-    for link in links:
-        json_url = f"{url}/{link.replace('.html', '.json')}"
-        json_response = requests.get(json_url)
+    """
+    Downloads the JSON version of every link concurrently into json_dir.
+    Files that did not change since the last sync are skipped (HTTP 304).
+
+    :param links: Links to the html pages of the artifacts.
+    :param json_dir: Target folder.
+    :param url: Base URL of the IG.
+    """
+    manifest = DownloadManifest(json_dir)
+
+    def download(link):
+        filename = link.replace('.html', '.json')
+        return download_file(f"{url}/{filename}", json_dir, filename, manifest)
 
-        if json_response.status_code == 200:
-            filename = link.replace('.html', '.json')
-            filepath = os.path.join(json_dir, filename)
-            print(f"Saving to file: {filepath}")
+    with ThreadPoolExecutor(max_workers=get_download_workers()) as pool:
+        results = list(pool.map(download, links))
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(json_response.text)
-            print("File saved successfully!")
-        else:
-            print(f"Failed to get JSON content from {json_url}")
+    manifest.save()
+    print(f"{results.count('saved')} saved, {results.count('unchanged')} unchanged, "
+          f"{results.count('failed')} failed in {json_dir}")
+
+
+def download_file(json_url, json_dir, filename, manifest):
+    """
+    Downloads one file with a conditional request.
+
+    :param json_url: URL of the JSON file.
+    :param json_dir: Target folder.
+    :param filename: Name of the file inside the target folder.
+    :param manifest: DownloadManifest of the target folder.
+    :return: "saved", "unchanged" or "failed".
+    """
+    try:
+        json_response = get_http_client().get(json_url, headers=manifest.conditional_headers(filename))
+    except Exception as e:
+        print(f"Failed to get JSON content from {json_url}: {e}")
+        return "failed"
+
+    if json_response.status_code == 304:
+        print(f"Unchanged: {filename}")
+        return "unchanged"
+
+    if json_response.status_code == 200:
+        filepath = os.path.join(json_dir, filename)
+        print(f"Saving to file: {filepath}")
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(json_response.text)
+        manifest.update(filename, json_url, json_response)
+        return "saved"
+
+    print(f"Failed to get JSON content from {json_url}")
+    return "failed"
 
 
 def save_test_scripts():
@@ -108,32 +185,20 @@ def save_test_scripts():
     base_url = read_config_file()
 
     # Get the main test page
-    response = requests.get(f"{base_url}/tests.html")
+    response = get_http_client().get(f"{base_url}/tests.html")
 
     soup = BeautifulSoup(response.text, 'html.parser')
 
     # Find all TestScript links
+    links = []
     for link in soup.find_all('a'):
         href = link.get('href')
         if href and href.startswith('TestScript-'):
+            links.append(href)
 
-            # Convert to direct JSON URL
-            json_url = f"{base_url}/{href.replace('.html', '.json')}"
-
-            # Get JSON content directly
-            json_response = requests.get(json_url)
-
-            if json_response.status_code == 200:
-                # Get filename and create full path
-                filename = href.replace('.html', '.json')
-                filepath = os.path.join(json_dir, filename)
+    links = list(dict.fromkeys(links))
 
-                # Save JSON content to file
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(json_response.text)
-                print("File saved successfully!")
-            else:
-                print(f"Failed to get JSON content from {json_url}")
+    save_links(links, json_dir, base_url)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+"""
+Loads an IG from its FHIR NPM package (package.tgz) instead of scraping the IG website.
+The package is read in one sequential pass, StructureDefinitions go to Profiles/,
+examples to Example_Instances/ and TestScripts to Test_Scripts/.
+
+The package is taken from "package" in config.json (local file or URL),
+otherwise <url>/package.tgz is downloaded once and cached in Packages/.
+"""
+import json
+import os
+import posixpath
+import tarfile
+
+from download_manifest import DownloadManifest
+from load_ig_from_internet import get_http_client, read_config, read_config_file
+
+PACKAGE_CACHE_DIR = os.path.join("..", "Packages")
+PACKAGE_FILENAME = "package.tgz"
+
+# Folders of the package that contain resources
+RESOURCE_FOLDERS = ("package", "package/example", "package/tests")
+
+
+def get_package_source():
+    """
+    :return: Path or URL of the package ("package" in config.json or <url>/package.tgz).
+    """
+    return read_config().get("package") or f"{read_config_file()}/{PACKAGE_FILENAME}"
+
+
+def fetch_package(source):
+    """
+    Returns a local path of the package, downloads it if the source is a URL.
+    An unchanged package is not downloaded again, without a connection the cached package is used.
+
+    :param source: Local path or URL of package.tgz.
+    :return: Local path of package.tgz.
+    """
+    if not source.startswith(("http://", "https://")):
+        return source
+
+    os.makedirs(PACKAGE_CACHE_DIR, exist_ok=True)
+    path = os.path.join(PACKAGE_CACHE_DIR, PACKAGE_FILENAME)
+    manifest = DownloadManifest(PACKAGE_CACHE_DIR)
+
+    try:
+        response = get_http_client().get(source, headers=manifest.conditional_headers(PACKAGE_FILENAME), stream=True)
+    except Exception as e:
+        if os.path.exists(path):
+            print(f"Could not download {source} ({e}), using cached package {path}")
+            return path
+        raise
+
+    with response:
+        if response.status_code == 304:
+            print(f"Package unchanged: {path}")
+            return path
+
+        if response.status_code == 200:
+            print(f"Downloading package {source}")
+            temp_path = path + ".part"
+            with open(temp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            os.replace(temp_path, path)
+            manifest.update(PACKAGE_FILENAME, source, response)
+            manifest.save()
+            return path
+
+    if os.path.exists(path):
+        print(f"Failed to download {source} (HTTP {response.status_code}), using cached package {path}")
+        return path
+    raise RuntimeError(f"Failed to download package from {source}: HTTP {response.status_code}")
+
+
+def classify(folder, resource_type):
+    """
+    Decides into which folder a resource of the package belongs.
+
+    :param folder: Folder of the resource inside the package.
+    :param resource_type: resourceType of the resource.
+    :return: Target folder name or None if the resource is not needed.
+    """
+    if resource_type == "TestScript":
+        return "Test_Scripts"
+    if folder == "package/example":
+        return "Example_Instances"
+    if resource_type == "StructureDefinition":
+        return "Profiles"
+    return None
+
+
+def load_ig_from_package(source=None):
+    """
+    Streams the members of the package and sorts them into the IG folders.
+    The resourceType is taken from the .index.json of the folder,
+    only if the index was not read yet the resource itself is parsed.
+
+    :param source: Optional path or URL of package.tgz.
+    :return: Dictionary target folder -> number of saved files.
+    """
+    path = fetch_package(source or get_package_source())
+
+    indexes = {}  # folder -> {filename: resourceType}
+    counts = {"Profiles": 0, "Example_Instances": 0, "Test_Scripts": 0}
+    for target in counts:
+        os.makedirs(os.path.join("..", target), exist_ok=True)
+
+    with tarfile.open(path, "r|gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            folder, filename = posixpath.split(member.name)
+            if folder not in RESOURCE_FOLDERS or not filename.endswith(".json") or filename == "package.json":
+                continue
+
+            data = tar.extractfile(member).read()
+
+            if filename == ".index.json":
+                index = json.loads(data)
+                indexes[folder] = {entry.get("filename"): entry.get("resourceType") for entry in index.get("files", [])}
+                continue
+
+            resource_type = indexes.get(folder, {}).get(filename)
+            if resource_type is None:
+                try:
+                    resource_type = json.loads(data).get("resourceType")
+                except ValueError:
+                    print(f"Skipping invalid JSON in package: {member.name}")
+                    continue
+
+            target = classify(folder, resource_type)
+            if target is None:
+                continue
+
+            with open(os.path.join("..", target, filename), "wb") as f:
+                f.write(data)
+            counts[target] += 1
+
+    for target, count in counts.items():
+        print(f"{count} files saved to ../{target}")
+    return counts
+
+
+if __name__ == "__main__":
+    load_ig_from_package()
@@ -1,11 +1,23 @@
+# Lifecycle states of a fixture
+PENDING = "pending"     # registered, not created on the server yet
+CREATED = "created"     # exists on the server
+IN_USE = "in-use"       # used by an operation of a test
+DELETED = "deleted"     # removed in the teardown
+RELEASED = "released"   # shared fixture no longer used by this TestScript, deleted at the end of the run
+
 class Fixture:
 
-    def __init__(self, fixture_id,source_id ,  autodelete, type,  server_id = ""):
+    __slots__ = ("fixture_id", "server_id", "source_id", "autodelete", "type", "resource", "shared", "state")
+
+    def __init__(self, fixture_id,source_id ,  autodelete, type,  server_id = "", resource = None):
         self.fixture_id = fixture_id     # z.B. "HL7ATCorePatientCreateTestExample"
         self.server_id = server_id           # its own local identifier
         self.source_id = source_id                #filled after Server gets initial bundle
         self.autodelete = autodelete                # should it be deleted?
         self.type = type                # for deletion
+        self.resource = resource        # content of the fixture, for sourceId and minimumId
+        self.shared = None              # SharedFixture if it is shared with other TestScripts
+        self.state = CREATED if server_id else PENDING
 
     def __repr__(self):
-        return f"Fixture(example={self.fixture_id}, source={self.source_id}, server={self.server_id})"
+        return f"Fixture(example={self.fixture_id}, source={self.source_id}, server={self.server_id}, state={self.state})"
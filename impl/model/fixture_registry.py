@@ -0,0 +1,79 @@
+from impl.model.fixture import CREATED, DELETED, IN_USE, RELEASED
+
+
+class FixtureRegistry:
+    """
+    Fixtures of one TestScript run with constant-time lookups by
+    fixture id (id of the example instance), source id (TestScript fixture id),
+    server id and resource type.
+    """
+
+    def __init__(self):
+        self._fixtures = []                 # in registration order
+        self._by_fixture_id = {}            # example instance id -> Fixture
+        self._by_source_id = {}             # TestScript fixture id -> Fixture
+        self._by_server_id = {}             # (resource type, server id) -> Fixture
+        self._by_type = {}                  # resource type -> list of Fixtures
+
+    def add(self, fixture):
+        """Registers a fixture, in state pending unless it already has a server id."""
+        self._fixtures.append(fixture)
+        self._by_fixture_id[fixture.fixture_id] = fixture
+        self._by_source_id[fixture.source_id] = fixture
+        self._by_type.setdefault(fixture.type, []).append(fixture)
+        if fixture.server_id:
+            self._by_server_id[(fixture.type, fixture.server_id)] = fixture
+        return fixture
+
+    def get_by_fixture_id(self, fixture_id):
+        return self._by_fixture_id.get(fixture_id)
+
+    def get_by_source_id(self, source_id):
+        return self._by_source_id.get(source_id)
+
+    def get_by_server_id(self, resource_type, server_id):
+        return self._by_server_id.get((resource_type, server_id))
+
+    def get_by_type(self, resource_type):
+        return self._by_type.get(resource_type, [])
+
+    def mark_created(self, fixture, server_id):
+        """Stores the server id of a fixture that exists on the server."""
+        if fixture.server_id:
+            self._by_server_id.pop((fixture.type, fixture.server_id), None)
+        fixture.server_id = server_id
+        fixture.state = CREATED
+        self._by_server_id[(fixture.type, server_id)] = fixture
+
+    def mark_in_use(self, fixture):
+        if fixture.state == CREATED:
+            fixture.state = IN_USE
+
+    def mark_deleted(self, fixture):
+        """Marks a fixture as removed, it can no longer be found by its server id."""
+        self._by_server_id.pop((fixture.type, fixture.server_id), None)
+        fixture.state = DELETED
+
+    def mark_released(self, fixture):
+        """Marks a shared fixture as released by this TestScript, it still exists on the server."""
+        fixture.state = RELEASED
+
+    def pending_deletes(self):
+        """
+        :return: Fixtures of this TestScript that exist on the server and have autodelete set.
+        """
+        return [fixture for fixture in self._fixtures
+                if fixture.autodelete and fixture.shared is None and fixture.server_id and fixture.state != DELETED]
+
+    def clear(self):
+        self._fixtures.clear()
+        self._by_fixture_id.clear()
+        self._by_source_id.clear()
+        self._by_server_id.clear()
+        self._by_type.clear()
+
+    def __iter__(self):
+        return iter(self._fixtures)
+
+    def __len__(self):
+        return len(self._fixtures)
@@ -0,0 +1,334 @@
+"""
+Benchmarks the overhead of the test script evaluator against a local FHIR stand-in.
+The stand-in runs in-process (see fhir_stand_in.py) with an optional injected latency,
+so the timings show the cost of the runner itself and not the network.
+Every case runs with synthetic IGs of increasing size and reports throughput,
+latency percentiles and peak memory, and is compared with a stored baseline.
+
+Usage (from impl/test_script_evaluator):
+    python benchmark.py [--config path/to/config.json] [--sizes 10 100 1000]
+                        [--cases bundle profiles save_fixtures testscript]
+                        [--latency-ms 0] [--repeat 5] [--save-baseline]
+
+The defaults are read from "benchmark" in config.json, e.g.
+    "benchmark": {"sizes": [10, 100, 1000], "latencyMs": 0, "jitterMs": 0, "repeat": 5,
+                  "tolerance": 0.25, "baseline": "benchmark_baseline.json"}
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from configuration_manager import get_config_manager
+from execution_context import ExecutionContext
+from fhir_stand_in import FhirStandIn
+from log_writer import get_log_writer
+from profile_manager import ProfileManager, get_profile_manager
+from request_metrics import PERCENTILES, percentile
+from test_script_evaluator_log_to_file import run_testscript, save_fixtures, teardown_fixtures
+from impl.transactions.transactions import build_whole_transaction_bundle, encode_transaction_bundle
+from utils import BASE_DIR, RESULTS_DIR, flush_log, set_log_file, timestamp
+
+DEFAULT_SETTINGS = {
+    "sizes": [10, 100, 1000],
+    "latencyMs": 0,             # latency of every response of the stand-in
+    "jitterMs": 0,              # random latency added on top
+    "repeat": 5,                # timed iterations per case and size
+    "tolerance": 0.25,          # allowed slowdown against the baseline, 0.25 = 25 %
+    "baseline": "benchmark_baseline.json",  # relative to impl/
+}
+
+PROFILE_URL = "http://example.org/fhir/StructureDefinition/benchmark-patient"
+
+
+# --- synthetic IG ---
+
+def make_resources(size):
+    """
+    :param size: Number of resources.
+    :return: Patients and Observations referencing them, half of each.
+    """
+    resources = []
+    for index in range(size):
+        if index % 2 == 0:
+            resources.append({
+                "resourceType": "Patient", "id": f"bench-patient-{index}",
+                "name": [{"family": f"Muster{index}", "given": ["Max", "Moritz"]}],
+                "gender": "male", "birthDate": "1970-01-01",
+            })
+        else:
+            resources.append({
+                "resourceType": "Observation", "id": f"bench-observation-{index}", "status": "final",
+                "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+                "subject": {"reference": f"Patient/bench-patient-{index - 1}"},
+                "valueQuantity": {"value": 60 + index % 40, "unit": "/min"},
+            })
+    return resources
+
+
+def make_structure_definition(index):
+    """
+    :param index: Number of the profile, profile 0 has the canonical PROFILE_URL.
+    :return: StructureDefinition constraining Patient.
+    """
+    suffix = "" if index == 0 else f"-{index}"
+    elements = [
+        {"id": "Patient", "path": "Patient", "min": 0, "max": "*"},
+        {"id": "Patient.id", "path": "Patient.id", "min": 0, "max": "1",
+         "type": [{"code": "http://hl7.org/fhirpath/System.String"}]},
+        {"id": "Patient.name", "path": "Patient.name", "min": 1, "max": "*", "type": [{"code": "HumanName"}]},
+        {"id": "Patient.name.family", "path": "Patient.name.family", "min": 1, "max": "1", "type": [{"code": "string"}]},
+        {"id": "Patient.gender", "path": "Patient.gender", "min": 0, "max": "1", "type": [{"code": "code"}]},
+        {"id": "Patient.birthDate", "path": "Patient.birthDate", "min": 0, "max": "1", "type": [{"code": "date"}]},
+    ]
+    return {
+        "resourceType": "StructureDefinition", "id": f"benchmark-patient{suffix}", "url": PROFILE_URL + suffix,
+        "version": "1.0.0", "type": "Patient", "kind": "resource", "derivation": "constraint",
+        "baseDefinition": "http://hl7.org/fhir/StructureDefinition/Patient",
+        "snapshot": {"element": elements},
+    }
+
+
+def write_profiles(folder, size):
+    """Writes size StructureDefinitions into folder."""
+    for index in range(size):
+        with open(os.path.join(folder, f"StructureDefinition-benchmark-{index}.json"), "w", encoding="utf-8") as f:
+            json.dump(make_structure_definition(index), f)
+
+
+def make_testscript(size):
+    """
+    :param size: Number of tests.
+    :return: Tuple (TestScript, example instances) with one fixture and size tests,
+             each test creates a Patient, searches and asserts on both responses.
+    """
+    def operation(code, **fields):
+        return {"operation": dict({"type": {"code": code}, "resource": "Patient", "accept": "json",
+                                   "contentType": "json"}, **fields)}
+
+    def assertion(**fields):
+        return {"assert": dict({"direction": "response", "warningOnly": False}, **fields)}
+
+    tests = []
+    for index in range(size):
+        tests.append({"name": f"Benchmark{index}", "action": [
+            operation("create"),
+            assertion(responseCode="201"),
+            assertion(validateProfileId="benchmark-profile"),
+            assertion(expression="Patient.name.family.exists()"),
+            operation("search", params="?_count=10"),
+            assertion(responseCode="200"),
+            assertion(expression="Bundle.entry.count() <= 10"),
+        ]})
+    testscript = {
+        "resourceType": "TestScript", "id": "benchmark", "name": "Benchmark",
+        "profile": [{"id": "benchmark-profile", "reference": PROFILE_URL}],
+        "fixture": [{"id": "benchmark-patient", "autocreate": True, "autodelete": True,
+                     "resource": {"reference": "Patient-bench-patient-0.html"}}],
+        "test": tests,
+    }
+    return testscript, make_resources(1)
+
+
+# --- cases ---
+# Every case gets the size and the benchmark environment and returns a callable
+# running one iteration and the number of items handled per iteration.
+
+def case_bundle(size, env):
+    resources = make_resources(size)
+
+    def run():
+        build_whole_transaction_bundle(resources)
+        encode_transaction_bundle(resources, gzip_min_bytes=env["gzipMinBytes"])
+    return run, size
+
+
+def case_profiles(size, env):
+    folder = tempfile.mkdtemp(dir=env["tmp"])
+    write_profiles(folder, size)
+    index_path = os.path.join(folder, ".profile_index.json")
+
+    def run():
+        # Cold start, the index is written again in every iteration
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        ProfileManager().make_profile_list(folder)
+    return run, size
+
+
+def case_save_fixtures(size, env):
+    resources = make_resources(size)
+    fixtures = [{"id": f"fixture-{index}", "autocreate": True, "autodelete": True} for index in range(size)]
+    # Private fixtures, so every iteration creates and deletes all of them
+    modified_ids = frozenset(fixture["id"] for fixture in fixtures)
+
+    def run():
+        context = ExecutionContext(env["config_manager"])
+        try:
+            save_fixtures(context, resources, fixtures, modified_ids)
+        finally:
+            teardown_fixtures(context)
+            context.reset()
+    return run, size
+
+
+def case_testscript(size, env):
+    testscript, resources = make_testscript(size)
+
+    def run():
+        run_testscript(ExecutionContext(env["config_manager"]), testscript, resources)
+    return run, size
+
+
+CASES = {
+    "bundle": case_bundle,
+    "profiles": case_profiles,
+    "save_fixtures": case_save_fixtures,
+    "testscript": case_testscript,
+}
+
+
+# --- measurement ---
+
+def measure(run, items, repeat):
+    """
+    Runs one iteration to warm up, repeat timed iterations and one traced iteration for the peak memory.
+
+    :return: Result dictionary with throughput, latency percentiles and peak memory.
+    """
+    run()
+    durations = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {f"p{percent}Ms": percentile(durations, percent) * 1000 for percent in PERCENTILES}
+    result["throughput"] = items * len(durations) / sum(durations)
+    result["peakKb"] = peak / 1024
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the median latency and the peak memory with the baseline.
+
+    :param results: Dictionary "case/size" -> result.
+    :param baseline: Dictionary "case/size" -> result of the baseline run.
+    :param tolerance: Allowed increase, 0.25 = 25 %.
+    :return: List of regression messages.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in ("p50Ms", "peakKb"):
+            if base.get(metric) and result[metric] > base[metric] * (1 + tolerance):
+                change = (result[metric] / base[metric] - 1) * 100
+                regressions.append(f"{key}: {metric} {result[metric]:.1f} (baseline {base[metric]:.1f}, +{change:.0f} %)")
+    return regressions
+
+
+def benchmark_config(config, base_url):
+    """
+    :return: Copy of the configuration that sends all traffic to the stand-in.
+    """
+    config = dict(config or {})
+    config.update({"fhirServer": base_url, "log_format": None, "testConcurrency": 1, "searchPageLimit": 1})
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the test script evaluator against a local FHIR stand-in.")
+    parser.add_argument("--config", default=None, help="Path to config.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None, help="Sizes of the synthetic IGs")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=None, help="Cases to run, default all")
+    parser.add_argument("--latency-ms", type=float, default=None, help="Latency of every stand-in response")
+    parser.add_argument("--jitter-ms", type=float, default=None, help="Random latency added on top")
+    parser.add_argument("--repeat", type=int, default=None, help="Timed iterations per case and size")
+    parser.add_argument("--baseline", default=None, help="Baseline file, relative to impl/")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as new baseline")
+    args = parser.parse_args(argv)
+
+    config_manager = get_config_manager(args.config)
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config_manager.benchmark)
+    sizes = args.sizes or settings["sizes"]
+    latency_ms = settings["latencyMs"] if args.latency_ms is None else args.latency_ms
+    jitter_ms = settings["jitterMs"] if args.jitter_ms is None else args.jitter_ms
+    repeat = args.repeat or settings["repeat"]
+    baseline_path = BASE_DIR / (args.baseline or settings["baseline"])
+
+    # The runner logs into its own file, without echo on the console
+    get_log_writer().echo = False
+    set_log_file(f"benchmark_{timestamp}.txt")
+
+    results = {}
+    with FhirStandIn(latency_ms, jitter_ms) as stand_in, tempfile.TemporaryDirectory() as tmp:
+        config_manager.config = benchmark_config(config_manager.config, stand_in.base_url)
+        profiles_folder = os.path.join(tmp, "Profiles")
+        os.mkdir(profiles_folder)
+        write_profiles(profiles_folder, 1)
+        get_profile_manager(profiles_folder)
+
+        env = {
+            "config_manager": config_manager,
+            "gzipMinBytes": config_manager.http.get("gzipMinBytes"),
+            "tmp": tmp,
+        }
+        print(f"FHIR stand-in at {stand_in.base_url}, latency {latency_ms} ms (+{jitter_ms} ms jitter), {repeat} iterations")
+        for case in args.cases or CASES:
+            for size in sizes:
+                run, items = CASES[case](size, env)
+                result = measure(run, items, repeat)
+                results[f"{case}/{size}"] = result
+                print(f"{case:>14}/{size:<6} {result['throughput']:>10.1f} items/s  "
+                      + "  ".join(f"p{percent} {result[f'p{percent}Ms']:8.2f} ms" for percent in PERCENTILES)
+                      + f"  peak {result['peakKb']:9.1f} KiB")
+        print(f"{stand_in.requests} requests to the stand-in")
+    flush_log(wait=True)
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    report = {"latencyMs": latency_ms, "jitterMs": jitter_ms, "repeat": repeat, "results": results}
+    with open(RESULTS_DIR / f"benchmark_{timestamp}.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    try:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {baseline_path}, store one with --save-baseline")
+        return 0
+
+    if (baseline.get("latencyMs"), baseline.get("jitterMs")) != (latency_ms, jitter_ms):
+        print("⚠ The baseline was measured with a different latency")
+    regressions = compare(results, baseline.get("results", {}), settings["tolerance"])
+    for message in regressions:
+        print(f"✗ {message}")
+    if not regressions:
+        print(f"✓ No regression against {baseline_path} (tolerance {settings['tolerance']:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,310 @@
+"""
+Recording and replay of the HTTP exchanges with the FHIR server (cassettes).
+In "record" mode every exchange of the run (operations, fixture bundles, teardown)
+is stored in the cassette folder, one file per normalized request.
+In "replay" mode the recorded responses are served locally and no request reaches
+the server, so a run finishes in seconds.
+
+Server IDs are replaced by stable aliases while recording, derived from the request
+that created the resource. Cassettes therefore do not depend on the IDs the server
+happened to assign, and replayed runs use the aliases consistently in URLs and bodies.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from http_timing import TimedHTTPAdapter
+
+CASSETTE_MODES = ("off", "record", "replay")
+DEFAULT_CASSETTE_DIR = "Cassettes"  # relative to impl/
+
+# Request headers that change the response, all others are ignored for the key
+KEY_HEADERS = ("accept", "content-type", "prefer")
+
+# Response headers that are not stored, the body is stored decoded
+SKIPPED_RESPONSE_HEADERS = frozenset(["content-length", "content-encoding", "transfer-encoding", "date", "connection"])
+
+# "Type/id" in references, URLs and Location headers
+REFERENCE_PATTERN = re.compile(r"(?<![A-Za-z0-9])([A-Z][A-Za-z]+)/([A-Za-z0-9\-.]{1,64})(?![A-Za-z0-9\-.])")
+LOCATION_PATTERN = re.compile(r"([A-Z][A-Za-z]+)/([A-Za-z0-9\-.]{1,64})(?:/_history/[^/]+)?/?$")
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def _decode_body(request):
+    body = request.body
+    if not body:
+        return None
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if request.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode("utf-8", errors="replace")
+
+
+def _normalize_uuids(text):
+    """Replaces random UUIDs (e.g. urn:uuid fullUrls) by their order of appearance."""
+    seen = {}
+    return UUID_PATTERN.sub(lambda match: seen.setdefault(match.group(0), f"uuid-{len(seen) + 1}"), text)
+
+
+class _IdAliases:
+    """
+    Maps server IDs to the aliases stored in the cassettes.
+
+    Attributes:
+        aliases (dict): (resource type, server id) -> alias
+    """
+
+    def __init__(self):
+        self.aliases = {}
+        self._lock = threading.Lock()
+
+    def add(self, resource_type, server_id, seed):
+        """Registers a server ID, the alias is derived from seed (request key and position)."""
+        with self._lock:
+            self.aliases.setdefault((resource_type, server_id), "rec-" + hashlib.sha256(seed.encode("utf-8")).hexdigest()[:16])
+
+    def _rewrite_text(self, text):
+        parts = []
+        position = 0
+        match = REFERENCE_PATTERN.search(text)
+        while match:
+            alias = self.aliases.get((match.group(1), match.group(2)))
+            parts.append(text[position:match.start(2)])
+            if alias:
+                parts.append(alias)
+                position = match.end()
+            else:
+                # The id may be the type of the next pair, e.g. ".../FHIR/Patient/123"
+                position = match.start(2)
+            match = REFERENCE_PATTERN.search(text, position)
+        parts.append(text[position:])
+        return "".join(parts)
+
+    def rewrite(self, value):
+        """
+        :param value: Parsed JSON, string or None.
+        :return: Copy of value with all known server IDs replaced by their alias.
+        """
+        if not self.aliases:
+            return value
+        if isinstance(value, str):
+            return self._rewrite_text(value)
+        if isinstance(value, list):
+            return [self.rewrite(item) for item in value]
+        if isinstance(value, dict):
+            copy = {key: self.rewrite(item) for key, item in value.items()}
+            alias = self.aliases.get((value.get("resourceType"), value.get("id")))
+            if alias:
+                copy["id"] = alias
+            return copy
+        return value
+
+
+def request_key(request, aliases=None):
+    """
+    Normalizes a request: method, path and sorted query without host,
+    the headers that change the response and the canonical JSON body.
+
+    :param request: requests.PreparedRequest.
+    :param aliases: Optional _IdAliases applied to URL and body.
+    :return: Tuple (key, normalized request dictionary).
+    """
+    url = urlsplit(request.url)
+    path = url.path + ("?" + urlencode(sorted(parse_qsl(url.query, keep_blank_values=True))) if url.query else "")
+    body = _decode_body(request)
+    if aliases is not None:
+        path, body = aliases.rewrite(path), aliases.rewrite(body)
+    normalized = {
+        "method": request.method.upper(),
+        "url": path,
+        "headers": {name: request.headers[name] for name in KEY_HEADERS if name in request.headers},
+        "body": body,
+    }
+    canonical = _normalize_uuids(json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), normalized
+
+
+class Cassette:
+    """
+    Folder of recorded exchanges, one JSON file per normalized request
+    with the responses in the order they were received.
+
+    Attributes:
+        path (Path): Folder of the cassette files
+        entries (dict): Request key -> {"request": ..., "responses": [...]}
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def _file(self, key, method):
+        return self.path / f"{method.lower()}-{key[:24]}.json"
+
+    def load(self):
+        """Loads all cassette files of the folder."""
+        for file in sorted(self.path.glob("*.json")):
+            with open(file, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            self.entries[entry["key"]] = entry
+
+    def append(self, key, request, response):
+        """Stores a response, replacing what earlier recordings stored for this request."""
+        with self._lock:
+            entry = self.entries.setdefault(key, {"key": key, "request": request, "responses": []})
+            entry["responses"].append(response)
+
+            file = self._file(key, request["method"])
+            # Written to a temporary file first, worker processes may record the same request
+            tmp_file = file.with_name(f"{file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, file)
+
+
+class RecordingAdapter(TimedHTTPAdapter):
+    """
+    Pooled adapter that sends every request to the server and records the exchange.
+
+    Attributes:
+        cassette (Cassette): Cassette the exchanges are recorded into
+        aliases (_IdAliases): Server IDs assigned during the run
+    """
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.aliases = _IdAliases()
+        self._counts = {}  # request key -> number of recorded responses
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        key, normalized = request_key(request, self.aliases)
+        with self._lock:
+            occurrence = self._counts.get(key, 0)
+            self._counts[key] = occurrence + 1
+
+        body = _decode_response(response)
+        if request.method.upper() == "POST":
+            self._register_created(response, body, f"{key}:{occurrence}")
+
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in SKIPPED_RESPONSE_HEADERS}
+        self.cassette.append(key, normalized, {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": self.aliases.rewrite(headers),
+            "body": self.aliases.rewrite(body),
+        })
+        return response
+
+    def _register_created(self, response, body, seed):
+        """Registers the server IDs of created resources: Location header, body and bundle entries."""
+        locations = [response.headers.get("Location", "")]
+        if isinstance(body, dict):
+            if body.get("resourceType") and body.get("id") and response.status_code == 201:
+                self.aliases.add(body["resourceType"], body["id"], seed)
+            for entry in body.get("entry", []) if body.get("resourceType") == "Bundle" else []:
+                locations.append(entry.get("response", {}).get("location", ""))
+        for index, location in enumerate(locations):
+            match = LOCATION_PATTERN.search(urlsplit(location).path)
+            if match:
+                self.aliases.add(match.group(1), match.group(2), f"{seed}:{index}")
+
+
+def _decode_response(response):
+    if not response.content:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Adapter that answers every request from the cassette without network access.
+    Repeated requests get the recorded responses in order, the last one is repeated.
+
+    Attributes:
+        cassette (Cassette): Cassette the responses are served from
+    """
+
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+        self._counts = {}  # request key -> number of served responses
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        key, normalized = request_key(request)
+        entry = self.cassette.entries.get(key)
+        if entry is None:
+            raise requests.ConnectionError(
+                f"No recorded response for {normalized['method']} {normalized['url']} in {self.cassette.path}",
+                request=request,
+            )
+        with self._lock:
+            occurrence = self._counts.get(key, 0)
+            self._counts[key] = occurrence + 1
+        recorded = entry["responses"][min(occurrence, len(entry["responses"]) - 1)]
+
+        body = recorded["body"]
+        if body is None:
+            content = b""
+        elif isinstance(body, str):
+            content = body.encode("utf-8")
+        else:
+            content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded["reason"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response.headers["Content-Length"] = str(len(content))
+        response._content = content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(0)
+        return response
+
+    def close(self):
+        pass
+
+
+def create_adapter(settings, base_dir, **kwargs):
+    """
+    Creates the transport adapter of the HTTP client for the cassette settings.
+
+    :param settings: "cassette" section of config.json ({"mode": ..., "dir": ...}).
+    :param base_dir: Folder relative cassette folders are resolved against.
+    :param kwargs: Pool and retry arguments of HTTPAdapter.
+    :return: TimedHTTPAdapter, RecordingAdapter or ReplayAdapter.
+    """
+    mode = str((settings or {}).get("mode", "off")).lower()
+    if mode not in CASSETTE_MODES or mode == "off":
+        return TimedHTTPAdapter(**kwargs)
+
+    cassette = Cassette(Path(base_dir) / settings.get("dir", DEFAULT_CASSETTE_DIR))
+    if mode == "record":
+        return RecordingAdapter(cassette, **kwargs)
+    cassette.load()
+    return ReplayAdapter(cassette)
@@ -0,0 +1,143 @@
+"""
+Adaptive limit for the number of concurrent requests to the FHIR server (AIMD).
+Every successful response raises the limit additively (about +1 per round trip),
+a throttled response (429, 503) or a rising latency halves it.
+Retry-After pauses all requests of the process until the given time, afterwards
+the limit grows again, so the runner finds the rate the server allows by itself.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+DEFAULT_LIMITER_SETTINGS = {
+    "enabled": True,
+    "initialLimit": 8,          # concurrent requests at the start
+    "minLimit": 1,
+    "maxLimit": 64,
+    "decreaseFactor": 0.5,      # multiplicative decrease on throttling or rising latency
+    "latencyTolerance": 2.0,    # decrease when the smoothed latency exceeds the baseline by this factor
+    "maxRetryAfter": 120,       # seconds, longer Retry-After values are capped
+}
+
+# Latency increases below this many seconds are treated as noise
+LATENCY_SLACK = 0.02
+
+# Minimum seconds between two decreases, a burst of throttled responses reports one overload
+MIN_DECREASE_INTERVAL = 0.1
+
+
+def parse_retry_after(value, max_seconds=None):
+    """
+    :param value: Value of the Retry-After header, seconds or an HTTP date.
+    :param max_seconds: Optional upper bound.
+    :return: Seconds to wait or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    seconds = max(0.0, seconds)
+    return min(seconds, max_seconds) if max_seconds is not None else seconds
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limiter in front of all requests of a process.
+
+    Attributes:
+        limit (float): Current limit of concurrent requests
+        in_flight (int): Requests currently sent
+        throttles (int): Number of throttled responses so far
+        latencies (dict): Operation -> [baseline, smoothed] latency in seconds. The baseline is the lowest
+            recent latency and drifts up slowly, operations are kept apart since e.g. a transaction
+            bundle is always slower than a read
+    """
+
+    def __init__(self, settings=None):
+        """
+        :param settings: Optional "adaptiveConcurrency" section of the http settings.
+        """
+        self.settings = dict(DEFAULT_LIMITER_SETTINGS)
+        self.settings.update(settings or {})
+        self.min_limit = max(1, self.settings["minLimit"])
+        self.max_limit = max(self.min_limit, self.settings["maxLimit"])
+        self.limit = float(min(max(self.settings["initialLimit"], self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.throttles = 0
+        self.latencies = {}
+        self._pause_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Waits until a request may be sent: no Retry-After pause and fewer requests in flight than the limit.
+
+        :return: Current limit (int) when the request is sent.
+        """
+        with self._condition:
+            while True:
+                pause = self._pause_until - time.perf_counter()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return int(self.limit)
+                else:
+                    self._condition.wait()
+
+    def release(self, latency=None, throttled=False, retry_after=None, operation=None):
+        """
+        Ends a request and adapts the limit.
+
+        :param latency: Seconds until the response headers arrived, None if the request failed.
+        :param throttled: The server answered 429 or 503.
+        :param retry_after: Seconds from the Retry-After header or None.
+        :param operation: Label of the request, latencies are compared per operation.
+        :return: Tuple (limit before, limit after).
+        """
+        with self._condition:
+            before = int(self.limit)
+            self.in_flight -= 1
+            now = time.perf_counter()
+            stats = self.latencies.get(operation)
+            if throttled:
+                self.throttles += 1
+                self._decrease(now, stats[1] if stats else 0)
+                if retry_after:
+                    self._pause_until = max(self._pause_until, now + retry_after)
+            elif latency is not None:
+                if stats is None:
+                    stats = self.latencies[operation] = [latency, latency]
+                # The baseline follows lower latencies at once and higher ones slowly, so it recovers after a change
+                stats[0] = min(latency, stats[0] + 0.01 * (latency - stats[0]))
+                stats[1] = 0.8 * stats[1] + 0.2 * latency
+                baseline, smoothed = stats
+                if smoothed > max(baseline * self.settings["latencyTolerance"], baseline + LATENCY_SLACK):
+                    self._decrease(now, smoothed)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            return before, int(self.limit)
+
+    def _decrease(self, now, round_trip):
+        # At most one decrease per round trip, the responses of one window report the same overload
+        if now - self._last_decrease < max(round_trip, MIN_DECREASE_INTERVAL):
+            return
+        self.limit = max(self.min_limit, self.limit * self.settings["decreaseFactor"])
+        self._last_decrease = now
+
+
+def create_limiter(settings):
+    """
+    :param settings: "adaptiveConcurrency" section of the http settings or None.
+    :return: AdaptiveConcurrencyLimiter or None if disabled.
+    """
+    limiter = AdaptiveConcurrencyLimiter(settings)
+    return limiter if limiter.settings["enabled"] else None
@@ -7,6 +7,9 @@ import os
 from pathlib import Path
 from utils import *
 
+# Modes of the verification of created resources, see ConfigManager.create_verification
+CREATE_VERIFICATION_MODES = ("representation", "get", "sample", "skip")
+
 class ConfigManager:
     """
     Manages configuration loading and provides access to configuration values.
@@ -94,6 +97,123 @@ class ConfigManager:
         """
         return self.config.get("testscripts", [])
 
+    @property
+    def http(self):
+        """
+        Gets the HTTP client settings (pool, timeouts, retries) from configuration.
+
+        :return: Dictionary with HTTP settings or empty dict if not configured.
+        """
+        return self.config.get("http", {})
+
+    @property
+    def cassette(self):
+        """
+        Gets the record/replay settings: "mode" ("off", "record" or "replay")
+        and "dir", the cassette folder relative to impl/.
+
+        :return: Dictionary with cassette settings or empty dict if not configured.
+        """
+        return self.config.get("cassette", {})
+
+    @property
+    def benchmark(self):
+        """
+        Gets the settings of benchmark.py (sizes, latency of the stand-in, baseline).
+
+        :return: Dictionary with benchmark settings or empty dict if not configured.
+        """
+        return self.config.get("benchmark", {})
+
+    @property
+    def load(self):
+        """
+        Gets the settings of load_generator.py (concurrency or rate, duration or iterations).
+
+        :return: Dictionary with load settings or empty dict if not configured.
+        """
+        return self.config.get("load", {})
+
+    @property
+    def run_state(self):
+        """
+        Gets the settings of incremental runs: "mode" ("all" or "changed-only")
+        and "file", the run state file relative to impl/.
+
+        :return: Dictionary with run state settings or empty dict if not configured.
+        """
+        return self.config.get("runState", {})
+
+    @property
+    def workers(self):
+        """
+        Gets the number of worker processes for the parallel runner.
+
+        :return: Number of workers or None to use the number of CPUs.
+        """
+        return self.config.get("workers")
+
+    @property
+    def test_concurrency(self):
+        """
+        Gets the number of tests of one TestScript that may run at the same time.
+
+        :return: Maximum number of concurrent tests, 1 runs them strictly in order.
+        """
+        return max(1, int(self.config.get("testConcurrency", 1)))
+
+    @property
+    def create_verification(self):
+        """
+        Gets how created resources are verified.
+        "representation" checks the body returned with Prefer: return=representation,
+        "get" reads every created resource again, "sample" only verifies a share of them
+        (createVerificationSampleRate), "skip" does not verify.
+
+        :return: Verification mode, "representation" if not configured.
+        """
+        mode = str(self.config.get("createVerification", "representation")).lower()
+        return mode if mode in CREATE_VERIFICATION_MODES else "representation"
+
+    @property
+    def create_verification_sample_rate(self):
+        """
+        Gets the share of created resources verified in "sample" mode.
+
+        :return: Rate between 0 and 1, default 0.1.
+        """
+        return min(1.0, max(0.0, float(self.config.get("createVerificationSampleRate", 0.1))))
+
+    @property
+    def search_page_size(self):
+        """
+        Gets the number of entries requested per page (_count) for search and history operations.
+
+        :return: Page size or None to use the default of the server.
+        """
+        page_size = self.config.get("searchPageSize")
+        return max(1, int(page_size)) if page_size else None
+
+    @property
+    def search_page_limit(self):
+        """
+        Gets the maximum number of pages read per search or history operation.
+
+        :return: Page limit or None to read all pages.
+        """
+        page_limit = self.config.get("searchPageLimit")
+        return max(1, int(page_limit)) if page_limit else None
+
+    @property
+    def report_format(self):
+        """
+        Gets the format of the report rendered after the run.
+
+        :return: "txt", "html", "pdf" or None if no report should be rendered.
+        """
+        value = self.config.get("log_format")
+        return value.lower() if value else None
+
     def get(self, key, default=None):
         """
         Gets a configuration value by key.
@@ -112,8 +232,12 @@ class ConfigManager:
         """
         return bool(self.fhir_server and self.fhir_server.strip())
 
-    def get_testscripts_from_config(self):
+    def get_testscript_paths(self):
+        """
+        Lists the TestScripts of the run without loading them.
 
+        :return: List of TestScript paths relative to impl/.
+        """
         TESTSCRIPT_FOLDER = "../Test_Scripts"
 
         # Testscripts aus der Config ODER Ordner
@@ -123,22 +247,41 @@ class ConfigManager:
         if not testscripts:
             testscripts = [
                 os.path.join(TESTSCRIPT_FOLDER, name).replace("\\", "/")
-                for name in os.listdir(TESTSCRIPT_FOLDER)
-                if name.endswith(".json")
+                for name in sorted(os.listdir(TESTSCRIPT_FOLDER))
+                if name.endswith(".json") and not name.startswith(".")  # skips the download manifest
             ]
 
-        result = []
+        return [ts_path.replace("../", "") for ts_path in testscripts]
+
+    @staticmethod
+    def get_fixture_paths(testscript):
+        """
+        Resolves the example instances referenced by the fixtures of a TestScript.
 
-        for ts_path in testscripts:
+        :param testscript: The loaded TestScript.
+        :return: List of example instance paths relative to impl/.
+        """
+        fixture_list = []
 
-            # Testscript laden
-            with open(ts_path, "r", encoding="utf-8") as ts_file:
-                testscript = json.load(ts_file)
+        for fixture in get_fixture(testscript):
+            fixture_ref = fixture.get("resource", {}).get("reference")
+            if fixture_ref:
+                filename = os.path.splitext(os.path.basename(fixture_ref))[0] + ".json"
+                fixture_path = f"Example_Instances/{filename}".replace("\\", "/")
+                fixture_list.append(fixture_path)
 
-            try:
-                with open(ts_path, "r", encoding="utf-8") as ts_file:
-                    testscript = json.load(ts_file)
+        return fixture_list
+
+    def get_testscripts_from_config(self):
 
+        result = []
+
+        for ts_path_clean in self.get_testscript_paths():
+            ts_path = BASE_DIR / ts_path_clean
+
+            # Testscript laden, unveränderte Dateien kommen aus dem Parse-Cache
+            try:
+                testscript = get_parse_cache().load(ts_path)
 
             except json.decoder.JSONDecodeError as e:
 
@@ -152,19 +295,9 @@ class ConfigManager:
                 # in dein Log schreiben
 
                 log_to_file(message)
+                continue
 
-            fixtures_raw = get_fixture(testscript)
-            fixture_list = []
-
-            for fixture in fixtures_raw:
-                fixture_ref = fixture.get("resource", {}).get("reference")
-                if fixture_ref:
-                    filename = os.path.splitext(os.path.basename(fixture_ref))[0] + ".json"
-                    fixture_path = f"Example_Instances/{filename}".replace("\\", "/")
-                    fixture_list.append(fixture_path)
-
-            ts_path_clean = ts_path.replace("../", "")
-            result.append((ts_path_clean, fixture_list))
+            result.append((ts_path_clean, self.get_fixture_paths(testscript)))
 
         return result
 
@@ -199,6 +332,16 @@ def get_testscript_pairs():
     return get_config_manager().get_testscripts_from_config()
 
 
+def get_testscript_paths():
+    """Convenience function to get the testscript paths without loading them."""
+    return get_config_manager().get_testscript_paths()
+
+
 def has_fhir_server():
     """Convenience function to check if FHIR server is configured."""
     return get_config_manager().has_fhir_server()
+
+
+def get_http_settings():
+    """Convenience function to get the HTTP client settings."""
+    return get_config_manager().http
@@ -0,0 +1,76 @@
+"""
+Execution context for a single TestScript run.
+Holds all state that used to live in module globals, so several
+TestScripts can run side by side without overwriting each other.
+"""
+import threading
+
+from impl.model.fixture_registry import FixtureRegistry
+from configuration_manager import ConfigManager
+from http_client import get_http_client
+from utils import log_http_exchange, response_json
+
+
+class ExecutionContext:
+    """
+    Per-run state of the test script evaluator.
+
+    Attributes:
+        config_manager (ConfigManager): Configuration used for this run
+        fhir_server_base (str): Base URL of the FHIR server
+        http_client (FhirHttpClient): Client used for all server traffic
+        fixtures (FixtureRegistry): Fixtures of the current TestScript
+        profiles (dict): TestScript.profile id -> canonical URL of the current TestScript
+        responses (dict): responseId -> HTTP response of the operation
+        saved_resource_id (str): Server ID of the last created resource (per thread)
+    """
+
+    def __init__(self, config_manager=None, http_client=None):
+        """
+        Initializes the context.
+
+        :param config_manager: Optional ConfigManager. If None, config.json is loaded.
+        :param http_client: Optional FhirHttpClient. If None, the pooled client of this process is used.
+        """
+        self.config_manager = config_manager or ConfigManager()
+        self.fhir_server_base = self.config_manager.fhir_server
+        self.http_client = http_client or get_http_client(self.config_manager.http, self.config_manager.cassette)
+        self.http_client.add_observer(log_http_exchange)
+        self.fixtures = FixtureRegistry()
+        self.profiles = {}
+        self.responses = {}
+        self._local = threading.local()
+
+    @property
+    def saved_resource_id(self):
+        """
+        Server ID of the last resource created by the current thread.
+        Tests of one TestScript may run concurrently, so every thread keeps its own value.
+        """
+        return getattr(self._local, "saved_resource_id", "")
+
+    @saved_resource_id.setter
+    def saved_resource_id(self, value):
+        self._local.saved_resource_id = value
+
+    def get_source(self, source_id):
+        """
+        Returns the resource of a sourceId: the body of the response saved under
+        this responseId, otherwise the content of the fixture with this id.
+
+        :param source_id: responseId or fixture id.
+        :return: Resource dictionary or None.
+        """
+        if not source_id:
+            return None
+        if source_id in self.responses:
+            return response_json(self.responses[source_id])
+        fixture = self.fixtures.get_by_source_id(source_id)
+        return fixture.resource if fixture is not None else None
+
+    def reset(self):
+        """Clears the fixture state after a TestScript has finished."""
+        self.fixtures.clear()
+        self.profiles = {}
+        self.responses.clear()
+        self.saved_resource_id = ""
@@ -0,0 +1,265 @@
+"""
+Compiles a TestScript into an immutable execution plan.
+All parts of an action that do not depend on the server responses are resolved
+once: operations get their URL path and headers, assertions become closures with
+pre-parsed response codes and pre-compiled FHIRPath expressions, and every test knows
+its fixture bindings. The executor only walks the plan, so a plan can be run
+repeatedly (e.g. against several servers) and invalid TestScripts are rejected
+before any request is sent.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+from impl.exception.FhirPathError import FhirPathError
+from impl.exception.InvalidTestScriptError import InvalidTestScriptError
+from fhirpath import compile_expression
+from fixture_manager import modified_fixture_ids
+from paging import PageCheck, PagedResponse
+from utils import get_fixture, parse_fhir_header, response_json
+from validate import (
+    ASSERT_OPERATORS, parse_response_codes, validate_content_type, validate_expression,
+    validate_header_field, validate_minimum_id, validate_profile_assertion, validate_response_code,
+)
+
+# Operations the executor implements
+SUPPORTED_OPERATIONS = ("create", "update", "read", "search", "history")
+
+# Operations that work on an existing fixture of the test
+FIXTURE_OPERATIONS = ("update", "read")
+
+# Fields of operation and assert that reference a fixture or a response
+REFERENCE_FIELDS = ("sourceId", "targetId", "compareToSourceId", "minimumId")
+
+
+class OperationStep(namedtuple("OperationStep", "method resource_type path headers fixture_id response_id")):
+    """
+    Resolved operation of a test.
+
+    Attributes:
+        method (str): Operation code, e.g. "create"
+        resource_type (str): Resource type of the operation or None
+        path (str): URL relative to the server base, including search params,
+            "{id}" stands for the server id of the fixture
+        headers (MappingProxyType): Request headers
+        fixture_id (str): Fixture the operation works on (update, read, history) or None
+        response_id (str): responseId the response is saved under or None
+    """
+    __slots__ = ()
+
+
+class AssertionStep(namedtuple("AssertionStep", "checks stop_test_on_fail direction")):
+    """
+    Compiled assertion of a test.
+
+    Attributes:
+        checks (tuple): (kind, check) pairs, check(context, response, resource) raises AssertionError,
+            checks on the resource of a response are PageChecks
+        stop_test_on_fail (bool): Stop the test if a check fails
+        direction (str): "request" or "response"
+    """
+    __slots__ = ()
+
+
+class TestPlan(namedtuple("TestPlan", "name test_id steps fixture_keys")):
+    """
+    Compiled test of a TestScript.
+
+    Attributes:
+        name (str): Name of the test
+        test_id (str): First sourceId of the test, the fixture of update and read
+        steps (tuple): OperationStep and AssertionStep in action order
+        fixture_keys (frozenset): Fixture and response ids the test reads or writes
+    """
+    __slots__ = ()
+    __test__ = False  # not a pytest test class
+
+
+class ScriptPlan(namedtuple("ScriptPlan", "name fixtures modified_ids profiles tests")):
+    """
+    Compiled TestScript.
+
+    Attributes:
+        name (str): Name or id of the TestScript
+        fixtures (tuple): Fixture definitions of the TestScript
+        modified_ids (frozenset): Fixtures changed by the TestScript, never shared
+        profiles (MappingProxyType): TestScript.profile id -> canonical URL
+        tests (tuple): TestPlan per test in script order
+    """
+    __slots__ = ()
+
+
+def extract_test_source_id(test):
+    """
+    Returns the first sourceId of the operations of a test.
+    """
+    for action in test.get("action", []):
+        op = action.get("operation")
+        if op and "sourceId" in op:
+            return op["sourceId"]
+
+    return None
+
+
+def _compile_operation(operation, test_id, errors, where):
+    method = operation.get("type", {}).get("code", "").lower()
+    if method not in SUPPORTED_OPERATIONS:
+        errors.append(f"{where}: operation '{method}' is not supported")
+        return None
+
+    resource_type = operation.get("resource")
+    if method in ("create",) + FIXTURE_OPERATIONS and not resource_type:
+        errors.append(f"{where}: {method} needs a resource type")
+
+    if method in FIXTURE_OPERATIONS:
+        fixture_id = test_id
+    elif method == "history":
+        fixture_id = operation.get("targetId")
+    else:
+        fixture_id = None
+
+    # The server id of the fixture is only known when the test runs
+    path = resource_type or ""
+    if fixture_id:
+        path = f"{path}/{{id}}"
+    if method == "search":
+        path += operation.get("params", "")
+    elif method == "history":
+        path = f"{path}/_history{operation.get('params', '')}".lstrip("/")
+
+    headers = MappingProxyType({
+        "Content-Type": parse_fhir_header(operation.get("contentType")),
+        "Accept": parse_fhir_header(operation.get("accept")),
+    })
+    return OperationStep(method, resource_type, path, headers, fixture_id, operation.get("responseId"))
+
+
+def _source_getter(assertion):
+    """
+    Returns a function that selects the resource an expression, minimumId or profile is checked on:
+    the sourceId, the resource of the request or the body of the last response.
+    """
+    source_id = assertion.get("sourceId")
+    if source_id:
+        return lambda context, response, resource: context.get_source(source_id)
+    if assertion.get("direction") == "request":
+        return lambda context, response, resource: resource
+
+    def response_source(context, response, resource):
+        # Search results are evaluated page by page
+        return response if isinstance(response, PagedResponse) else response_json(response)
+    return response_source
+
+
+def _compile_assertion(assertion, errors, where):
+    checks = []
+    source = _source_getter(assertion)
+
+    if "validateProfileId" in assertion:
+        profile_id = assertion["validateProfileId"]
+        checks.append(("validateProfileId", PageCheck(
+            lambda context, resource: validate_profile_assertion(profile_id, resource, context.profiles), source)))
+
+    if ("expression" in assertion or "headerField" in assertion) and \
+            assertion.get("operator", "equals") not in ASSERT_OPERATORS:
+        errors.append(f"{where}: operator '{assertion['operator']}' is not supported")
+
+    if "expression" in assertion:
+        for field in ("expression", "compareToSourceExpression"):
+            if field in assertion:
+                try:
+                    compile_expression(assertion[field])
+                except FhirPathError as e:
+                    errors.append(f"{where}: invalid {field} '{assertion[field]}': {e}")
+        compare_id = assertion.get("compareToSourceId")
+        checks.append(("expression", PageCheck(
+            lambda context, resource: validate_expression(assertion, resource, context.get_source(compare_id)), source)))
+    elif "headerField" in assertion:
+        checks.append(("headerField", lambda context, response, resource: validate_header_field(assertion, response)))
+
+    if "minimumId" in assertion:
+        minimum_id = assertion["minimumId"]
+        checks.append(("minimumId", PageCheck(
+            lambda context, resource: validate_minimum_id(context.get_source(minimum_id), resource), source)))
+
+    if "contentType" in assertion:
+        content_type = assertion["contentType"]
+        checks.append(("contentType", lambda context, response, resource: validate_content_type(response, content_type)))
+    elif assertion.get("direction") == "response" and "responseCode" in assertion:
+        expected_codes = parse_response_codes(str(assertion["responseCode"]))
+        if not all(code.isdigit() and len(code) == 3 for code in expected_codes):
+            errors.append(f"{where}: invalid responseCode '{assertion['responseCode']}'")
+        checks.append(("responseCode", lambda context, response, resource: validate_response_code(expected_codes, response)))
+
+    return AssertionStep(tuple(checks), assertion.get("stopTestOnFail", False), assertion.get("direction"))
+
+
+def page_checks(steps):
+    """
+    :param steps: Steps of a test following an operation.
+    :return: PageChecks of the assertions up to the next operation.
+    """
+    checks = []
+    for step in steps:
+        if isinstance(step, OperationStep):
+            break
+        checks.extend(check for _, check in step.checks if isinstance(check, PageCheck))
+    return checks
+
+
+def _compile_test(test, fixture_ids, known_ids, errors):
+    name = test.get("name", "Unnamed Test")
+    test_id = extract_test_source_id(test) or ""
+    steps = []
+    fixture_keys = set()
+
+    for index, action in enumerate(test.get("action", [])):
+        where = f"test '{name}' action {index + 1}"
+        for step in (action.get("operation"), action.get("assert")):
+            if not step:
+                continue
+            for field in REFERENCE_FIELDS + ("responseId",):
+                if step.get(field):
+                    fixture_keys.add(step[field])
+            for field in REFERENCE_FIELDS:
+                if step.get(field) and step[field] not in known_ids:
+                    errors.append(f"{where}: {field} '{step[field]}' is neither a fixture nor a responseId")
+
+        if "operation" in action:
+            operation = _compile_operation(action["operation"], test_id, errors, where)
+            if operation is not None:
+                if operation.method in FIXTURE_OPERATIONS and operation.fixture_id not in fixture_ids:
+                    errors.append(f"{where}: {operation.method} needs a fixture as sourceId")
+                steps.append(operation)
+        elif "assert" in action:
+            steps.append(_compile_assertion(action["assert"], errors, where))
+
+    return TestPlan(name, test_id, tuple(steps), frozenset(fixture_keys))
+
+
+def compile_testscript(testscript):
+    """
+    Compiles a TestScript into an execution plan.
+
+    :param testscript: The TestScript resource.
+    :return: ScriptPlan.
+    :raises InvalidTestScriptError: With all problems found, before any request is sent.
+    """
+    name = testscript.get("name") or testscript.get("id", "Unnamed TestScript")
+    fixtures = tuple(get_fixture(testscript))
+
+    # Ids that sourceId and friends may refer to
+    fixture_ids = {fixture.get("id") for fixture in fixtures}
+    known_ids = set(fixture_ids)
+    for test in testscript.get("test", []):
+        for action in test.get("action", []):
+            operation = action.get("operation")
+            if operation and operation.get("responseId"):
+                known_ids.add(operation["responseId"])
+
+    errors = []
+    tests = tuple(_compile_test(test, fixture_ids, known_ids, errors) for test in testscript.get("test", []))
+    if errors:
+        raise InvalidTestScriptError(f"TestScript '{name}' is invalid:\n" + "\n".join(errors))
+
+    profiles = MappingProxyType({profile.get("id"): profile.get("reference") for profile in testscript.get("profile", [])})
+    return ScriptPlan(name, fixtures, frozenset(modified_fixture_ids(testscript)), profiles, tests)
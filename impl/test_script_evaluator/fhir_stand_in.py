@@ -0,0 +1,322 @@
+"""
+In-process stand-in for a FHIR server, used by the benchmarks.
+Keeps all resources in memory and supports transaction and batch bundles,
+create, read, update, delete, search (with paging) and history.
+Every response can be delayed to simulate the latency of a real server, and
+requests above a concurrency limit can be rejected with 429 like a rate-limited server.
+
+Usage:
+    with FhirStandIn(latency_ms=5) as server:
+        run_against(server.base_url)
+"""
+import gzip
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BASE_PATH = "/fhir"
+DEFAULT_PAGE_SIZE = 50
+
+
+class ResourceStore:
+    """
+    Thread-safe in-memory storage of the stand-in.
+
+    Attributes:
+        resources (dict): (resource type, id) -> current resource
+        history (list): Every stored version as (resource type, id, resource)
+    """
+
+    def __init__(self):
+        self.resources = {}
+        self.history = []
+        self._versions = {}  # (resource type, id) -> number of the last version
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _stamp(self, resource, resource_id):
+        key = (resource["resourceType"], resource_id)
+        self._versions[key] = self._versions.get(key, 0) + 1
+        meta = {"versionId": str(self._versions[key]), "lastUpdated": datetime.now(timezone.utc).isoformat()}
+        return dict(resource, id=resource_id, meta=meta)
+
+    def create(self, resource):
+        """:return: Stored resource with server id and meta."""
+        with self._lock:
+            stored = self._stamp(resource, str(next(self._ids)))
+            self.resources[(stored["resourceType"], stored["id"])] = stored
+            self.history.append((stored["resourceType"], stored["id"], stored))
+        return stored
+
+    def update(self, resource_type, resource_id, resource):
+        """:return: Tuple (stored resource, True if it was created)."""
+        with self._lock:
+            created = (resource_type, resource_id) not in self.resources
+            stored = self._stamp(dict(resource, resourceType=resource_type), resource_id)
+            self.resources[(resource_type, resource_id)] = stored
+            self.history.append((resource_type, resource_id, stored))
+        return stored, created
+
+    def read(self, resource_type, resource_id):
+        return self.resources.get((resource_type, resource_id))
+
+    def delete(self, resource_type, resource_id):
+        with self._lock:
+            return self.resources.pop((resource_type, resource_id), None) is not None
+
+    def search(self, resource_type):
+        with self._lock:
+            return [resource for (stored_type, _), resource in self.resources.items() if stored_type == resource_type]
+
+    def versions(self, resource_type=None, resource_id=None):
+        with self._lock:
+            return [resource for stored_type, stored_id, resource in reversed(self.history)
+                    if resource_type in (None, stored_type) and resource_id in (None, stored_id)]
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without this delayed ACKs add ~40 ms per response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # no console output per request
+
+    # --- request handling ---
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        if not self.server.enter():
+            self._read_body()
+            return self._send(429, _outcome("Too many concurrent requests", "throttled"),
+                              {"Retry-After": str(self.server.retry_after)})
+        try:
+            self.server.delay()
+            self._dispatch(method)
+        finally:
+            self.server.leave()
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = url.path[len(BASE_PATH):] if url.path.startswith(BASE_PATH) else url.path
+        parts = [part for part in path.split("/") if part]
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            body = self._read_body()
+        except ValueError:
+            return self._send(400, _outcome("Request body is not valid JSON"))
+
+        status, resource, headers = self.server.dispatch(method, parts, query, body, self.headers.get("Prefer", ""))
+        self._send(status, resource, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        return json.loads(data) if data else None
+
+    def _send(self, status, resource=None, headers=None):
+        data = json.dumps(resource, separators=(",", ":")).encode("utf-8") if resource is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/fhir+json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _outcome(message, code="processing"):
+    return {"resourceType": "OperationOutcome",
+            "issue": [{"severity": "error", "code": code, "diagnostics": message}]}
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms, jitter_ms, max_concurrent=None, retry_after=1):
+        super().__init__(address, _StandInHandler)
+        self.store = ResourceStore()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{BASE_PATH}"
+
+    def enter(self):
+        """:return: False if the request exceeds max_concurrent and is rejected."""
+        with self._active_lock:
+            if self.max_concurrent is not None and self._active >= self.max_concurrent:
+                self.throttled += 1
+                return False
+            self._active += 1
+            return True
+
+    def leave(self):
+        with self._active_lock:
+            self._active -= 1
+
+    def delay(self):
+        self.requests += 1
+        latency = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def dispatch(self, method, parts, query, body, prefer=""):
+        """
+        Executes one interaction.
+
+        :return: Tuple (status code, response resource or None, response headers).
+        """
+        if method == "POST" and not parts:
+            return self._bundle(body)
+        if method == "POST" and len(parts) == 1:
+            stored = self.store.create(body)
+            location = f"{stored['resourceType']}/{stored['id']}/_history/{stored['meta']['versionId']}"
+            return 201, None if "return=minimal" in prefer else stored, {"Location": f"{self.base_url}/{location}"}
+        if method == "GET" and parts and parts[-1] == "_history" and len(parts) <= 3:
+            return self._bundle_of(self.store.versions(*parts[:-1]), "history", parts, query)
+        if method == "GET" and len(parts) == 1:
+            return self._bundle_of(self.store.search(parts[0]), "searchset", parts, query)
+        if len(parts) == 2:
+            resource_type, resource_id = parts
+            if method == "GET":
+                stored = self.store.read(resource_type, resource_id)
+                return (200, stored, {}) if stored else (404, _outcome("Not found", "not-found"), {})
+            if method == "PUT":
+                stored, created = self.store.update(resource_type, resource_id, body)
+                return 201 if created else 200, stored, {}
+            if method == "DELETE":
+                self.store.delete(resource_type, resource_id)
+                return 204, None, {}
+        return 404, _outcome(f"Unsupported interaction {method} /{'/'.join(parts)}", "not-supported"), {}
+
+    def _bundle(self, bundle):
+        if not isinstance(bundle, dict) or bundle.get("type") not in ("transaction", "batch"):
+            return 400, _outcome("Expected a transaction or batch Bundle"), {}
+        entries = []
+        for entry in bundle.get("entry", []):
+            request = entry.get("request", {})
+            parts = [part for part in request.get("url", "").split("?")[0].split("/") if part]
+            status, resource, headers = self.dispatch(request.get("method", ""), parts, {}, entry.get("resource"))
+            response = {"status": str(status)}
+            if "Location" in headers:
+                response["location"] = headers["Location"][len(self.base_url) + 1:]
+            entries.append({"resource": resource, "response": response} if resource else {"response": response})
+        return 200, {"resourceType": "Bundle", "type": f"{bundle['type']}-response", "entry": entries}, {}
+
+    def _bundle_of(self, resources, bundle_type, parts, query):
+        count = int(query.get("_count", DEFAULT_PAGE_SIZE))
+        offset = int(query.get("_offset", 0))
+        bundle = {
+            "resourceType": "Bundle",
+            "type": bundle_type,
+            "total": len(resources),
+            "link": [],
+            "entry": [{"fullUrl": f"{self.base_url}/{resource['resourceType']}/{resource['id']}",
+                       "resource": resource} for resource in resources[offset:offset + count]],
+        }
+        if offset + count < len(resources):
+            next_query = "&".join(f"{key}={value}" for key, value in dict(query, _offset=offset + count).items())
+            bundle["link"].append({"relation": "next", "url": f"{self.base_url}/{'/'.join(parts)}?{next_query}"})
+        return 200, bundle, {}
+
+
+class FhirStandIn:
+    """
+    Local FHIR stand-in running on a background thread.
+
+    Attributes:
+        latency_ms (float): Delay added to every response
+        jitter_ms (float): Maximum random delay added on top of latency_ms
+        max_concurrent (int): Requests handled at the same time, further ones get 429, None for no limit
+        retry_after (int): Seconds sent in the Retry-After header of a 429 response
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, host="127.0.0.1", port=0, max_concurrent=None, retry_after=1):
+        """
+        :param latency_ms: Delay added to every response in milliseconds.
+        :param jitter_ms: Maximum random delay added on top of latency_ms.
+        :param host: Interface to listen on.
+        :param port: Port to listen on, 0 picks a free port.
+        :param max_concurrent: Requests handled at the same time, further ones get 429, None for no limit.
+        :param retry_after: Seconds sent in the Retry-After header of a 429 response.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """Base URL of the stand-in, e.g. http://127.0.0.1:54321/fhir"""
+        return self._server.base_url
+
+    @property
+    def store(self):
+        """ResourceStore of the running stand-in."""
+        return self._server.store
+
+    @property
+    def requests(self):
+        """Number of requests handled so far."""
+        return self._server.requests
+
+    @property
+    def throttled(self):
+        """Number of requests rejected with 429 so far."""
+        return self._server.throttled
+
+    def start(self):
+        """
+        Starts the stand-in.
+
+        :return: Base URL of the stand-in.
+        """
+        self._server = _StandInServer(self._address, self.latency_ms, self.jitter_ms, self.max_concurrent, self.retry_after)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fhir-stand-in", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """Stops the stand-in and closes its socket."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
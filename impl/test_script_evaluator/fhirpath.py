@@ -0,0 +1,733 @@
+"""
+FHIRPath evaluator for TestScript assertions.
+An expression is parsed once into an AST and compiled into nested closures,
+the compiled expressions are cached by expression text. Evaluation works
+directly on the parsed JSON of the resources, every result is a list (collection).
+
+Supported is the subset of FHIRPath used in TestScripts: paths incl. choice types,
+indexers, literals, variables, all operators and the common functions
+(existence, filtering, subsetting, combining, conversion, string and math functions).
+"""
+import math
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from impl.exception.FhirPathError import FhirPathError
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.)*')
+  | (?P<datetime>@T?[0-9][0-9T:.+\-Z]*)
+  | (?P<number>[0-9]+(?:\.[0-9]+)?)
+  | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*|`(?:[^`\\]|\\.)*`)
+  | (?P<special>\$this|\$index|\$total)
+  | (?P<variable>%(?:[A-Za-z_][A-Za-z0-9_]*|`(?:[^`\\]|\\.)*`|'(?:[^'\\]|\\.)*'))
+  | (?P<operator><=|>=|!=|!~|[=~<>|+\-*/&()\[\],.{}])
+""", re.VERBOSE | re.DOTALL)
+
+_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "f": "\f", "'": "'", '"': '"', "`": "`", "/": "/", "\\": "\\"}
+
+# Binding power of the infix operators, higher binds stronger
+_BINARY_PRECEDENCE = {
+    "implies": 1,
+    "or": 2, "xor": 2,
+    "and": 3,
+    "in": 4, "contains": 4,
+    "=": 5, "~": 5, "!=": 5, "!~": 5,
+    "<": 6, ">": 6, "<=": 6, ">=": 6,
+    "|": 7,
+    "is": 8, "as": 8,
+    "+": 9, "-": 9, "&": 9,
+    "*": 10, "/": 10, "div": 10, "mod": 10,
+}
+
+# Functions whose argument is evaluated per input item with $this
+_LAMBDA_FUNCTIONS = {"where", "select", "all", "repeat"}
+
+# JSON values and the FHIRPath types they represent
+_STRING_TYPES = {
+    "string", "code", "id", "uri", "url", "canonical", "oid", "uuid", "markdown", "base64Binary",
+    "instant", "date", "dateTime", "time", "xhtml", "String", "Date", "DateTime", "Time",
+}
+_INTEGER_TYPES = {"integer", "positiveInt", "unsignedInt", "Integer"}
+_DECIMAL_TYPES = {"decimal", "Decimal"}
+_BOOLEAN_TYPES = {"boolean", "Boolean"}
+
+# Type names a choice element (value[x], effective[x], ...) carries as suffix in JSON, e.g. valueQuantity
+_CHOICE_TYPE_SUFFIXES = {
+    "Base64Binary", "Boolean", "Canonical", "Code", "Date", "DateTime", "Decimal", "Id", "Instant", "Integer",
+    "Integer64", "Markdown", "Oid", "PositiveInt", "String", "Time", "UnsignedInt", "Uri", "Url", "Uuid",
+    "Address", "Age", "Annotation", "Attachment", "CodeableConcept", "CodeableReference", "Coding",
+    "ContactPoint", "Count", "Distance", "Duration", "HumanName", "Identifier", "Money", "Period", "Quantity",
+    "Range", "Ratio", "RatioRange", "Reference", "SampledData", "Signature", "Timing",
+    "ContactDetail", "Contributor", "DataRequirement", "Expression", "ParameterDefinition", "RelatedArtifact",
+    "TriggerDefinition", "UsageContext", "Availability", "ExtendedContactDetail", "Dosage", "Meta",
+}
+
+
+def _unquote(text):
+    return re.sub(r"\\(u[0-9a-fA-F]{4}|.)",
+                  lambda m: chr(int(m.group(1)[1:], 16)) if len(m.group(1)) == 5 else _ESCAPES.get(m.group(1), m.group(1)),
+                  text[1:-1])
+
+
+def _tokenize(text):
+    """
+    :return: List of (kind, value) tokens, ending with ("end", None).
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise FhirPathError(f"Unexpected character {text[position]!r} at {position} in: {text}")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "space":
+            continue
+        if kind == "string":
+            value = _unquote(value)
+        elif kind == "identifier" and value.startswith("`"):
+            value = _unquote(value)
+        elif kind == "variable":
+            value = _unquote(value[1:]) if value[1] in "`'" else value[1:]
+        tokens.append((kind, value))
+    tokens.append(("end", None))
+    return tokens
+
+
+class _Parser:
+    """
+    Pratt parser producing an AST of tuples, e.g. ("binary", "=", left, right).
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position]
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        kind, actual = self.next()
+        if actual != value or kind not in ("operator", "identifier"):
+            raise FhirPathError(f"Expected {value!r} but found {actual!r} in: {self.text}")
+
+    def parse(self):
+        node = self.expression(0)
+        if self.peek()[0] != "end":
+            raise FhirPathError(f"Unexpected {self.peek()[1]!r} in: {self.text}")
+        return node
+
+    def expression(self, min_precedence):
+        left = self.unary()
+        while True:
+            kind, value = self.peek()
+            precedence = _BINARY_PRECEDENCE.get(value) if kind in ("operator", "identifier") else None
+            if precedence is None or precedence <= min_precedence:
+                return left
+            self.next()
+            if value in ("is", "as"):
+                left = ("type_op", value, left, self.type_name())
+            else:
+                left = ("binary", value, left, self.expression(precedence))
+
+    def unary(self):
+        kind, value = self.peek()
+        if kind == "operator" and value in ("+", "-"):
+            self.next()
+            return ("unary", value, self.unary())
+        return self.postfix(self.term())
+
+    def type_name(self):
+        kind, name = self.next()
+        if kind != "identifier":
+            raise FhirPathError(f"Type name expected, found {name!r} in: {self.text}")
+        while self.peek() == ("operator", "."):
+            self.next()
+            name = f"{name}.{self.next()[1]}"
+        return name
+
+    def term(self):
+        kind, value = self.next()
+        if kind == "string":
+            return ("literal", (value,))
+        if kind == "number":
+            return ("literal", (float(value) if "." in value else int(value),))
+        if kind == "datetime":
+            return ("literal", (value[1:],))
+        if kind == "special":
+            return ("special", value)
+        if kind == "variable":
+            return ("variable", value)
+        if kind == "identifier":
+            if value in ("true", "false") and self.peek() != ("operator", "("):
+                return ("literal", (value == "true",))
+            return self.invocation(value)
+        if (kind, value) == ("operator", "("):
+            node = self.expression(0)
+            self.expect(")")
+            return node
+        if (kind, value) == ("operator", "{"):
+            self.expect("}")
+            return ("literal", ())
+        raise FhirPathError(f"Unexpected {value!r} in: {self.text}")
+
+    def invocation(self, name):
+        if self.peek() != ("operator", "("):
+            return ("member", name)
+        self.next()
+        arguments = []
+        if self.peek() != ("operator", ")"):
+            arguments.append(self.expression(0))
+            while self.peek() == ("operator", ","):
+                self.next()
+                arguments.append(self.expression(0))
+        self.expect(")")
+        return ("function", name, tuple(arguments))
+
+    def postfix(self, node):
+        while True:
+            token = self.peek()
+            if token == ("operator", "."):
+                self.next()
+                kind, name = self.next()
+                if kind != "identifier":
+                    raise FhirPathError(f"Identifier expected after '.', found {name!r} in: {self.text}")
+                node = ("invoke", node, self.invocation(name))
+            elif token == ("operator", "["):
+                self.next()
+                index = self.expression(0)
+                self.expect("]")
+                node = ("indexer", node, index)
+            else:
+                return node
+
+
+class _Env:
+    """Evaluation environment: root collection, variables and $this/$index of lambdas."""
+
+    __slots__ = ("root", "variables", "this", "index")
+
+    def __init__(self, root, variables, this=None, index=None):
+        self.root = root
+        self.variables = variables
+        self.this = this
+        self.index = index
+
+    def with_this(self, item, index):
+        return _Env(self.root, self.variables, [item], index)
+
+
+# --- Helpers working on collections
+
+def _member(focus, name):
+    """Navigates into an element of all items, choice types (value -> valueQuantity) included."""
+    result = []
+    for item in focus:
+        if not isinstance(item, dict):
+            continue
+        if name in item:
+            value = item[name]
+        elif item.get("resourceType") == name:
+            value = item
+        else:
+            # Choice type, e.g. "value" matches "valueQuantity" but "code" does not match "codeSystem"
+            length = len(name)
+            for key, value in item.items():
+                if key.startswith(name) and key[length:] in _CHOICE_TYPE_SUFFIXES:
+                    break
+            else:
+                continue
+        if isinstance(value, list):
+            result.extend(value)
+        else:
+            result.append(value)
+    return result
+
+
+def _is_type(item, type_name):
+    type_name = type_name.rsplit(".", 1)[-1]
+    if isinstance(item, bool):
+        return type_name in _BOOLEAN_TYPES
+    if isinstance(item, int):
+        return type_name in _INTEGER_TYPES
+    if isinstance(item, float):
+        return type_name in _DECIMAL_TYPES
+    if isinstance(item, str):
+        return type_name in _STRING_TYPES
+    if isinstance(item, dict):
+        return item.get("resourceType") == type_name or (
+            type_name in ("Resource", "DomainResource") and "resourceType" in item
+        )
+    return False
+
+
+def _to_boolean(collection):
+    """Singleton evaluation of a collection as boolean, None for empty."""
+    if not collection:
+        return None
+    if len(collection) > 1:
+        raise FhirPathError(f"Boolean expected, got a collection of {len(collection)} items")
+    item = collection[0]
+    return item if isinstance(item, bool) else True
+
+
+def _singleton(collection, what="value"):
+    if len(collection) > 1:
+        raise FhirPathError(f"Single {what} expected, got a collection of {len(collection)} items")
+    return collection[0] if collection else None
+
+
+def _equals(left, right):
+    if isinstance(left, bool) != isinstance(right, bool):
+        return False
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(_equals(left[key], right[key]) for key in left)
+    if isinstance(left, list) and isinstance(right, list):
+        return len(left) == len(right) and all(_equals(a, b) for a, b in zip(left, right))
+    return left == right
+
+
+def _equivalent(left, right):
+    if isinstance(left, str) and isinstance(right, str):
+        return " ".join(left.lower().split()) == " ".join(right.lower().split())
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)) and not isinstance(left, bool):
+        return round(left, 8) == round(right, 8)
+    return _equals(left, right)
+
+
+def _distinct(collection):
+    result = []
+    for item in collection:
+        if not any(_equals(item, existing) for existing in result):
+            result.append(item)
+    return result
+
+
+def _contains_item(collection, item):
+    return any(_equals(item, existing) for existing in collection)
+
+
+def _to_string(item):
+    if isinstance(item, bool):
+        return "true" if item else "false"
+    if isinstance(item, (int, float, str)):
+        return str(item)
+    return None
+
+
+def _to_number(item, integer=False):
+    if isinstance(item, bool):
+        return int(item)
+    if isinstance(item, (int, float)):
+        return int(item) if integer and float(item).is_integer() else (None if integer else item)
+    if isinstance(item, str):
+        try:
+            return int(item) if integer else float(item)
+        except ValueError:
+            return None
+    return None
+
+
+# --- Operators
+
+def _compare(op, left, right):
+    left, right = _singleton(left), _singleton(right)
+    if left is None or right is None:
+        return []
+    numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (left, right))
+    if not numeric and not (isinstance(left, str) and isinstance(right, str)):
+        raise FhirPathError(f"Cannot compare {left!r} and {right!r}")
+    return [{"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[op]]
+
+
+def _arithmetic(op, left, right):
+    if op == "&":
+        return ["".join(_to_string(_singleton(side)) or "" for side in (left, right))]
+    left, right = _singleton(left), _singleton(right)
+    if left is None or right is None:
+        return []
+    if op == "+" and isinstance(left, str) and isinstance(right, str):
+        return [left + right]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (left, right)):
+        raise FhirPathError(f"Cannot apply {op!r} to {left!r} and {right!r}")
+    if op in ("/", "div", "mod") and right == 0:
+        return []
+    if op == "+":
+        return [left + right]
+    if op == "-":
+        return [left - right]
+    if op == "*":
+        return [left * right]
+    if op == "/":
+        return [left / right]
+    if op == "div":
+        return [int(left // right) if left * right >= 0 else -int(abs(left) // abs(right))]
+    return [math.fmod(left, right) if isinstance(left, float) or isinstance(right, float) else int(math.fmod(left, right))]
+
+
+def _logic(op, left, right):
+    a, b = _to_boolean(left), _to_boolean(right)
+    if op == "and":
+        result = False if a is False or b is False else (None if a is None or b is None else True)
+    elif op == "or":
+        result = True if a is True or b is True else (None if a is None or b is None else False)
+    elif op == "xor":
+        result = None if a is None or b is None else a != b
+    else:  # implies
+        result = True if a is False or b is True else (None if a is None or b is None else False)
+    return [] if result is None else [result]
+
+
+def _binary(op, left, right):
+    if op in ("and", "or", "xor", "implies"):
+        return _logic(op, left, right)
+    if op == "|":
+        return _distinct(left + right)
+    if op in ("=", "!="):
+        if not left or not right:
+            return []
+        equal = len(left) == len(right) and all(_equals(a, b) for a, b in zip(left, right))
+        return [equal if op == "=" else not equal]
+    if op in ("~", "!~"):
+        equivalent = len(left) == len(right) and all(any(_equivalent(a, b) for b in right) for a in left)
+        return [equivalent if op == "~" else not equivalent]
+    if op in ("<", ">", "<=", ">="):
+        return _compare(op, left, right)
+    if op == "in":
+        item = _singleton(left)
+        return [] if item is None else [_contains_item(right, item)]
+    if op == "contains":
+        item = _singleton(right)
+        return [] if item is None else [_contains_item(left, item)]
+    return _arithmetic(op, left, right)
+
+
+# --- Functions, called with (env, focus, compiled arguments)
+
+def _arg(env, argument):
+    return argument(env, env.root) if argument is not None else []
+
+
+def _string_function(function):
+    def call(env, focus, arguments):
+        value = _singleton(focus)
+        if value is None:
+            return []
+        if not isinstance(value, str):
+            raise FhirPathError(f"String expected, got {value!r}")
+        values = [_singleton(_arg(env, argument)) for argument in arguments]
+        if any(v is None for v in values):
+            return []
+        result = function(value, *values)
+        return [] if result is None else [result]
+    return call
+
+
+def _where(env, focus, arguments):
+    criteria = arguments[0]
+    return [item for index, item in enumerate(focus) if _to_boolean(criteria(env.with_this(item, index), [item])) is True]
+
+
+def _select(env, focus, arguments):
+    result = []
+    for index, item in enumerate(focus):
+        result.extend(arguments[0](env.with_this(item, index), [item]))
+    return result
+
+
+def _repeat(env, focus, arguments):
+    result = []
+    pending = list(focus)
+    while pending:
+        found = _select(env, pending, arguments)
+        pending = [item for item in found if not _contains_item(result, item)]
+        result.extend(pending)
+    return result
+
+
+def _exists(env, focus, arguments):
+    return [bool(_where(env, focus, arguments) if arguments else focus)]
+
+
+def _all(env, focus, arguments):
+    return [all(_to_boolean(arguments[0](env.with_this(item, index), [item])) is True for index, item in enumerate(focus))]
+
+
+def _iif(env, focus, arguments):
+    condition = _to_boolean(arguments[0](env, focus))
+    if condition is True:
+        return arguments[1](env, focus)
+    return arguments[2](env, focus) if len(arguments) > 2 else []
+
+
+def _children(focus):
+    result = []
+    for item in focus:
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key != "resourceType":
+                    result.extend(value if isinstance(value, list) else [value])
+    return result
+
+
+def _descendants(focus):
+    result = []
+    pending = _children(focus)
+    while pending:
+        result.extend(pending)
+        pending = _children(pending)
+    return result
+
+
+def _today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+_FUNCTIONS = {
+    # Existence
+    "empty": lambda env, focus, args: [not focus],
+    "exists": _exists,
+    "all": _all,
+    "allTrue": lambda env, focus, args: [all(item is True for item in focus)],
+    "anyTrue": lambda env, focus, args: [any(item is True for item in focus)],
+    "allFalse": lambda env, focus, args: [all(item is False for item in focus)],
+    "anyFalse": lambda env, focus, args: [any(item is False for item in focus)],
+    "count": lambda env, focus, args: [len(focus)],
+    "distinct": lambda env, focus, args: _distinct(focus),
+    "isDistinct": lambda env, focus, args: [len(_distinct(focus)) == len(focus)],
+    "subsetOf": lambda env, focus, args: [all(_contains_item(_arg(env, args[0]), item) for item in focus)],
+    "supersetOf": lambda env, focus, args: [all(_contains_item(focus, item) for item in _arg(env, args[0]))],
+    "hasValue": lambda env, focus, args: [len(focus) == 1 and not isinstance(focus[0], (dict, list))],
+    # Filtering and projection
+    "where": _where,
+    "select": _select,
+    "repeat": _repeat,
+    # Subsetting
+    "single": lambda env, focus, args: [_singleton(focus)] if focus else [],
+    "first": lambda env, focus, args: focus[:1],
+    "last": lambda env, focus, args: focus[-1:],
+    "tail": lambda env, focus, args: focus[1:],
+    "skip": lambda env, focus, args: focus[max(_singleton(_arg(env, args[0])) or 0, 0):],
+    "take": lambda env, focus, args: focus[:max(_singleton(_arg(env, args[0])) or 0, 0)],
+    "intersect": lambda env, focus, args: _distinct([item for item in focus if _contains_item(_arg(env, args[0]), item)]),
+    "exclude": lambda env, focus, args: [item for item in focus if not _contains_item(_arg(env, args[0]), item)],
+    # Combining
+    "union": lambda env, focus, args: _distinct(focus + _arg(env, args[0])),
+    "combine": lambda env, focus, args: focus + _arg(env, args[0]),
+    # Conversion
+    "iif": _iif,
+    "toString": lambda env, focus, args: [s for s in [_to_string(_singleton(focus))] if s is not None],
+    "toInteger": lambda env, focus, args: [n for n in [_to_number(_singleton(focus), integer=True)] if n is not None],
+    "toDecimal": lambda env, focus, args: [n for n in [_to_number(_singleton(focus))] if n is not None],
+    "convertsToInteger": lambda env, focus, args: [] if not focus else [_to_number(_singleton(focus), integer=True) is not None],
+    "convertsToDecimal": lambda env, focus, args: [] if not focus else [_to_number(_singleton(focus)) is not None],
+    "toBoolean": lambda env, focus, args: [{"true": True, "false": False}[v] for v in [_to_string(_singleton(focus))] if v in ("true", "false")],
+    # Strings
+    "startsWith": _string_function(lambda s, prefix: s.startswith(prefix)),
+    "endsWith": _string_function(lambda s, suffix: s.endswith(suffix)),
+    "contains": _string_function(lambda s, part: part in s),
+    "matches": _string_function(lambda s, regex: re.search(regex, s) is not None),
+    "replaceMatches": _string_function(lambda s, regex, substitution: re.sub(regex, substitution, s)),
+    "replace": _string_function(lambda s, pattern, substitution: s.replace(pattern, substitution)),
+    "indexOf": _string_function(lambda s, part: s.find(part)),
+    "substring": _string_function(lambda s, start, length=None: (s[start:] if length is None else s[start:start + length]) if 0 <= start < len(s) else None),
+    "length": _string_function(len),
+    "lower": _string_function(str.lower),
+    "upper": _string_function(str.upper),
+    "trim": _string_function(str.strip),
+    "toChars": lambda env, focus, args: list(_singleton(focus) or ""),
+    "split": lambda env, focus, args: (_singleton(focus) or "").split(_singleton(_arg(env, args[0]))) if focus else [],
+    "join": lambda env, focus, args: ["".join(_to_string(item) or "" for item in focus) if not args else (_singleton(_arg(env, args[0])) or "").join(_to_string(item) or "" for item in focus)],
+    # Math
+    "abs": lambda env, focus, args: [abs(v) for v in focus[:1]],
+    "round": lambda env, focus, args: [round(v, _singleton(_arg(env, args[0])) if args else 0) for v in focus[:1]],
+    # Tree navigation
+    "children": lambda env, focus, args: _children(focus),
+    "descendants": lambda env, focus, args: _descendants(focus),
+    "extension": lambda env, focus, args: [ext for ext in _member(focus, "extension") if ext.get("url") == _singleton(_arg(env, args[0]))],
+    "resolve": lambda env, focus, args: [],
+    # Utility
+    "not": lambda env, focus, args: [] if _to_boolean(focus) is None else [not _to_boolean(focus)],
+    "trace": lambda env, focus, args: focus,
+    "today": lambda env, focus, args: [_today()],
+    "now": lambda env, focus, args: [_now()],
+}
+
+
+# --- Compilation of the AST into closures
+
+def _compile(node):
+    kind = node[0]
+
+    if kind == "literal":
+        values = list(node[1])
+        return lambda env, focus: list(values)
+
+    if kind == "member":
+        name = node[1]
+        return lambda env, focus: _member(focus, name)
+
+    if kind == "special":
+        if node[1] == "$this":
+            return lambda env, focus: list(env.this if env.this is not None else focus)
+        if node[1] == "$index":
+            return lambda env, focus: [] if env.index is None else [env.index]
+        return lambda env, focus: []
+
+    if kind == "variable":
+        name = node[1]
+
+        def variable(env, focus):
+            if name in ("resource", "rootResource", "context"):
+                return list(env.root)
+            if name == "ucum":
+                return ["http://unitsofmeasure.org"]
+            if name == "sct":
+                return ["http://snomed.info/sct"]
+            if name == "loinc":
+                return ["http://loinc.org"]
+            if name not in env.variables:
+                raise FhirPathError(f"Unknown variable %{name}")
+            value = env.variables[name]
+            return list(value) if isinstance(value, list) else [value]
+        return variable
+
+    if kind == "invoke":
+        return _compile_invoke(node[1], node[2])
+
+    if kind == "function":
+        return _compile_function(node[1], node[2])
+
+    if kind == "indexer":
+        source, index = _compile(node[1]), _compile(node[2])
+
+        def indexer(env, focus):
+            items = source(env, focus)
+            position = _singleton(index(env, focus))
+            return items[position:position + 1] if isinstance(position, int) and position >= 0 else []
+        return indexer
+
+    if kind == "unary":
+        operand = _compile(node[2])
+        if node[1] == "+":
+            return operand
+        return lambda env, focus: [-value for value in operand(env, focus)]
+
+    if kind == "type_op":
+        op, operand, type_name = node[1], node[2], node[3]
+        if op == "as":
+            choice = _compile_choice_access(operand, type_name)
+            if choice is not None:
+                return choice
+        compiled = _compile(operand)
+        if op == "is":
+            return lambda env, focus: [] if not (items := compiled(env, focus)) else [_is_type(_singleton(items), type_name)]
+        return lambda env, focus: [item for item in compiled(env, focus) if _is_type(item, type_name)]
+
+    if kind == "binary":
+        op, left, right = node[1], _compile(node[2]), _compile(node[3])
+        return lambda env, focus: _binary(op, left(env, focus), right(env, focus))
+
+    raise FhirPathError(f"Unknown expression node {kind}")
+
+
+def _compile_choice_access(node, type_name):
+    """
+    Compiles "value.ofType(Quantity)" and "value as Quantity" into a direct access
+    of "valueQuantity", the JSON of a choice element carries its type in the name.
+
+    :return: Compiled closure or None if the node is no member access.
+    """
+    if node[0] == "member":
+        parent, name = None, node[1]
+    elif node[0] == "invoke" and node[2][0] == "member":
+        parent, name = _compile(node[1]), node[2][1]
+    else:
+        return None
+
+    type_name = type_name.rsplit(".", 1)[-1]
+    choice_name = name + type_name[0].upper() + type_name[1:]
+
+    def choice(env, focus):
+        items = parent(env, focus) if parent is not None else focus
+        found = [value for item in items if isinstance(item, dict) and choice_name in item
+                 for value in (item[choice_name] if isinstance(item[choice_name], list) else [item[choice_name]])]
+        return found or [item for item in _member(items, name) if _is_type(item, type_name)]
+    return choice
+
+
+def _compile_invoke(source_node, target_node):
+    if target_node[0] == "function" and target_node[1] == "ofType" and len(target_node[2]) == 1 \
+            and target_node[2][0][0] == "member":
+        choice = _compile_choice_access(source_node, target_node[2][0][1])
+        if choice is not None:
+            return choice
+
+    source = _compile(source_node)
+    target = _compile(target_node)
+    return lambda env, focus: target(env, source(env, focus))
+
+
+def _compile_function(name, argument_nodes):
+    # Type arguments are names, not expressions
+    if name in ("ofType", "is", "as") and len(argument_nodes) == 1:
+        type_name = argument_nodes[0][1] if argument_nodes[0][0] == "member" else None
+        if type_name is None:
+            raise FhirPathError(f"{name}() expects a type name")
+        if name == "is":
+            return lambda env, focus: [] if not focus else [_is_type(_singleton(focus), type_name)]
+        return lambda env, focus: [item for item in focus if _is_type(item, type_name)]
+
+    function = _FUNCTIONS.get(name)
+    if function is None:
+        raise FhirPathError(f"Unsupported FHIRPath function {name}()")
+    arguments = tuple(_compile(argument) for argument in argument_nodes)
+    if name in _LAMBDA_FUNCTIONS and not arguments:
+        raise FhirPathError(f"{name}() expects an argument")
+    if name == "iif" and len(arguments) < 2:
+        raise FhirPathError("iif() expects at least two arguments")
+    return lambda env, focus: function(env, focus, arguments)
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression):
+    """
+    Parses and compiles a FHIRPath expression, cached by expression text.
+
+    :param expression: FHIRPath expression.
+    :return: Callable (resource, variables=None) -> list of result values.
+    :raises FhirPathError: If the expression cannot be parsed.
+    """
+    compiled = _compile(_Parser(expression).parse())
+
+    def evaluate_compiled(resource, variables=None):
+        root = [] if resource is None else [resource]
+        return compiled(_Env(root, variables or {}), root)
+    return evaluate_compiled
+
+
+def evaluate(expression, resource, variables=None):
+    """
+    Evaluates a FHIRPath expression against a resource.
+
+    :param expression: FHIRPath expression.
+    :param resource: Resource dictionary (parsed JSON) or None.
+    :param variables: Optional dictionary of %variables.
+    :return: List of result values.
+    :raises FhirPathError: If the expression cannot be parsed or evaluated.
+    """
+    return compile_expression(expression)(resource, variables)
@@ -0,0 +1,196 @@
+"""
+Sharing of fixtures between the TestScripts of one run.
+Many TestScripts use the same example instances, so a fixture with the same
+content is created once per run (keyed by a hash of its content) and deleted
+only when no TestScript uses it anymore, at the end of the run.
+TestScripts that update or delete a fixture get their own copy instead.
+"""
+import hashlib
+import json
+import threading
+
+from teardown import delete_resources
+from utils import log_event, log_to_file
+
+# Operations that change the fixture they refer to
+MODIFYING_OPERATIONS = ("update", "patch", "delete")
+
+
+def content_hash(resource):
+    """
+    :param resource: Resource dictionary.
+    :return: SHA-256 of the canonical JSON of the resource.
+    """
+    canonical = json.dumps(resource, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def modified_fixture_ids(testscript):
+    """
+    Collects the fixtures a TestScript changes on the server.
+
+    :param testscript: The TestScript resource.
+    :return: Set of fixture ids used by update, patch or delete operations.
+    """
+    actions = list(testscript.get("setup", {}).get("action", []))
+    for test in testscript.get("test", []):
+        actions.extend(test.get("action", []))
+    actions.extend(testscript.get("teardown", {}).get("action", []))
+
+    fixture_ids = set()
+    for action in actions:
+        operation = action.get("operation")
+        if operation and operation.get("type", {}).get("code", "").lower() in MODIFYING_OPERATIONS:
+            fixture_ids.update(filter(None, (operation.get("sourceId"), operation.get("targetId"))))
+    return fixture_ids
+
+
+class SharedFixture:
+    """
+    A fixture on the server that is used by several TestScripts.
+
+    Attributes:
+        key (tuple): (server base URL, content hash)
+        server_id (str): Server ID of the resource
+        resource_type (str): Type of the resource, for deletion
+        users (int): Number of TestScripts currently using the fixture
+        autodelete (bool): Delete the fixture at the end of the run
+        created (threading.Event): Set when the fixture was created or its creation was given up
+    """
+
+    def __init__(self, key, server_id, resource_type, autodelete):
+        self.key = key
+        self.server_id = server_id
+        self.resource_type = resource_type
+        self.users = 1
+        self.autodelete = autodelete
+        self.created = threading.Event()
+        if server_id is not None:
+            self.created.set()
+
+    def __repr__(self):
+        return f"SharedFixture(type={self.resource_type}, server={self.server_id}, users={self.users})"
+
+
+class FixtureManager:
+    """
+    Reference-counted registry of the shared fixtures of this process.
+    The first TestScript that needs a fixture reserves it and creates it,
+    all others wait until it is registered, so every fixture is created once.
+    """
+
+    def __init__(self):
+        self._fixtures = {}  # (server base URL, content hash) -> SharedFixture
+        self._lock = threading.Lock()
+
+    def acquire(self, server_base, resource, autodelete):
+        """
+        Takes a reference on the fixture with the same content.
+        If no other TestScript created or reserved it, the fixture is reserved for the caller,
+        who has to create it and call register() or abandon(). Otherwise the call waits until
+        the fixture is created. A TestScript acquires its fixtures in the order of their
+        content hash, so two TestScripts never wait for each other.
+
+        :param server_base: Base URL of the FHIR server.
+        :param resource: Content of the fixture.
+        :param autodelete: Whether this TestScript wants the fixture deleted.
+        :return: SharedFixture or None if the caller has to create it.
+        """
+        key = (server_base, content_hash(resource))
+        while True:
+            with self._lock:
+                shared = self._fixtures.get(key)
+                if shared is None:
+                    self._fixtures[key] = SharedFixture(key, None, resource.get("resourceType"), autodelete)
+                    return None
+                shared.users += 1
+                shared.autodelete = shared.autodelete or autodelete
+            shared.created.wait()
+            if shared.server_id is not None:
+                return shared
+            # The creator gave up, the next attempt reserves the fixture or waits for another creator
+
+    def register(self, server_base, resource, server_id, autodelete):
+        """
+        Registers the fixture reserved by acquire() once it is created and wakes up the waiting TestScripts.
+
+        :return: SharedFixture or None if the fixture was not reserved by the caller,
+            the copy then stays private to the TestScript.
+        """
+        key = (server_base, content_hash(resource))
+        with self._lock:
+            shared = self._fixtures.get(key)
+            if shared is None or shared.server_id is not None:
+                return None
+            shared.server_id = server_id
+            shared.autodelete = shared.autodelete or autodelete
+        shared.created.set()
+        return shared
+
+    def abandon(self, server_base, resource):
+        """
+        Gives up the reservation of a fixture that could not be created.
+        Waiting TestScripts then reserve and create it themselves.
+        """
+        key = (server_base, content_hash(resource))
+        with self._lock:
+            shared = self._fixtures.get(key)
+            if shared is None or shared.server_id is not None:
+                return
+            del self._fixtures[key]
+        shared.created.set()
+
+    def release(self, shared):
+        """
+        Drops the reference of a finished TestScript.
+        The fixture stays on the server for the following TestScripts.
+        """
+        with self._lock:
+            shared.users -= 1
+
+    def close(self, http_client):
+        """
+        Deletes all fixtures that are no longer in use and have autodelete set.
+        Called once at the end of the run.
+
+        :param http_client: Client used for the DELETE requests.
+        :return: List of deleted references.
+        """
+        with self._lock:
+            unused = [shared for shared in self._fixtures.values() if shared.users <= 0]
+            for shared in unused:
+                del self._fixtures[shared.key]
+
+        references = {}  # server base URL -> references to delete
+        for shared in unused:
+            if shared.autodelete and shared.server_id:
+                references.setdefault(shared.key[0], []).append(f"{shared.resource_type}/{shared.server_id}")
+
+        deleted = []
+        for server_base, server_references in references.items():
+            removed, failed = delete_resources(http_client, server_base, server_references)
+            deleted.extend(removed)
+            for reference, status in failed.items():
+                log_to_file(f"✗ Could not delete shared fixture {reference} ({status})")
+        if references:
+            log_to_file(f"Deleted {len(deleted)} shared fixtures {deleted}")
+            log_event("teardown", removed=deleted, shared=True)
+        return deleted
+
+
+# Singleton instance
+_fixture_manager = None
+
+
+def get_fixture_manager():
+    """
+    Gets or creates the FixtureManager of this process.
+
+    :return: FixtureManager instance.
+    """
+    global _fixture_manager
+
+    if _fixture_manager is None:
+        _fixture_manager = FixtureManager()
+
+    return _fixture_manager
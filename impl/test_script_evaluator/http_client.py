@@ -0,0 +1,235 @@
+"""
+Shared HTTP client for all traffic to the FHIR server.
+Keeps connections alive in a pool and applies timeouts and retries.
+All requests pass an adaptive concurrency limiter, see concurrency_limiter.py.
+"""
+import time
+from pathlib import Path
+
+import requests
+from urllib3.util.retry import Retry
+
+from concurrency_limiter import create_limiter, parse_retry_after
+from http_timing import ExchangeTiming, TimedHTTPAdapter, get_connect_time, get_time_to_first_byte, reset_connect_time
+from utils import log_event, log_to_file
+
+DEFAULT_HTTP_SETTINGS = {
+    "poolConnections": 10,      # number of hosts kept in the pool
+    "poolMaxsize": 10,          # connections kept alive per host
+    "poolBlock": False,         # wait for a free connection instead of opening an extra one
+    "connectTimeout": 10,       # seconds
+    "readTimeout": 60,          # seconds
+    "retries": 3,               # retries for idempotent methods only
+    "backoffFactor": 0.5,       # 0.5s, 1s, 2s, ...
+    "retryStatusCodes": [502, 504],  # 429 and 503 are handled by the throttle retries
+    "gzipMinBytes": None,       # gzip request bodies (transaction bundles) from this size, None disables
+    "throttleRetries": 3,       # resends after 429 or 503, also for POST
+    "adaptiveConcurrency": {},  # settings of the AIMD limiter, see concurrency_limiter.py
+}
+
+# 429 and 503 mean the request was not processed, so it can be resent for every method
+THROTTLE_STATUS_CODES = frozenset([429, 503])
+
+# POST and PATCH are never retried, a repeated create would duplicate resources
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+
+# Relative cassette folders are resolved against impl/
+CASSETTE_BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def _received_bytes(response, stream):
+    """
+    :param response: Response of one attempt.
+    :param stream: True if the caller reads the body itself (stream=True).
+    :return: Size of the response body. A streamed body is not read here, its
+        Content-Length is used instead (0 if the server sends none).
+    """
+    if not stream:
+        return len(response.content)
+    try:
+        return int(response.headers.get("Content-Length", 0))
+    except ValueError:
+        return 0
+
+
+class FhirHttpClient:
+    """
+    Pooled, keep-alive HTTP client used for every request against the FHIR server.
+
+    Attributes:
+        settings (dict): Effective HTTP settings (defaults merged with config)
+        cassette (dict): Record/replay settings, see cassette.py
+        session (requests.Session): Session holding the connection pool
+        limiter (AdaptiveConcurrencyLimiter): Limit of concurrent requests or None if disabled
+    """
+
+    def __init__(self, settings=None, cassette=None):
+        """
+        Initializes the client and mounts the pooled adapter.
+
+        :param settings: Optional dictionary with the "http" section of config.json.
+        :param cassette: Optional dictionary with the "cassette" section of config.json.
+        """
+        self.settings = dict(DEFAULT_HTTP_SETTINGS)
+        self.settings.update(settings or {})
+        self.cassette = dict(cassette or {})
+        self.timeout = (self.settings["connectTimeout"], self.settings["readTimeout"])
+        self.session = self._create_session()
+        self.limiter = create_limiter(self.settings["adaptiveConcurrency"])
+        self.observers = []
+
+    def _create_session(self):
+        """
+        Creates a session with a pooled adapter and a retry policy.
+        In record or replay mode the adapter records the exchanges or answers from the cassette.
+
+        :return: Configured requests.Session.
+        """
+        # Throttled responses are resent by request() only, urllib3 would resend them inside
+        # every throttle retry and sleep for Retry-After while holding a slot of the limiter
+        retry = Retry(
+            total=self.settings["retries"],
+            backoff_factor=self.settings["backoffFactor"],
+            status_forcelist=[code for code in self.settings["retryStatusCodes"] if code not in THROTTLE_STATUS_CODES],
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter_arguments = dict(
+            pool_connections=self.settings["poolConnections"],
+            pool_maxsize=self.settings["poolMaxsize"],
+            pool_block=self.settings["poolBlock"],
+            max_retries=retry,
+        )
+        if str(self.cassette.get("mode", "off")).lower() == "off":
+            adapter = TimedHTTPAdapter(**adapter_arguments)
+        else:
+            # Only runs that record or replay need the cassette module
+            from cassette import create_adapter
+            adapter = create_adapter(self.cassette, CASSETTE_BASE_DIR, **adapter_arguments)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def request(self, method, url, operation=None, **kwargs):
+        """
+        Sends a request through the pooled session and times it.
+        The request waits for a free slot of the limiter, throttled requests (429, 503) are
+        resent after Retry-After or an exponential backoff (at most throttleRetries times).
+
+        :param method: HTTP method (GET, POST, PUT, DELETE, ...).
+        :param url: Absolute URL of the request.
+        :param operation: Label of the exchange for the timing metrics, defaults to the method.
+        :param kwargs: Additional arguments passed to requests (headers, json, data, ...).
+        :return: HTTP response object.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        operation = operation or method.lower()
+        for attempt in range(self.settings["throttleRetries"] + 1):
+            limit = self.limiter.acquire() if self.limiter else None
+            reset_connect_time()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                total = time.perf_counter() - start
+                if self.limiter:
+                    self.limiter.release()
+                self._notify(method, url, None, ExchangeTiming(operation, get_connect_time(), total, total, 0, 0, limit), e)
+                raise
+            total = time.perf_counter() - start
+
+            request_body = response.request.body
+            # Measured by the connection for the last attempt, the replay adapter has no connection
+            ttfb = get_time_to_first_byte()
+            timing = ExchangeTiming(
+                operation,
+                get_connect_time(),
+                min(ttfb if ttfb is not None else response.elapsed.total_seconds(), total),
+                total,
+                len(request_body) if request_body else 0,
+                _received_bytes(response, kwargs.get("stream")),
+                limit,
+            )
+            throttled = response.status_code in THROTTLE_STATUS_CODES
+            retry_after = None
+            if throttled:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"),
+                                                self.limiter.settings["maxRetryAfter"] if self.limiter else None)
+                if retry_after is None:
+                    retry_after = self.settings["backoffFactor"] * 2 ** attempt
+            limits = self.limiter.release(timing.ttfb, throttled, retry_after, operation) if self.limiter else None
+            self._notify(method, url, response, timing, None)
+
+            if not throttled:
+                return response
+            self._log_throttle(method, url, response.status_code, retry_after, limits)
+            if attempt == self.settings["throttleRetries"]:
+                return response
+            # Gives the connection of a streamed response back to the pool before the next attempt
+            response.close()
+            if not self.limiter:
+                # Without limiter only this request waits
+                time.sleep(retry_after)
+
+    @staticmethod
+    def _log_throttle(method, url, status, retry_after, limits):
+        """Writes a "throttle" event for a 429 or 503 response."""
+        message = f"⚠ Server throttled {method} {url} ({status})"
+        if limits:
+            message += f", concurrency limit {limits[0]} → {limits[1]}"
+        if retry_after is not None:
+            message += f", retry after {retry_after:g} s"
+        log_to_file(message)
+        log_event("throttle", method=method, url=url, status=status, retry_after=retry_after,
+                  limit=limits[1] if limits else None)
+
+    def add_observer(self, observer):
+        """
+        Registers a callable that is informed about every exchange.
+
+        :param observer: Callable taking (method, url, response, ExchangeTiming, error).
+        """
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def _notify(self, method, url, response, timing, error):
+        for observer in self.observers:
+            observer(method, url, response, timing, error)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.session.close()
+
+
+# Singleton instance for easy import
+_http_client = None
+
+
+def get_http_client(settings=None, cassette=None):
+    """
+    Gets or creates the global FhirHttpClient instance.
+
+    :param settings: Optional "http" section of config.json, used on first call.
+    :param cassette: Optional "cassette" section of config.json, used on first call.
+    :return: FhirHttpClient instance.
+    """
+    global _http_client
+
+    if _http_client is None:
+        _http_client = FhirHttpClient(settings, cassette)
+
+    return _http_client
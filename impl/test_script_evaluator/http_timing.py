@@ -0,0 +1,99 @@
+"""
+Timing of single HTTP exchanges: connect, time to first byte, total time and bytes.
+The connect time is measured by the connection classes of the pool, so it is
+only non-zero when a new connection was opened (keep-alive connections are reused).
+The time to first byte is measured per attempt by the connection as well, so
+retries inside urllib3 do not add up in it.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ExchangeTiming(namedtuple("ExchangeTiming", "operation connect ttfb total sent received limit")):
+    """
+    Timing of one HTTP exchange.
+
+    Attributes:
+        operation (str): Label of the exchange, e.g. "create", "transaction" or "delete"
+        connect (float): Seconds spent opening connections, 0 for a reused connection
+        ttfb (float): Seconds from sending the request to the response headers (time to first byte)
+        total (float): Seconds of the whole exchange including the response body
+        sent (int): Bytes of the request body
+        received (int): Bytes of the response body
+        limit (int): Concurrency limit when the request was sent, None without adaptive limiter
+    """
+    __slots__ = ()
+
+
+# Connect time and time to first byte of the request currently sent by this thread
+_connect = threading.local()
+
+
+def reset_connect_time():
+    _connect.seconds = 0.0
+    _connect.ttfb = None
+
+
+def get_connect_time():
+    """:return: Seconds spent opening connections since reset_connect_time() in this thread."""
+    return getattr(_connect, "seconds", 0.0)
+
+
+def get_time_to_first_byte():
+    """
+    :return: Seconds from sending the last request of this thread to its response headers,
+        None if no request went through a timed connection since reset_connect_time().
+    """
+    return getattr(_connect, "ttfb", None)
+
+
+class _TimedConnectionMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect.seconds = get_connect_time() + time.perf_counter() - start
+
+    def request(self, *args, **kwargs):
+        self._request_start = time.perf_counter()
+        return super().request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        _connect.ttfb = time.perf_counter() - self._request_start
+        return response
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Pooled adapter whose connections measure the time needed to connect (including TLS).
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
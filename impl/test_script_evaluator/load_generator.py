@@ -0,0 +1,363 @@
+"""
+Load generation with the TestScripts of the runner.
+The selected TestScripts run repeatedly through run_testscript, so every request is
+sent with the same semantics as in a conformance run (execute_operation, fixtures, teardown).
+
+Two ways of scheduling:
+  - fixed concurrency (closed loop): N workers start the next iteration as soon as
+    their previous one has finished
+  - fixed rate (open loop): iterations are started at fixed times derived from the target
+    requests per second, independent of how fast the server answers. Latencies of whole
+    iterations are measured from the scheduled start, so queueing behind a slow server is
+    included (no coordinated omission)
+
+Fixtures are not shared between iterations (see fixture_manager), every iteration
+creates and deletes its own fixtures like a single run of the TestScript.
+
+The run ends after a duration or a number of iterations. The latencies of the HTTP
+exchanges are recorded per operation in fixed-memory histograms and reported at the end.
+
+Usage (from impl/test_script_evaluator):
+    python load_generator.py [--config path/to/config.json] [--testscripts ../Test_Scripts/a.json ...]
+                             [--concurrency 8 | --rate 50] [--duration 60 | --iterations 1000]
+
+The defaults are read from "load" in config.json, e.g.
+    "load": {"concurrency": 4, "rate": null, "duration": 60, "iterations": null, "maxInFlight": 64}
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from impl.exception.InvalidTestScriptError import InvalidTestScriptError
+from configuration_manager import ConfigManager
+from execution_context import ExecutionContext
+from execution_plan import OperationStep, compile_testscript
+from fixture_manager import get_fixture_manager
+from http_client import get_http_client
+from log_writer import get_log_writer
+from request_metrics import LatencyHistogram
+from test_script_evaluator_log_to_file import run_testscript
+from utils import RESULTS_DIR, capture_log, flush_log, load_json, load_json_list, log_to_file, set_log_file, timestamp
+
+DEFAULT_SETTINGS = {
+    "concurrency": 4,       # workers of the closed loop
+    "rate": None,           # target requests per second, switches to the open loop
+    "duration": 60,         # seconds
+    "iterations": None,     # number of TestScript runs, ends the run before the duration
+    "maxInFlight": 64,      # open loop: iterations running at the same time, later ones wait
+}
+
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Scenario:
+    """
+    TestScript prepared for repeated runs.
+
+    Attributes:
+        path (str): Path of the TestScript relative to impl/
+        testscript (dict): The TestScript resource
+        resources (list): Example instances used as fixtures or None
+        plan (ScriptPlan): Compiled TestScript, compiled once for all iterations
+        requests (int): Estimated number of requests of one iteration
+    """
+
+    def __init__(self, path, testscript, resources, plan, requests):
+        self.path = path
+        self.testscript = testscript
+        self.resources = resources
+        self.plan = plan
+        self.requests = requests
+
+
+def estimate_requests(plan, config_manager):
+    """
+    Estimates the requests of one iteration, used to turn the target rate into iteration starts.
+
+    :param plan: ScriptPlan of the TestScript.
+    :param config_manager: ConfigManager of the run.
+    :return: Number of requests (operations, fixture bundle, teardown, verification reads).
+    """
+    operations = [step for test in plan.tests for step in test.steps if isinstance(step, OperationStep)]
+    requests = len(operations)
+    if config_manager.create_verification == "get":
+        requests += sum(1 for step in operations if step.method == "create")
+    if any(fixture.get("autocreate", True) for fixture in plan.fixtures):
+        requests += 1  # transaction bundle
+    if any(fixture.get("autodelete", False) for fixture in plan.fixtures):
+        requests += 1  # batch delete
+    return max(1, requests)
+
+
+class OperationHistograms:
+    """
+    Observer of the HTTP client, records the latency of every exchange per operation.
+
+    Attributes:
+        histograms (dict): Operation -> LatencyHistogram
+        errors (dict): Operation -> number of failed exchanges (no response or status 5xx)
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, operation):
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(operation, LatencyHistogram())
+        return histogram
+
+    def __call__(self, method, url, response, timing, error):
+        self._histogram(timing.operation).record(timing.total)
+        if error is not None or response.status_code >= 500:
+            with self._lock:
+                self.errors[timing.operation] = self.errors.get(timing.operation, 0) + 1
+
+    @property
+    def requests(self):
+        return sum(histogram.count for histogram in self.histograms.values())
+
+
+class LoadRun:
+    """
+    Runs the scenarios repeatedly and collects the results.
+
+    Attributes:
+        scenarios (list): Scenario per selected TestScript, run in turns
+        config_manager (ConfigManager): Configuration of the run
+        http_client (FhirHttpClient): Client shared by all iterations
+        iterations (LatencyHistogram): Latency of whole iterations
+        passed (int): Iterations in which every test passed
+        failed (int): Iterations with failed tests
+        aborted (int): Iterations that raised an exception
+    """
+
+    def __init__(self, scenarios, config_manager, http_client):
+        self.scenarios = scenarios
+        self.config_manager = config_manager
+        self.http_client = http_client
+        self.iterations = LatencyHistogram(max_seconds=600.0)
+        self.passed = 0
+        self.failed = 0
+        self.aborted = 0
+        self._next_scenario = itertools.cycle(scenarios)
+        self._lock = threading.Lock()
+
+    def next_scenario(self):
+        with self._lock:
+            return next(self._next_scenario)
+
+    def run_iteration(self, scenario, scheduled=None):
+        """
+        Runs one TestScript, its log output is discarded.
+
+        :param scenario: Scenario to run.
+        :param scheduled: perf_counter time the iteration was scheduled for (open loop) or None.
+        """
+        start = scheduled if scheduled is not None else time.perf_counter()
+        context = ExecutionContext(self.config_manager, self.http_client)
+        try:
+            with capture_log():
+                results = run_testscript(context, scenario.testscript, scenario.resources, scenario.plan)
+            outcome = "passed" if all(passed for _, passed in results) else "failed"
+        except Exception as e:
+            log_to_file(f"✗ ITERATION ABORTED: {scenario.path} - {str(e)}")
+            outcome = "aborted"
+        self.iterations.record(time.perf_counter() - start)
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    @property
+    def completed(self):
+        return self.passed + self.failed + self.aborted
+
+    def run_closed_loop(self, concurrency, deadline, iterations=None):
+        """
+        Runs concurrency workers, each starts the next iteration when the previous one has finished.
+
+        :param concurrency: Number of workers.
+        :param deadline: perf_counter time the run ends.
+        :param iterations: Optional total number of iterations.
+        """
+        started = itertools.count()
+
+        def worker():
+            while time.perf_counter() < deadline:
+                if iterations is not None and next(started) >= iterations:
+                    return
+                self.run_iteration(self.next_scenario())
+
+        threads = [threading.Thread(target=worker, name=f"load-{index}") for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open_loop(self, rate, deadline, iterations=None, max_in_flight=64):
+        """
+        Starts iterations at fixed times so that the target request rate is reached,
+        independent of the response times of the server.
+
+        :param rate: Target requests per second.
+        :param deadline: perf_counter time after which no iteration is started.
+        :param iterations: Optional total number of iterations.
+        :param max_in_flight: Iterations running at the same time, later ones wait for a worker.
+        """
+        # Iterations per second, from the average number of requests of the scenarios
+        requests_per_iteration = sum(scenario.requests for scenario in self.scenarios) / len(self.scenarios)
+        interval = requests_per_iteration / rate
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="load") as pool:
+            for index in itertools.count():
+                if iterations is not None and index >= iterations:
+                    break
+                scheduled = start + index * interval
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.run_iteration, self.next_scenario(), scheduled)
+
+
+def load_scenarios(pairs, config_manager):
+    """
+    Loads and compiles the selected TestScripts, invalid TestScripts are skipped.
+
+    :param pairs: List of (testscript path, list of example instance paths).
+    :param config_manager: ConfigManager of the run.
+    :return: List of Scenario.
+    """
+    scenarios = []
+    for testscript_path, resource_paths in pairs:
+        testscript = load_json(testscript_path)
+        try:
+            plan = compile_testscript(testscript)
+        except InvalidTestScriptError as e:
+            print(f"✗ Skipped {testscript_path}: {e}")
+            continue
+        # Private copies of all fixtures, shared ones would only be created by the first iteration
+        plan = plan._replace(modified_ids=frozenset(fixture.get("id") for fixture in plan.fixtures))
+        resources = load_json_list(resource_paths) if resource_paths else None
+        scenarios.append(Scenario(testscript_path, testscript, resources, plan, estimate_requests(plan, config_manager)))
+    return scenarios
+
+
+def report(load_run, histograms, elapsed, settings, limiter=None):
+    """
+    Prints the latency percentiles per operation and writes them to Results/load_<timestamp>.json.
+
+    :param limiter: AdaptiveConcurrencyLimiter of the HTTP client or None, its final limit is reported.
+    :return: Path of the JSON report.
+    """
+    print(f"{load_run.completed} iterations in {elapsed:.1f} s: {load_run.passed} passed, "
+          f"{load_run.failed} failed, {load_run.aborted} aborted")
+    print(f"{histograms.requests} requests, {histograms.requests / elapsed:.1f} requests/s")
+    header = "".join(f"{f'p{percent:g}':>10}" for percent in REPORT_PERCENTILES)
+    print(f"{'operation':<16}{'count':>8}{header}{'max':>10}{'errors':>8}   (ms)")
+    rows = sorted(histograms.histograms.items()) + [("(iteration)", load_run.iterations)]
+    for operation, histogram in rows:
+        if not histogram.count:
+            continue
+        values = "".join(f"{histogram.percentile(percent) * 1000:>10.1f}" for percent in REPORT_PERCENTILES)
+        print(f"{operation:<16}{histogram.count:>8}{values}{histogram.max * 1000:>10.1f}"
+              f"{histograms.errors.get(operation, 0):>8}")
+    if limiter:
+        print(f"Concurrency limit {int(limiter.limit)} at the end, {limiter.throttles} throttled responses")
+
+    result = {
+        "settings": settings,
+        "elapsedSeconds": round(elapsed, 3),
+        "iterations": {"passed": load_run.passed, "failed": load_run.failed, "aborted": load_run.aborted,
+                       "latency": load_run.iterations.to_json(REPORT_PERCENTILES)},
+        "requestsPerSecond": round(histograms.requests / elapsed, 2),
+        "operations": {operation: dict(histogram.to_json(REPORT_PERCENTILES), errors=histograms.errors.get(operation, 0))
+                       for operation, histogram in sorted(histograms.histograms.items())},
+        "concurrencyLimit": int(limiter.limit) if limiter else None,
+        "throttleEvents": limiter.throttles if limiter else 0,
+    }
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RESULTS_DIR / f"load_{timestamp}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs FHIR TestScripts repeatedly to put load on the server.")
+    parser.add_argument("--config", default=None, help="Path to config.json")
+    parser.add_argument("--testscripts", nargs="+", default=None, help="TestScripts to run, default from config.json")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=None, help="Workers of the closed loop")
+    mode.add_argument("--rate", type=float, default=None, help="Target requests per second (open loop)")
+    parser.add_argument("--duration", type=float, default=None, help="Duration of the run in seconds")
+    parser.add_argument("--iterations", type=int, default=None, help="Number of TestScript runs")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Open loop: iterations running at the same time")
+    args = parser.parse_args(argv)
+
+    config_manager = ConfigManager(args.config)
+    if not config_manager.has_fhir_server():
+        print("✗ No FHIR server configured")
+        return 1
+
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config_manager.load)
+    if args.concurrency is not None:
+        settings.update(concurrency=args.concurrency, rate=None)
+    if args.rate is not None:
+        settings["rate"] = args.rate
+    if args.iterations is not None:
+        settings.update(iterations=args.iterations, duration=args.duration)
+    elif args.duration is not None:
+        settings.update(duration=args.duration, iterations=None)
+    if args.max_in_flight is not None:
+        settings["maxInFlight"] = args.max_in_flight
+
+    # The iterations log into their own file, their output is discarded
+    get_log_writer().echo = False
+    set_log_file(f"load_{timestamp}.txt")
+
+    if args.testscripts:
+        paths = [path.replace("../", "") for path in args.testscripts]
+        pairs = [(path, config_manager.get_fixture_paths(load_json(path))) for path in paths]
+    else:
+        pairs = config_manager.get_testscripts_from_config()
+    scenarios = load_scenarios(pairs, config_manager)
+    if not scenarios:
+        print("✗ No TestScripts to run")
+        return 1
+
+    workers = settings["maxInFlight"] if settings["rate"] else settings["concurrency"]
+    http_settings = dict(config_manager.http)
+    http_settings["poolMaxsize"] = max(http_settings.get("poolMaxsize", 10), workers)
+    http_client = get_http_client(http_settings, config_manager.cassette)
+    histograms = OperationHistograms()
+    http_client.add_observer(histograms)
+
+    load_run = LoadRun(scenarios, config_manager, http_client)
+    duration = settings["duration"]
+    start = time.perf_counter()
+    deadline = start + duration if duration else float("inf")
+    if settings["rate"]:
+        print(f"Open loop: {settings['rate']} requests/s over {len(scenarios)} TestScripts")
+        load_run.run_open_loop(settings["rate"], deadline, settings["iterations"], settings["maxInFlight"])
+    else:
+        print(f"Closed loop: {settings['concurrency']} workers over {len(scenarios)} TestScripts")
+        load_run.run_closed_loop(settings["concurrency"], deadline, settings["iterations"])
+    elapsed = time.perf_counter() - start
+
+    get_fixture_manager().close(http_client)
+    flush_log(wait=True)
+    print(f"Report written to {report(load_run, histograms, elapsed, settings, http_client.limiter)}")
+    return 0 if load_run.failed == load_run.aborted == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+"""
+Buffered log writer running on a background thread.
+Log calls only put the message into a queue, the writer thread batches
+the messages, keeps the log files open and prints them to the console.
+"""
+import atexit
+import os
+import queue
+import sys
+import threading
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class BackgroundLogWriter:
+    """
+    Queue-backed writer for log files.
+
+    Attributes:
+        batch_size (int): Maximum number of queued entries handled in one batch
+        echo (bool): Print every message to the console as well
+    """
+
+    def __init__(self, batch_size=512, echo=True):
+        """
+        Initializes the writer and starts the background thread.
+
+        :param batch_size: Maximum number of queued entries handled in one batch.
+        :param echo: Print every message to the console as well.
+        """
+        self.batch_size = batch_size
+        self.echo = echo
+        self._queue = queue.SimpleQueue()
+        self._files = {}  # path -> open file handle
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, path, text, echo=None):
+        """
+        Queues text to be appended to a file. Never blocks.
+
+        :param path: Path of the log file.
+        :param text: Text to append, including the line break.
+        :param echo: Optional console output for this entry, None prints nothing.
+        """
+        self._queue.put((path, text, echo))
+
+    def write_console(self, message):
+        """
+        Queues a message that is only printed to the console.
+
+        :param message: Message to print.
+        """
+        self._queue.put((None, None, message))
+
+    def call(self, function, *args):
+        """
+        Queues a function call that is executed on the writer thread in order with the writes.
+        Used for formats that are not plain text, e.g. adding a cell to a PDF.
+
+        :param function: Function to call.
+        :param args: Arguments of the call.
+        """
+        self._queue.put((function, args, None))
+
+    def flush(self, wait=False, timeout=None):
+        """
+        Writes everything queued so far to disk.
+
+        :param wait: Block until the data is written (only at the end of a run).
+        :param timeout: Maximum number of seconds to wait.
+        """
+        done = threading.Event()
+        self._queue.put((_FLUSH, done, None))
+        if wait:
+            done.wait(timeout)
+
+    def close(self, timeout=10):
+        """Drains the queue, closes all files and stops the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        done = threading.Event()
+        self._queue.put((_CLOSE, done, None))
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._process(batch):
+                return
+
+    def _process(self, batch):
+        """
+        Handles one batch of queued entries.
+
+        :param batch: List of (target, payload, echo) entries.
+        :return: False if the writer was closed, True otherwise.
+        """
+        console = []
+        for target, payload, echo in batch:
+            if target is _FLUSH or target is _CLOSE:
+                self._write_console(console)
+                console = []
+                for handle in self._files.values():
+                    handle.flush()
+                if target is _CLOSE:
+                    for handle in self._files.values():
+                        handle.close()
+                    self._files.clear()
+                    payload.set()
+                    return False
+                payload.set()
+            elif callable(target):
+                try:
+                    target(*payload)
+                except Exception as e:
+                    console.append(f"Log writer error: {e}")
+            else:
+                if target is not None:
+                    try:
+                        self._get_file(target).write(payload)
+                    except OSError as e:
+                        console.append(f"Log writer error: {e}")
+                if echo is not None and self.echo:
+                    console.append(echo)
+
+        self._write_console(console)
+        return True
+
+    def _get_file(self, path):
+        handle = self._files.get(path)
+        if handle is None:
+            handle = open(path, "a", encoding="utf-8")
+            self._files[path] = handle
+        return handle
+
+    @staticmethod
+    def _write_console(lines):
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+
+
+# Singleton instance for easy import
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """
+    Gets or creates the global BackgroundLogWriter instance.
+
+    :return: BackgroundLogWriter instance.
+    """
+    global _log_writer
+
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = BackgroundLogWriter()
+
+    return _log_writer
+
+
+def _reset_after_fork():
+    """The writer thread does not survive a fork, worker processes start their own writer."""
+    global _log_writer, _log_writer_lock
+    _log_writer = None
+    _log_writer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,21 +1,27 @@
 from datetime import datetime
-from fpdf import FPDF
+import html
 import os
 
+from log_writer import get_log_writer
+
 
 class Logger:
-    def __init__(self, log_format="txt", output_dir="Results"):
+    def __init__(self, log_format="txt", output_dir="Results", filename=None, echo=True):
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         self.log_format = log_format.lower()
-        self.messages = []
+        self.echo = echo
+        self.writer = get_log_writer()
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        filename = f"test_results_{timestamp}.{self.log_format}"
-        self.file_path = os.path.join(output_dir, filename)
+        if filename is None:
+            filename = f"test_results_{timestamp}"
+        self.file_path = os.path.join(output_dir, f"{filename}.{self.log_format}")
 
         if self.log_format == "pdf":
+            from fpdf import FPDF  # only needed for PDF reports
+
             self.pdf = FPDF()
             self.pdf.add_page()
             self.pdf.set_font("Arial", size=12)
@@ -29,23 +35,29 @@ class Logger:
                 f.write(f"FHIR Test Log - {datetime.now()}\n\n")
 
     def log(self, message):
-        print(message)
-        self.messages.append(message)
+        # Only queued here, the background writer prints and writes the message.
+        # Messages are not kept in memory, reports are rendered from the event stream.
+        echo = message if self.echo else None
 
         if self.log_format == "pdf":
-            self.pdf.multi_cell(0, 10, message)
+            # The core fonts of FPDF only support latin-1
+            self.writer.call(self.pdf.multi_cell, 0, 10, message.encode("latin-1", "replace").decode("latin-1"))
+            if echo is not None:
+                self.writer.write_console(echo)
 
         elif self.log_format == "html":
-            with open(self.file_path, "a", encoding="utf-8") as f:
-                f.write(f"<p>{message}</p>\n")
+            self.writer.write(self.file_path, f"<p>{html.escape(message)}</p>\n", echo=echo)
 
         elif self.log_format == "txt":
-            with open(self.file_path, "a", encoding="utf-8") as f:
-                f.write(message + "\n")
+            self.writer.write(self.file_path, message + "\n", echo=echo)
+
+    def flush(self):
+        """Flushes queued messages, called at test boundaries."""
+        self.writer.flush()
 
     def close(self):
         if self.log_format == "pdf":
-            self.pdf.output(self.file_path)
+            self.writer.call(self.pdf.output, self.file_path)
         elif self.log_format == "html":
-            with open(self.file_path, "a", encoding="utf-8") as f:
-                f.write("</body></html>")
+            self.writer.write(self.file_path, "</body></html>")
+        self.writer.flush(wait=True)
@@ -0,0 +1,147 @@
+"""
+Lazy paging over the result Bundles of search and history operations.
+Only the current page is kept in memory, the next page is requested
+when the previous one has been consumed (Bundle.link with relation "next").
+"""
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from utils import log_to_file, response_json
+
+
+def next_link(bundle):
+    """
+    :param bundle: Bundle dictionary of one page.
+    :return: URL of the next page or None on the last page.
+    """
+    for link in bundle.get("link", []):
+        if link.get("relation") == "next" and link.get("url"):
+            return link["url"]
+    return None
+
+
+class PagedResponse:
+    """
+    Response of a search or history operation.
+    Status code and headers are the ones of the first page, so responseCode,
+    contentType and headerField assertions work as for any other response.
+    The body is read page by page with pages().
+
+    Attributes:
+        first (requests.Response): Response of the first page
+        request_headers (dict): Request headers repeated for the following pages
+        page_limit (int): Maximum number of pages read, None reads all pages
+        page_checks (list): PageChecks of the assertions after the operation, run in one walk
+        page_errors (dict): PageCheck -> AssertionError of its first failing page or None
+    """
+
+    def __init__(self, http_client, first, request_headers=None, page_limit=None):
+        """
+        :param http_client: Client used to request the following pages.
+        :param first: HTTP response of the first page.
+        :param request_headers: Request headers repeated for the following pages.
+        :param page_limit: Maximum number of pages read, None reads all pages.
+        """
+        self.http_client = http_client
+        self.first = first
+        self.request_headers = request_headers or {}
+        self.page_limit = page_limit
+        self.page_checks = []
+        self.page_errors = {}
+
+    @property
+    def status_code(self):
+        return self.first.status_code
+
+    @property
+    def headers(self):
+        return self.first.headers
+
+    @property
+    def content(self):
+        return self.first.content
+
+    def json(self):
+        """:return: Bundle of the first page."""
+        return response_json(self.first)
+
+    def pages(self):
+        """
+        Yields the Bundle of every page, the next page is only requested
+        when the previous one has been consumed.
+
+        :return: Generator of Bundle dictionaries.
+        :raises AssertionError: If a following page can not be read.
+        """
+        bundle = response_json(self.first)
+        page_number = 1
+        while isinstance(bundle, dict):
+            yield bundle
+            url = next_link(bundle)
+            if url is None:
+                return
+            if self.page_limit is not None and page_number >= self.page_limit:
+                log_to_file(f"Page limit of {self.page_limit} reached, remaining pages are not read")
+                return
+
+            page_number += 1
+            response = self.http_client.get(urljoin(self.first.url, url), headers=self.request_headers, operation="page")
+            assert response.ok, f"Page {page_number} of the search could not be read: {response.status_code}"
+            # Not parsed with response_json, the page must not be kept on the response
+            bundle = response.json() if response.content else None
+
+    def check_pages(self, context, check):
+        """
+        Runs a check and all page_checks that did not run yet in a single walk over the pages,
+        so the pages are requested once however many assertions follow the operation.
+        A check stops at its first failing page, the walk stops when all checks failed.
+
+        :param context: ExecutionContext passed to the checks.
+        :param check: PageCheck whose result is needed.
+        :return: None, the results are kept in page_errors.
+        """
+        if check in self.page_errors:
+            return
+        pending = [item for item in dict.fromkeys([check] + self.page_checks) if item not in self.page_errors]
+        errors = dict.fromkeys(pending)
+        try:
+            for page_number, page in enumerate(self.pages(), 1):
+                for item in pending:
+                    if errors[item] is None:
+                        try:
+                            item.check(context, page)
+                        except AssertionError as e:
+                            errors[item] = AssertionError(f"Page {page_number}: {e}")
+                if all(error is not None for error in errors.values()):
+                    break
+        except AssertionError as e:
+            # A following page could not be read, the checks that passed so far fail
+            for item in pending:
+                if errors[item] is None:
+                    errors[item] = e
+        self.page_errors.update(errors)
+
+
+class PageCheck(namedtuple("PageCheck", "check source")):
+    """
+    Check of an assertion on the resource of a response. Search and history results
+    are checked page by page, all page checks of the assertions after an operation
+    share one walk over the pages (see PagedResponse.check_pages).
+
+    Attributes:
+        check (callable): check(context, resource) raising AssertionError on failure,
+            resource is a response, a resource or the Bundle of one page
+        source (callable): source(context, response, resource) selecting what is checked
+    """
+    __slots__ = ()
+
+    def __call__(self, context, response, resource):
+        source = self.source(context, response, resource)
+        if not isinstance(source, PagedResponse):
+            self.check(context, source)
+            return
+
+        source.check_pages(context, self)
+        error = source.page_errors[self]
+        if error is not None:
+            raise error
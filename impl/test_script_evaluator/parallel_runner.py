@@ -0,0 +1,154 @@
+"""
+Standalone runner that spreads TestScripts across a pool of worker processes.
+Every TestScript runs with its own ExecutionContext, the results are merged
+into one summary in the log file of the main process.
+With --changed-only only the TestScripts affected since the last run are run, see run_state.py.
+
+Usage (from impl/test_script_evaluator):
+    python parallel_runner.py [--workers N] [--changed-only] [--config path/to/config.json]
+"""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing.util import Finalize
+
+from configuration_manager import ConfigManager
+from execution_context import ExecutionContext
+from fixture_manager import get_fixture_manager
+from http_client import get_http_client
+from report_renderer import render_report_in_background
+from request_metrics import export_request_metrics
+from run_state import get_run_state, run_state_mode, select_changed
+from test_script_evaluator_log_to_file import run_testscript
+from utils import *
+
+
+def _init_worker(log_name, config_path=None):
+    """
+    Gives every worker process its own log file next to the log file of the main process.
+    The fixtures shared by the TestScripts of the worker are deleted when it exits.
+
+    :param log_name: Name of the log file of the main process without extension. Passed in,
+        since workers started with spawn or forkserver import utils again and get their own timestamp.
+    :param config_path: Optional path to config.json.
+    """
+    set_log_file(f"{log_name}_worker-{os.getpid()}.txt")
+    Finalize(None, _close_shared_fixtures, args=(config_path,), exitpriority=10)
+
+
+def _close_shared_fixtures(config_path=None):
+    """Deletes the shared fixtures of a worker process when it exits."""
+    try:
+        config_manager = ConfigManager(config_path)
+        get_fixture_manager().close(get_http_client(config_manager.http, config_manager.cassette))
+    finally:
+        flush_log(wait=True)
+
+
+def run_testscript_pair(pair, config_path=None):
+    """
+    Runs one TestScript inside a worker process.
+
+    :param pair: Tuple of (testscript path, list of example instance paths).
+    :param config_path: Optional path to config.json.
+    :return: Tuple of (testscript path, list of (test name, passed), error message or None).
+    """
+    testscript_path, resource_paths = pair
+    context = ExecutionContext(ConfigManager(config_path))
+
+    try:
+        testscript = load_json(testscript_path)
+        resources = load_json_list(resource_paths)
+        return testscript_path, run_testscript(context, testscript, resources), None
+    except Exception as e:
+        log_to_file(f"✗ TESTSCRIPT ABORTED: {testscript_path} - {str(e)}")
+        return testscript_path, [], str(e)
+    finally:
+        # Worker processes end without running atexit handlers
+        flush_log(wait=True)
+
+
+def log_summary(script_results):
+    """
+    Writes the merged summary of all TestScripts to the log file.
+
+    :param script_results: List of results as returned by run_testscript_pair.
+    :return: True if every test of every TestScript passed, False otherwise.
+    """
+    all_passed = True
+    passed_count = 0
+    failed_count = 0
+
+    log_to_file("======================")
+    log_to_file("Overall Test Summary:")
+    for testscript_path, results, error in script_results:
+        name = os.path.splitext(os.path.basename(testscript_path))[0]
+        log_to_file(f"{name}:")
+        if error:
+            log_to_file(f"  ABORTED: {error}")
+            all_passed = False
+        for test_name, passed in results:
+            status = "PASSED" if passed else "FAILED"
+            log_to_file(f"  {test_name}: {status}")
+            if passed:
+                passed_count += 1
+            else:
+                failed_count += 1
+                all_passed = False
+
+    log_to_file(f"{len(script_results)} TestScripts, {passed_count} tests passed, {failed_count} tests failed")
+    return all_passed
+
+
+def main(argv=None):
+    """
+    Entry point of the parallel runner.
+
+    :param argv: Optional list of command line arguments.
+    :return: Exit code, 0 if all tests passed.
+    """
+    parser = argparse.ArgumentParser(description="Runs FHIR TestScripts in parallel worker processes.")
+    parser.add_argument("--config", default=None, help="Path to config.json")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="Only run TestScripts whose inputs changed or that failed last time")
+    args = parser.parse_args(argv)
+
+    config_manager = ConfigManager(args.config)
+    if not config_manager.has_fhir_server():
+        log_to_file("✗ RUN SKIPPED: No FHIR server configured")
+        return 1
+
+    workers = args.workers or config_manager.workers or os.cpu_count()
+    pairs = config_manager.get_testscripts_from_config()
+    run_state = get_run_state(config_manager.run_state)
+    if args.changed_only or run_state_mode(config_manager.run_state) == "changed-only":
+        pairs = select_changed(run_state, pairs, config_manager.fhir_server)
+    log_to_file(f"Running {len(pairs)} TestScripts with {workers} workers")
+
+    log_name = os.path.splitext(os.path.basename(get_event_file_path()))[0]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(log_name, args.config)) as pool:
+        script_results = list(pool.map(partial(run_testscript_pair, config_path=args.config), pairs))
+
+    all_passed = log_summary(script_results)
+    for (testscript_path, fixture_paths), (_, results, error) in zip(pairs, script_results):
+        run_state.record(testscript_path, fixture_paths, config_manager.fhir_server,
+                         error is None and all(passed for _, passed in results))
+    run_state.save()
+    flush_log(wait=True)
+
+    # The workers write their events next to the event file of the main process
+    worker_events = sorted(glob.glob(os.path.splitext(get_event_file_path())[0] + "_worker-*.jsonl"))
+    export_request_metrics([get_event_file_path()] + worker_events)
+    flush_log(wait=True)
+
+    if config_manager.report_format:
+        render_report_in_background([get_event_file_path()] + worker_events, config_manager.report_format)
+
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""
+Content-addressed cache of parsed JSON files (TestScripts and example instances).
+Files are keyed by the SHA-256 of their bytes. Every content is parsed once per
+process, and the parsed content is kept in .parse_cache/ in marshal format,
+so later runs skip the JSON parsing of unchanged files.
+The parsed objects are shared between all callers and must not be changed.
+"""
+import hashlib
+import json
+import marshal
+import os
+import sys
+import threading
+from pathlib import Path
+
+# marshal is only compatible within one Python version
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".parse_cache" / f"py{sys.version_info[0]}{sys.version_info[1]}"
+
+_MISSING = object()
+
+
+class ParseCache:
+    """
+    Cache of parsed JSON files keyed by the hash of their content.
+
+    Attributes:
+        cache_dir (Path): Folder of the persisted entries, None keeps the cache in memory only
+        hits (int): Number of loads answered without parsing JSON
+        misses (int): Number of loads that parsed JSON
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        """
+        :param cache_dir: Folder of the persisted entries, None keeps the cache in memory only.
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.hits = 0
+        self.misses = 0
+        self._parsed = {}  # content hash -> parsed content
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """
+        Loads a JSON file, parsing it only if its content was not seen before.
+
+        :param path: Path of the JSON file.
+        :return: Parsed content.
+        :raises json.JSONDecodeError: If the file is no valid JSON.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        key = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            parsed = self._parsed.get(key, _MISSING)
+        if parsed is _MISSING:
+            parsed = self._read_entry(key)
+        if parsed is _MISSING:
+            parsed = json.loads(data)
+            self._write_entry(key, parsed)
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        with self._lock:
+            return self._parsed.setdefault(key, parsed)
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.marshal"
+
+    def _read_entry(self, key):
+        if self.cache_dir is None:
+            return _MISSING
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return _MISSING
+
+    def _write_entry(self, key, parsed):
+        if self.cache_dir is None:
+            return
+        path = self._entry_path(key)
+        # Written to a temporary file first, several worker processes may write the same entry
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                marshal.dump(parsed, f)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError) as e:
+            print(f"Could not write parse cache entry {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+# Singleton instance for easy import
+_parse_cache = None
+_parse_cache_lock = threading.Lock()
+
+
+def get_parse_cache():
+    """
+    Gets or creates the ParseCache of this process.
+
+    :return: ParseCache instance.
+    """
+    global _parse_cache
+
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            _parse_cache = ParseCache()
+
+    return _parse_cache
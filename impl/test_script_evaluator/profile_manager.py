@@ -1,36 +1,169 @@
 import json
+import os
 from pathlib import Path
 
+# Index of the Profiles folder, invalidated per file by mtime and size
+INDEX_FILENAME = ".profile_index.json"
+INDEX_VERSION = 1
+
+PROFILES_DIR = Path(__file__).resolve().parent.parent / "Profiles"
+
+
 class ProfileManager:
     def __init__(self):
         self.profiles = []  # List for (name, id)
+        self.by_id = {}  # id -> profile entry
+        self.by_url = {}  # canonical url -> profile entry
+        self.by_url_version = {}  # (canonical url, version) -> profile entry
+        self.by_type = {}  # base type -> list of profile entries
+
+    @staticmethod
+    def _make_entry(profile_data, filename, file_path=None):
+        """
+        Extracts the indexed fields of a StructureDefinition.
+
+        :return: Profile entry dictionary or None if it is no StructureDefinition.
+        """
+        if profile_data.get("resourceType") != "StructureDefinition":
+            return None
+        entry = {
+            "filename": filename,
+            "id": profile_data.get("id"),
+            "url": profile_data.get("url"),
+            "version": profile_data.get("version"),
+            "type": profile_data.get("type"),
+            "baseDefinition": profile_data.get("baseDefinition"),
+        }
+        if file_path is not None:
+            entry["path"] = str(file_path)
+        return entry
 
-    def add_profile(self, profile_data, filename):
+    def _index_entry(self, entry):
+        self.profiles.append((entry["filename"], entry["id"]))
+        self.by_id[entry["id"]] = entry
+        if entry.get("url"):
+            self.by_url[entry["url"]] = entry
+            self.by_url_version[(entry["url"], entry.get("version"))] = entry
+        if entry.get("type"):
+            self.by_type.setdefault(entry["type"], []).append(entry)
+
+    def add_profile(self, profile_data, filename, file_path=None):
         """
         Adds a profile to the list if it has a valid StructureDefinition
         """
-        if profile_data.get("resourceType") == "StructureDefinition":
-            profile_id = profile_data.get("id")
-            self.profiles.append((filename, profile_id))
+        entry = self._make_entry(profile_data, filename, file_path)
+        if entry is not None:
+            self._index_entry(entry)
 
     def make_profile_list(self, folder_path):
         """
         Iterates through all *.json files in the specified folder
-        and saves valid StructureDefinition profiles
+        and saves valid StructureDefinition profiles.
+        Only files that changed since the last run (mtime or size) are parsed,
+        all others are taken from the index file of the folder.
         """
         path = Path(folder_path)
         if not path.exists() or not path.is_dir():
             raise ValueError(f"Folder not found: {folder_path}")
 
-        for file in path.iterdir():
-            if file.is_file():  # Only actual files, not folders
-                try:
-                    with open(file, "r", encoding="utf-8") as f:
-                        data = json.load(f)  # The file will only be accepted as JSON if its content is correct
-                    self.add_profile(data, file.stem)
-                except Exception as e:
-                    print(f"Errors in processing of {file}: {e}")
+        index_path = path / INDEX_FILENAME
+        cached = self._load_index(index_path)
+        index = {}
+
+        with os.scandir(path) as files:
+            for file in files:
+                if not file.is_file() or file.name.startswith("."):  # Only actual files, not folders or index/manifest
+                    continue
+
+                stat = file.stat()
+                entry = cached.get(file.name)
+                if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                    entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "profile": None}
+                    try:
+                        with open(file.path, "r", encoding="utf-8") as f:
+                            data = json.load(f)  # The file will only be accepted as JSON if its content is correct
+                        entry["profile"] = self._make_entry(data, Path(file.name).stem)
+                    except Exception as e:
+                        print(f"Errors in processing of {file.path}: {e}")
+
+                index[file.name] = entry
+                if entry["profile"] is not None:
+                    # The path is not part of the index, so the folder can be moved
+                    self._index_entry(dict(entry["profile"], path=file.path))
+
+        if index != cached:
+            self._save_index(index_path, index)
+
+    @staticmethod
+    def _load_index(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                return data.get("files", {})
+        except (FileNotFoundError, ValueError, AttributeError):
+            pass
+        return {}
+
+    @staticmethod
+    def _save_index(index_path, index):
+        try:
+            with open(index_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "files": index}, f, separators=(",", ":"))
+        except OSError as e:
+            print(f"Could not write profile index {index_path}: {e}")
+
+    def has_profile(self, profile_id):
+        """Returns True if a profile with this id is loaded."""
+        return profile_id in self.by_id
+
+    def get_by_id(self, profile_id):
+        """Returns the profile entry with this id or None."""
+        return self.by_id.get(profile_id)
+
+    def get_by_url(self, url, version=None):
+        """
+        Returns the profile entry of a canonical URL or None.
+        A canonical of the form url|version selects a specific version.
+        """
+        if version is None and "|" in url:
+            url, version = url.split("|", 1)
+        if version is not None:
+            return self.by_url_version.get((url, version))
+        return self.by_url.get(url)
+
+    def get_by_type(self, resource_type):
+        """Returns all profile entries constraining the given base type."""
+        return self.by_type.get(resource_type, [])
+
+    @staticmethod
+    def load_structure_definition(entry):
+        """Loads the full StructureDefinition of a profile entry."""
+        with open(entry["path"], "r", encoding="utf-8") as f:
+            return json.load(f)
 
     def get_profiles(self):
         """Returns the list of saved profiles."""
         return self.profiles
+
+
+# Singleton instance, loaded on first use
+_profile_manager = None
+
+
+def get_profile_manager(folder_path=None):
+    """
+    Gets or creates the global ProfileManager instance.
+    The Profiles folder is only read when the first profile is needed.
+
+    :param folder_path: Optional custom Profiles folder, used on first call.
+    :return: ProfileManager instance.
+    """
+    global _profile_manager
+
+    if _profile_manager is None:
+        profile_manager = ProfileManager()
+        profile_manager.make_profile_list(folder_path or PROFILES_DIR)
+        _profile_manager = profile_manager
+
+    return _profile_manager
@@ -0,0 +1,135 @@
+"""
+Renders txt, html and pdf reports from the JSONL event stream of a run.
+The stream is read line by line after the test execution, so rendering can
+run in a separate process and does not slow down the tests.
+
+Usage (from impl/test_script_evaluator):
+    python report_renderer.py ../Results/test_results_<timestamp>.jsonl --format pdf
+"""
+import argparse
+import json
+import multiprocessing
+import os
+
+from logger import Logger
+
+# Wait for the log writer every N lines, so the queue does not grow with the report size
+FLUSH_INTERVAL = 1000
+
+
+def iter_events(event_path):
+    """
+    Streams the events of a JSONL event file.
+
+    :param event_path: Path of the event file.
+    :return: Generator of event dictionaries.
+    """
+    with open(event_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def format_event(event):
+    """
+    Formats one event as a report line.
+
+    :param event: Event dictionary.
+    :return: Report line or None if the event is not part of the report.
+    """
+    event_type = event.get("type")
+
+    if event_type == "testscript_start":
+        return f"\n=========== Starting Testscript: {event.get('testscript')} ==========="
+    if event_type == "test_start":
+        return f"\n ----------- Starting Test: {event.get('test')} -----------"
+    if event_type == "action":
+        return f"Executing: {event.get('operation', '').upper()} {event.get('url', '')}"
+    if event_type == "http":
+        if "error" in event:
+            return f"  {event.get('method')} {event.get('url')} failed after {event.get('ms')} ms: {event['error']}"
+        return (f"  {event.get('method')} {event.get('url')} -> {event.get('status')} "
+                f"({event.get('ms')} ms, {event.get('sent', 0)} B sent, {event.get('received', 0)} B received)")
+    if event_type == "throttle":
+        limit = f", concurrency limit {event['limit']}" if event.get("limit") is not None else ""
+        retry_after = f", retry after {event['retry_after']:g} s" if event.get("retry_after") is not None else ""
+        return f"⚠ Server throttled {event.get('method')} {event.get('url')} ({event.get('status')}){limit}{retry_after}"
+    if event_type == "assertion":
+        if event.get("passed"):
+            return f"✓ Assertion passed: {event.get('kind')}"
+        return f"✗ ASSERTION FAILED: {event.get('message')}"
+    if event_type == "test_end":
+        if event.get("stopped"):
+            return f"✗ TEST STOPPED: {event.get('test')} - {event['stopped']}"
+        status = "PASSED" if event.get("passed") else "FAILED"
+        return f"{'✓' if event.get('passed') else '✗'} TEST {status}: {event.get('test')}"
+    if event_type == "teardown":
+        lines = [f"Teardown: removed {len(event.get('removed', []))} fixtures {event.get('removed', [])}"]
+        lines += [f"✗ Teardown: could not delete {reference} ({status})" for reference, status in event.get("failed", {}).items()]
+        return "\n".join(lines) if event.get("removed") or event.get("failed") else None
+    if event_type == "testscript_end":
+        return f"Test Summary: {event.get('passed', 0)} passed, {event.get('failed', 0)} failed"
+    return None
+
+
+def render_report(event_paths, log_format="txt", output_dir=None):
+    """
+    Renders one report from one or more event files.
+
+    :param event_paths: Path or list of paths of event files, rendered in this order.
+    :param log_format: "txt", "html" or "pdf".
+    :param output_dir: Directory of the report, defaults to the directory of the first event file.
+    :return: Path of the rendered report.
+    """
+    if isinstance(event_paths, str):
+        event_paths = [event_paths]
+
+    first_path = os.path.abspath(event_paths[0])
+    output_dir = output_dir or os.path.dirname(first_path)
+    filename = os.path.splitext(os.path.basename(first_path))[0].replace("test_results", "report", 1)
+    logger = Logger(log_format, output_dir, filename=filename, echo=False)
+
+    count = 0
+    for event_path in event_paths:
+        if not os.path.exists(event_path):
+            continue
+        for event in iter_events(event_path):
+            line = format_event(event)
+            if line is None:
+                continue
+            logger.log(line)
+            count += 1
+            if count % FLUSH_INTERVAL == 0:
+                logger.writer.flush(wait=True)
+
+    logger.close()
+    return logger.file_path
+
+
+def render_report_in_background(event_paths, log_format):
+    """
+    Renders a report in a separate process.
+
+    :param event_paths: Path or list of paths of event files.
+    :param log_format: "txt", "html" or "pdf".
+    :return: The started process.
+    """
+    process = multiprocessing.Process(target=render_report, args=(event_paths, log_format), name="report-renderer")
+    process.start()
+    return process
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Renders a report from FHIR test event streams.")
+    parser.add_argument("events", nargs="+", help="JSONL event files")
+    parser.add_argument("--format", default="txt", choices=["txt", "html", "pdf"], help="Report format")
+    parser.add_argument("--output-dir", default=None, help="Directory of the report")
+    args = parser.parse_args(argv)
+
+    print(f"Report written to {render_report(args.events, args.format, args.output_dir)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,374 @@
+"""
+Aggregates the timings of all HTTP exchanges of a run by operation, resource type
+and TestScript. The timings are read from the "http" events of the JSONL event
+streams after the run (one stream per worker process), so collecting them costs
+nothing while the tests run.
+
+The aggregates are logged as part of the test summary and exported as an
+OpenMetrics text file and as JSON next to the log files, together with the
+throttled responses and the limit of the adaptive concurrency limiter:
+    Results/metrics_<timestamp>.prom
+    Results/metrics_<timestamp>.json
+
+Usage (from impl/test_script_evaluator):
+    python request_metrics.py ../Results/test_results_<timestamp>*.jsonl
+"""
+import argparse
+import json
+import os
+import threading
+
+from report_renderer import iter_events
+from utils import flush_log, log_to_file
+
+PERCENTILES = (50, 95, 99)
+
+# Label of exchanges outside of a TestScript, e.g. deleting the shared fixtures at the end of the run
+RUN_LABEL = "(run)"
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class LatencyHistogram:
+    """
+    Fixed-memory histogram of latencies with log-linear buckets (as in HdrHistogram).
+    Values below 2 * sub_buckets units are counted exactly, above that every power of two
+    is split into sub_buckets buckets, so the relative error is at most 1 / sub_buckets.
+    The memory does not grow with the number of recorded values.
+
+    Attributes:
+        unit (float): Resolution in seconds
+        sub_buckets (int): Buckets per power of two, a power of two itself
+        counts (list): Number of values per bucket
+        count (int): Number of recorded values
+    """
+
+    def __init__(self, max_seconds=60.0, unit=1e-5, sub_buckets=32):
+        """
+        :param max_seconds: Highest value kept exactly, larger values are counted in the last bucket.
+        :param unit: Resolution in seconds, default 10 µs.
+        :param sub_buckets: Buckets per power of two, a power of two.
+        """
+        self.unit = unit
+        self.sub_buckets = sub_buckets
+        self._sub_bits = sub_buckets.bit_length() - 1
+        self.counts = [0] * (self._index(int(max_seconds / unit)) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def _index(self, units):
+        if units < 2 * self.sub_buckets:
+            return units
+        shift = units.bit_length() - self._sub_bits - 1
+        return 2 * self.sub_buckets + (shift - 1) * self.sub_buckets + (units >> shift) - self.sub_buckets
+
+    def _upper_bound(self, index):
+        """:return: Highest value of a bucket in seconds."""
+        if index < 2 * self.sub_buckets:
+            return index * self.unit
+        shift, offset = divmod(index - 2 * self.sub_buckets, self.sub_buckets)
+        return (((offset + self.sub_buckets + 1) << (shift + 1)) - 1) * self.unit
+
+    def record(self, seconds):
+        """Records one latency in seconds."""
+        index = min(self._index(max(0, int(seconds / self.unit))), len(self.counts) - 1)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other):
+        """Adds the values of a histogram with the same layout."""
+        with self._lock:
+            self.counts = [own + theirs for own, theirs in zip(self.counts, other.counts)]
+            self.count += other.count
+            self.sum += other.sum
+            for value in (other.min, other.max):
+                if value is not None:
+                    self.min = value if self.min is None else min(self.min, value)
+                    self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        :param percent: Percentile between 0 and 100.
+        :return: Highest value of the bucket holding the percentile in seconds (within the recorded range).
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(max(self._upper_bound(index), self.min), self.max)
+        return self.max
+
+    def to_json(self, percentiles=(50, 90, 95, 99, 99.9)):
+        """
+        :return: Dictionary with count, mean, min, max and percentiles in milliseconds
+                 and the non-empty buckets (upper bound in ms -> count).
+        """
+        if not self.count:
+            return {"count": 0}
+        result = {
+            "count": self.count,
+            "meanMs": round(self.sum / self.count * 1000, 3),
+            "minMs": round(self.min * 1000, 3),
+            "maxMs": round(self.max * 1000, 3),
+        }
+        result.update({f"p{percent:g}Ms": round(self.percentile(percent) * 1000, 3) for percent in percentiles})
+        result["buckets"] = {f"{self._upper_bound(index) * 1000:g}": bucket_count
+                             for index, bucket_count in enumerate(self.counts) if bucket_count}
+        return result
+
+
+class _Series:
+    """Timings of the exchanges of one group."""
+
+    def __init__(self):
+        self.total = []
+        self.ttfb = []
+        self.connect = []
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+    def add(self, event):
+        self.total.append(event.get("ms", 0) / 1000)
+        self.ttfb.append(event.get("ttfb_ms", 0) / 1000)
+        self.connect.append(event.get("connect_ms", 0) / 1000)
+        self.sent += event.get("sent", 0)
+        self.received += event.get("received", 0)
+        if "error" in event or event.get("status", 0) >= 500:
+            self.errors += 1
+
+    def merge(self, other):
+        self.total += other.total
+        self.ttfb += other.ttfb
+        self.connect += other.connect
+        self.sent += other.sent
+        self.received += other.received
+        self.errors += other.errors
+
+    def stats(self, values):
+        """:return: Dictionary with percentiles, mean and max in milliseconds."""
+        values = sorted(values)
+        if not values:
+            return {}
+        stats = {f"p{percent}": round(percentile(values, percent) * 1000, 2) for percent in PERCENTILES}
+        stats["mean"] = round(sum(values) / len(values) * 1000, 2)
+        stats["max"] = round(values[-1] * 1000, 2)
+        return stats
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class RequestMetrics:
+    """
+    Timings of the HTTP exchanges of a run.
+
+    Attributes:
+        groups (dict): (testscript, operation, resource type) -> timings of these exchanges
+        throttles (dict): TestScript -> number of throttled responses (429, 503)
+        limits (list): Concurrency limits the exchanges were sent with, empty without adaptive limiter
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.throttles = {}
+        self.limits = []
+
+    def add_event_file(self, event_path):
+        """
+        Adds the "http" events of one event stream. The TestScript of an exchange
+        is the one between the enclosing testscript_start and testscript_end events.
+
+        :param event_path: Path of the JSONL event file.
+        """
+        testscript = RUN_LABEL
+        for event in iter_events(event_path):
+            event_type = event.get("type")
+            if event_type == "testscript_start":
+                testscript = event.get("testscript") or RUN_LABEL
+            elif event_type == "testscript_end":
+                testscript = RUN_LABEL
+            elif event_type == "http":
+                key = (testscript, event.get("operation") or event.get("method", "").lower(), event.get("resource", ""))
+                self.groups.setdefault(key, _Series()).add(event)
+                if event.get("limit") is not None:
+                    self.limits.append(event["limit"])
+            elif event_type == "throttle":
+                self.throttles[testscript] = self.throttles.get(testscript, 0) + 1
+
+    def grouped(self, key_function):
+        """
+        :param key_function: Maps (testscript, operation, resource type) to the key of the result.
+        :return: Dictionary key -> merged timings, sorted by key.
+        """
+        merged = {}
+        for key, series in self.groups.items():
+            merged.setdefault(key_function(*key), _Series()).merge(series)
+        return dict(sorted(merged.items()))
+
+    def summary_lines(self):
+        """
+        :return: Log lines with the percentiles per operation and resource type and per TestScript.
+        """
+        lines = ["Request Timing Summary (ms, total / time to first byte):"]
+        for title, groups in (
+            ("by operation", self.grouped(lambda testscript, operation, resource: f"{operation} {resource}".strip())),
+            ("by TestScript", self.grouped(lambda testscript, operation, resource: testscript)),
+        ):
+            lines.append(f"  {title}:")
+            for name, series in groups.items():
+                total, ttfb = series.stats(series.total), series.stats(series.ttfb)
+                percentiles = "  ".join(f"p{percent} {total[f'p{percent}']:.1f}/{ttfb[f'p{percent}']:.1f}"
+                                        for percent in PERCENTILES)
+                errors = f", {series.errors} errors" if series.errors else ""
+                lines.append(f"    {name}: {len(series.total)} requests  {percentiles}  "
+                             f"connect {series.stats(series.connect)['mean']:.1f} mean, "
+                             f"{series.sent} B sent, {series.received} B received{errors}")
+        if self.limits:
+            lines.append(f"  concurrency limit: min {min(self.limits)}, max {max(self.limits)}, last {self.limits[-1]}")
+        if self.throttles:
+            lines.append(f"  throttled responses: {sum(self.throttles.values())} "
+                         f"({', '.join(f'{name} {count}' for name, count in sorted(self.throttles.items()))})")
+        return lines
+
+    def to_json(self):
+        """
+        :return: JSON-serializable dictionary with one entry per group.
+        """
+        limits = {"min": min(self.limits), "max": max(self.limits), "last": self.limits[-1]} if self.limits else None
+        return {"groups": [
+            {
+                "testscript": testscript,
+                "operation": operation,
+                "resource": resource,
+                "count": len(series.total),
+                "errors": series.errors,
+                "sentBytes": series.sent,
+                "receivedBytes": series.received,
+                "totalMs": series.stats(series.total),
+                "ttfbMs": series.stats(series.ttfb),
+                "connectMs": series.stats(series.connect),
+            }
+            for (testscript, operation, resource), series in sorted(self.groups.items())
+        ], "throttleEvents": dict(sorted(self.throttles.items())), "concurrencyLimit": limits}
+
+    def to_openmetrics(self):
+        """
+        :return: OpenMetrics text exposition of the timings (summaries with quantiles and byte counters).
+        """
+        summaries = (
+            ("fhir_http_request_duration_seconds", "Total time of the HTTP exchanges", "total"),
+            ("fhir_http_time_to_first_byte_seconds", "Time from sending the request to the response headers", "ttfb"),
+            ("fhir_http_connect_seconds", "Time spent opening connections", "connect"),
+        )
+        counters = (
+            ("fhir_http_sent_bytes", "Bytes of the request bodies", "bytes", "sent"),
+            ("fhir_http_received_bytes", "Bytes of the response bodies", "bytes", "received"),
+            ("fhir_http_errors", "Failed exchanges (no response or status 5xx)", None, "errors"),
+        )
+        groups = sorted(self.groups.items())
+
+        def labels(key, **extra):
+            names = dict(zip(("testscript", "operation", "resource"), key), **extra)
+            return ",".join(f'{name}="{_escape_label(value)}"' for name, value in names.items())
+
+        lines = []
+        for name, help_text, field in summaries:
+            lines += [f"# TYPE {name} summary", f"# UNIT {name} seconds", f"# HELP {name} {help_text}."]
+            for key, series in groups:
+                values = sorted(getattr(series, field))
+                for percent in PERCENTILES:
+                    lines.append(f"{name}{{{labels(key, quantile=percent / 100)}}} {percentile(values, percent):.6f}")
+                lines.append(f"{name}_sum{{{labels(key)}}} {sum(values):.6f}")
+                lines.append(f"{name}_count{{{labels(key)}}} {len(values)}")
+        for name, help_text, unit, field in counters:
+            lines.append(f"# TYPE {name} counter")
+            if unit:
+                lines.append(f"# UNIT {name} {unit}")
+            lines.append(f"# HELP {name} {help_text}.")
+            for key, series in groups:
+                lines.append(f"{name}_total{{{labels(key)}}} {getattr(series, field)}")
+        name = "fhir_http_throttle_events"
+        lines += [f"# TYPE {name} counter", f"# HELP {name} Responses throttled by the server (429, 503)."]
+        for testscript, count in sorted(self.throttles.items()):
+            lines.append(f'{name}_total{{testscript="{_escape_label(testscript)}"}} {count}')
+        if self.limits:
+            name = "fhir_http_concurrency_limit"
+            lines += [f"# TYPE {name} gauge", f"# HELP {name} Limit of the adaptive concurrency limiter at the last request.",
+                      f"{name} {self.limits[-1]}"]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_prefix):
+        """
+        Writes the OpenMetrics and the JSON export.
+
+        :param output_prefix: Path without extension, e.g. Results/metrics_<timestamp>.
+        :return: Tuple (path of the OpenMetrics file, path of the JSON file).
+        """
+        metrics_path, json_path = f"{output_prefix}.prom", f"{output_prefix}.json"
+        with open(metrics_path, "w", encoding="utf-8") as f:
+            f.write(self.to_openmetrics())
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, indent=2, ensure_ascii=False)
+        return metrics_path, json_path
+
+
+def export_request_metrics(event_paths):
+    """
+    Aggregates the exchanges of a run, logs the summary and writes the exports
+    next to the first event file.
+
+    :param event_paths: Path or list of paths of the event files of the run.
+    :return: Tuple of the written paths or None if the run had no HTTP exchanges.
+    """
+    if isinstance(event_paths, str):
+        event_paths = [event_paths]
+
+    # The event streams of this process must be complete before they are read
+    flush_log(wait=True)
+    metrics = RequestMetrics()
+    for event_path in event_paths:
+        if os.path.exists(event_path):
+            metrics.add_event_file(event_path)
+    if not metrics.groups:
+        return None
+
+    for line in metrics.summary_lines():
+        log_to_file(line)
+    first_path = os.path.abspath(event_paths[0])
+    filename = os.path.splitext(os.path.basename(first_path))[0].replace("test_results", "metrics", 1)
+    paths = metrics.write(os.path.join(os.path.dirname(first_path), filename))
+    log_to_file(f"Request metrics written to {paths[0]} and {paths[1]}")
+    flush_log()
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exports the HTTP timings of FHIR test event streams.")
+    parser.add_argument("events", nargs="+", help="JSONL event files")
+    args = parser.parse_args(argv)
+
+    if export_request_metrics(args.events) is None:
+        print("No HTTP exchanges found")
+    flush_log(wait=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+"""
+State of the previous runs for incremental re-runs. For every TestScript the
+content hashes of its inputs are kept: the TestScript file, the example instances
+referenced by its fixtures, the profiles of its validateProfileId assertions
+(with their loaded base profiles) and the target server, together with the
+result of its last run.
+
+In "changed-only" mode only the TestScripts whose inputs changed since their last
+run, that are new or that failed last time are run, the failed ones first.
+The state is updated after every run, also in "all" mode, so a later
+changed-only run can start from it.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from parse_cache import get_parse_cache
+from profile_manager import get_profile_manager
+from utils import BASE_DIR, log_to_file
+from validate import resolve_profile
+
+RUN_STATE_MODES = ("all", "changed-only")
+DEFAULT_RUN_STATE_FILE = ".run_state.json"  # relative to impl/
+RUN_STATE_VERSION = 1
+
+
+def file_hash(path):
+    """
+    :param path: Path of a file.
+    :return: SHA-256 of the file content or None if the file does not exist.
+    """
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _profile_ids(testscript):
+    """Yields the validateProfileId of every assertion of setup, tests and teardown."""
+    sections = [testscript.get("setup", {}), testscript.get("teardown", {})] + testscript.get("test", [])
+    for section in sections:
+        for action in section.get("action", []):
+            profile_id = (action.get("assert") or {}).get("validateProfileId")
+            if profile_id:
+                yield profile_id
+
+
+def _profile_inputs(testscript):
+    """
+    Resolves the profiles validated by a TestScript the same way the assertions do.
+    Base profiles are included, profiles without snapshot are compiled on top of them.
+
+    :return: Dictionary "profile:<url or id>" -> hash of the profile file, None if it is not loaded.
+    """
+    try:
+        profile_manager = get_profile_manager()
+    except ValueError:  # no Profiles folder
+        profile_manager = None
+    profiles = {profile.get("id"): profile.get("reference") for profile in testscript.get("profile", [])}
+
+    inputs = {}
+    for profile_id in _profile_ids(testscript):
+        entry = resolve_profile(profile_id, profiles) if profile_manager else None
+        if entry is None:
+            inputs[f"profile:{profiles.get(profile_id) or profile_id}"] = None
+        while entry is not None and f"profile:{entry['url']}" not in inputs:
+            inputs[f"profile:{entry['url']}"] = file_hash(entry["path"])
+            base_url = entry.get("baseDefinition")
+            entry = profile_manager.get_by_url(base_url) if base_url else None
+    return inputs
+
+
+def script_inputs(testscript_path, fixture_paths, fhir_server):
+    """
+    Collects the inputs of one TestScript.
+
+    :param testscript_path: TestScript path relative to impl/.
+    :param fixture_paths: Example instance paths relative to impl/ (see ConfigManager.get_fixture_paths).
+    :param fhir_server: URL of the target server.
+    :return: Dictionary input name -> content hash (or the server URL), sorted by name.
+    """
+    inputs = {"server": fhir_server or "", testscript_path: file_hash(BASE_DIR / testscript_path)}
+    for fixture_path in fixture_paths:
+        inputs[fixture_path] = file_hash(BASE_DIR / fixture_path)
+    try:
+        testscript = get_parse_cache().load(BASE_DIR / testscript_path)
+    except (OSError, ValueError):
+        testscript = {}
+    inputs.update(_profile_inputs(testscript))
+    return dict(sorted(inputs.items()))
+
+
+class RunState:
+    """
+    Inputs and results of the last run of every TestScript, kept in a JSON file.
+
+    Attributes:
+        path (Path): Path of the state file
+        scripts (dict): TestScript path -> {"inputs": {...}, "passed": bool, "lastRun": timestamp}
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.scripts = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Loads the state file, a missing or unreadable file starts an empty state."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == RUN_STATE_VERSION:
+                self.scripts = data.get("scripts", {})
+        except (OSError, ValueError, AttributeError):
+            self.scripts = {}
+        return self
+
+    def reason(self, testscript_path, inputs):
+        """
+        :param testscript_path: TestScript path relative to impl/.
+        :param inputs: Current inputs as returned by script_inputs.
+        :return: Why the TestScript has to run ("new", "failed", "changed: ...") or None if it is unchanged.
+        """
+        previous = self.scripts.get(testscript_path)
+        if previous is None:
+            return "new"
+        if not previous.get("passed"):
+            return "failed"
+        previous_inputs = previous.get("inputs", {})
+        changed = sorted(name for name in set(inputs) | set(previous_inputs)
+                         if inputs.get(name) != previous_inputs.get(name))
+        return f"changed: {', '.join(changed)}" if changed else None
+
+    def select(self, pairs, fhir_server):
+        """
+        Selects the TestScripts of a changed-only run.
+
+        :param pairs: List of (testscript path, list of example instance paths) in run order.
+        :param fhir_server: URL of the target server.
+        :return: List of (pair, reason), TestScripts that failed last time first, otherwise in run order.
+        """
+        selected = []
+        for pair in pairs:
+            reason = self.reason(pair[0], script_inputs(pair[0], pair[1], fhir_server))
+            if reason:
+                selected.append((pair, reason))
+        # sorted() is stable, the run order is kept within both groups
+        return sorted(selected, key=lambda item: item[1] != "failed")
+
+    def record(self, testscript_path, fixture_paths, fhir_server, passed):
+        """
+        Stores the inputs and the result of a finished TestScript.
+
+        :param passed: True if every test of the TestScript passed.
+        """
+        inputs = script_inputs(testscript_path, fixture_paths, fhir_server)
+        with self._lock:
+            self.scripts[testscript_path] = {
+                "inputs": inputs,
+                "passed": bool(passed),
+                "lastRun": datetime.now().isoformat(timespec="seconds"),
+            }
+
+    def save(self):
+        """Writes the state file (to a temporary file first, so an aborted write keeps the old state)."""
+        with self._lock:
+            data = {"version": RUN_STATE_VERSION, "scripts": dict(sorted(self.scripts.items()))}
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_to_file(f"Could not write run state {self.path}: {e}")
+
+
+def run_state_mode(settings):
+    """
+    :param settings: "runState" section of config.json.
+    :return: "all" or "changed-only".
+    """
+    mode = str((settings or {}).get("mode", "all")).lower()
+    return mode if mode in RUN_STATE_MODES else "all"
+
+
+# Singleton instance, loaded on first use
+_run_state = None
+
+
+def get_run_state(settings=None):
+    """
+    Gets or loads the RunState of this process.
+
+    :param settings: "runState" section of config.json ({"mode": ..., "file": ...}), used on first call.
+        Relative state files are resolved against impl/.
+    :return: RunState instance.
+    """
+    global _run_state
+
+    if _run_state is None:
+        _run_state = RunState(BASE_DIR / (settings or {}).get("file", DEFAULT_RUN_STATE_FILE)).load()
+
+    return _run_state
+
+
+def select_changed(run_state, pairs, fhir_server):
+    """
+    Selects the TestScripts of a changed-only run and logs why each of them runs.
+
+    :return: List of the selected pairs, failed first.
+    """
+    selected = run_state.select(pairs, fhir_server)
+    log_to_file(f"Changed-only run: {len(selected)} of {len(pairs)} TestScripts affected")
+    for (testscript_path, _), reason in selected:
+        log_to_file(f"  {testscript_path}: {reason}")
+    return [pair for pair, _ in selected]
@@ -0,0 +1,79 @@
+"""
+Measures the startup cost of the test script evaluator and checks it against a budget.
+Every measurement runs in a fresh interpreter, so nothing is cached in memory.
+
+Usage (from impl/test_script_evaluator):
+    python startup_budget.py [--config path/to/config.json]
+
+The budget is read from "startupBudgetMs" in config.json, e.g.
+    "startupBudgetMs": {"import": 1000, "collect": 3000}
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from configuration_manager import ConfigManager
+
+DEFAULT_BUDGET_MS = {"import": 1000, "collect": 3000}
+
+RUNNER_MODULE = "test_script_evaluator_log_to_file"
+
+IMPORT_PROBE = (
+    "import time; start = time.perf_counter(); "
+    f"import {RUNNER_MODULE}; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def _run(args):
+    return subprocess.run(
+        args, cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+
+
+def measure_import_ms():
+    """
+    :return: Milliseconds needed to import the runner module in a fresh interpreter.
+    """
+    result = _run([sys.executable, "-c", IMPORT_PROBE])
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {RUNNER_MODULE} failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_collect_ms():
+    """
+    :return: Milliseconds of "pytest --collect-only" including interpreter start.
+    """
+    start = time.perf_counter()
+    result = _run([sys.executable, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider", f"{RUNNER_MODULE}.py"])
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Collecting the tests failed:\n{result.stdout}\n{result.stderr}")
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checks the startup time of the test script evaluator.")
+    parser.add_argument("--config", default=None, help="Path to config.json")
+    args = parser.parse_args(argv)
+
+    budget = dict(DEFAULT_BUDGET_MS)
+    budget.update(ConfigManager(args.config).get("startupBudgetMs", {}))
+
+    measurements = {"import": measure_import_ms(), "collect": measure_collect_ms()}
+
+    within_budget = True
+    for name, elapsed in measurements.items():
+        ok = elapsed <= budget[name]
+        within_budget = within_budget and ok
+        print(f"{'✓' if ok else '✗'} {name}: {elapsed:.0f} ms (budget {budget[name]} ms)")
+
+    return 0 if within_budget else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
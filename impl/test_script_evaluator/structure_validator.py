@@ -0,0 +1,435 @@
+"""
+Local validation of resources against StructureDefinitions.
+A StructureDefinition is compiled once into a tree of element rules
+(cardinality, types, fixed and pattern values, slicing). The compiled
+validators are cached per profile URL and version, so validating many
+responses against the same profile costs only one compilation.
+"""
+import math
+import re
+import threading
+
+from profile_manager import get_profile_manager
+
+# JSON representation of the FHIR primitive types
+BOOLEAN_TYPES = {"boolean"}
+INTEGER_TYPES = {"integer", "positiveInt", "unsignedInt"}
+DECIMAL_TYPES = {"decimal"}
+STRING_TYPES = {
+    "string", "code", "id", "uri", "url", "canonical", "oid", "uuid", "markdown",
+    "base64Binary", "instant", "date", "dateTime", "time", "xhtml", "integer64",
+}
+PRIMITIVE_TYPES = BOOLEAN_TYPES | INTEGER_TYPES | DECIMAL_TYPES | STRING_TYPES
+
+# Types of id, extension url etc. in the snapshots of the base resources
+SYSTEM_TYPES = {
+    "http://hl7.org/fhirpath/System.String": "string",
+    "http://hl7.org/fhirpath/System.Boolean": "boolean",
+    "http://hl7.org/fhirpath/System.Integer": "integer",
+    "http://hl7.org/fhirpath/System.Decimal": "decimal",
+    "http://hl7.org/fhirpath/System.Date": "date",
+    "http://hl7.org/fhirpath/System.DateTime": "dateTime",
+    "http://hl7.org/fhirpath/System.Time": "time",
+}
+
+# Regular expressions of the FHIR specification for primitive values
+_YEAR = r"([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)"
+_TIME = r"([01][0-9]|2[0-3]):[0-5][0-9]:([0-5][0-9]|60)(\.[0-9]{1,9})?"
+_ZONE = r"(Z|(\+|-)((0[0-9]|1[0-3]):[0-5][0-9]|14:00))"
+PRIMITIVE_PATTERNS = {
+    "id": re.compile(r"[A-Za-z0-9\-.]{1,64}"),
+    "code": re.compile(r"[^\s]+( [^\s]+)*"),
+    "date": re.compile(_YEAR + r"(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1]))?)?"),
+    "dateTime": re.compile(_YEAR + r"(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1])(T" + _TIME + _ZONE + r")?)?)?"),
+    "instant": re.compile(_YEAR + r"-(0[1-9]|1[0-2])-(0[1-9]|[1-2][0-9]|3[0-1])T" + _TIME + _ZONE),
+    "time": re.compile(_TIME),
+}
+
+
+class _Unset:
+    def __repr__(self):
+        return "<unset>"
+
+
+UNSET = _Unset()  # fixed and pattern values may be false or 0
+
+
+class ElementRule:
+    """
+    Compiled constraints of one element or slice of a StructureDefinition.
+    The children are the rules of the elements inside this element.
+    """
+
+    __slots__ = (
+        "name", "choice_prefix", "min", "max", "types", "type_profiles", "fixed", "pattern",
+        "children", "slices", "slicing", "slicing_rules", "discriminators",
+    )
+
+    def __init__(self, name):
+        self.name = name  # JSON name of the element, e.g. "value[x]" for choice types
+        self.choice_prefix = name[:-3] if name.endswith("[x]") else None
+        self.min = 0
+        self.max = math.inf
+        self.types = ()
+        self.type_profiles = ()
+        self.fixed = UNSET
+        self.pattern = UNSET
+        self.children = {}  # element name -> ElementRule
+        self.slices = {}  # slice name -> ElementRule
+        self.slicing = None  # slicing definition of the element
+        self.slicing_rules = None  # "open", "closed" or "openAtEnd", None if the slices are not checked
+        self.discriminators = ()  # of a slice: (type, path segments, expected value)
+
+    def apply(self, element):
+        """
+        Takes over the constraints of an ElementDefinition.
+
+        :param element: ElementDefinition dictionary.
+        """
+        if "min" in element:
+            self.min = element["min"]
+        if "max" in element:
+            self.max = math.inf if element["max"] == "*" else int(element["max"])
+        if element.get("type"):
+            self.types = tuple(SYSTEM_TYPES.get(t.get("code"), t.get("code")) for t in element["type"])
+            self.type_profiles = tuple(p for t in element["type"] for p in t.get("profile", []))
+        for key, value in element.items():
+            if key.startswith("fixed"):
+                self.fixed = value
+            elif key.startswith("pattern"):
+                self.pattern = value
+        if element.get("slicing"):
+            self.slicing = element["slicing"]
+
+
+def _split_element_id(element_id):
+    """
+    Splits an element id like "Patient.identifier:ssn.system" into its parts.
+
+    :return: List of (element name, slice name or None), without the root.
+    """
+    parts = []
+    for segment in element_id.split(".")[1:]:
+        name, _, slice_name = segment.partition(":")
+        parts.append((name, slice_name or None))
+    return parts
+
+
+def _values(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _values_at(value, segments):
+    """
+    Follows a simple discriminator path like "coding.system" into a value.
+
+    :return: List of all values found at the path.
+    """
+    found = [value]
+    for segment in segments:
+        found = [child for item in found if isinstance(item, dict) and segment in item
+                 for child in _values(item[segment])]
+    return found
+
+
+def _matches_pattern(value, pattern):
+    """
+    Checks a value against a pattern: all properties of the pattern must be present,
+    every entry of a pattern list must match an entry of the value list.
+    """
+    if isinstance(pattern, dict):
+        return isinstance(value, dict) and all(
+            key in value and _matches_pattern(value[key], expected) for key, expected in pattern.items()
+        )
+    if isinstance(pattern, list):
+        return isinstance(value, list) and all(
+            any(_matches_pattern(item, expected) for item in value) for expected in pattern
+        )
+    return value == pattern
+
+
+def _has_type_shape(value, type_code):
+    """
+    Checks whether a JSON value has the representation of a FHIR type.
+    """
+    if type_code in BOOLEAN_TYPES:
+        return isinstance(value, bool)
+    if type_code in INTEGER_TYPES:
+        if not isinstance(value, int) or isinstance(value, bool):
+            return False
+        return value > 0 if type_code == "positiveInt" else value >= 0 if type_code == "unsignedInt" else True
+    if type_code in DECIMAL_TYPES:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if type_code in STRING_TYPES:
+        if not isinstance(value, str):
+            return False
+        pattern = PRIMITIVE_PATTERNS.get(type_code)
+        return pattern is None or pattern.fullmatch(value) is not None
+    if type_code in ("Resource", "DomainResource"):
+        return isinstance(value, dict) and "resourceType" in value
+    return isinstance(value, dict)
+
+
+class StructureValidator:
+    """
+    Validator of one StructureDefinition.
+
+    Attributes:
+        url (str): Canonical URL of the profile
+        version (str): Version of the profile
+        type (str): Resource type constrained by the profile
+        elements (list): Snapshot elements the validator was compiled from
+        root (ElementRule): Rule of the resource itself
+    """
+
+    def __init__(self, structure_definition, base_validator=None):
+        """
+        Compiles the StructureDefinition.
+        Without a snapshot, the differential is merged into the elements of the base validator.
+
+        :param structure_definition: StructureDefinition dictionary.
+        :param base_validator: Optional validator of the baseDefinition, only used without snapshot.
+        """
+        self.url = structure_definition.get("url")
+        self.version = structure_definition.get("version")
+        self.type = structure_definition.get("type")
+        self.elements = self._resolve_elements(structure_definition, base_validator)
+        self.root = ElementRule(self.type)
+        for element in self.elements:
+            self._rule_for(element.get("id") or element.get("path", "")).apply(element)
+        self._compile_slicing(self.root)
+
+    @staticmethod
+    def _resolve_elements(structure_definition, base_validator):
+        snapshot = structure_definition.get("snapshot", {}).get("element")
+        if snapshot:
+            return snapshot
+
+        differential = structure_definition.get("differential", {}).get("element", [])
+        if base_validator is None:
+            return differential
+
+        # Differential elements override the base element with the same id, slices are added
+        merged = {element.get("id") or element.get("path"): element for element in base_validator.elements}
+        for element in differential:
+            key = element.get("id") or element.get("path")
+            merged[key] = dict(merged.get(key, {}), **element)
+        return list(merged.values())
+
+    def _rule_for(self, element_id):
+        rule = self.root
+        for name, slice_name in _split_element_id(element_id):
+            rule = rule.children.setdefault(name, ElementRule(name))
+            if slice_name:
+                rule = rule.slices.setdefault(slice_name, ElementRule(name))
+        return rule
+
+    def _compile_slicing(self, rule):
+        """
+        Compiles the discriminators of all slices below a rule.
+        Renamed choice types (value[x]:valueQuantity) are sliced by type without a slicing definition.
+        Slicings with discriminators that cannot be evaluated locally (e.g. profile) are not checked.
+        """
+        for child in rule.children.values():
+            self._compile_slicing(child)
+        for slice_rule in rule.slices.values():
+            self._compile_slicing(slice_rule)
+
+        if not rule.slices:
+            return
+        slicing = rule.slicing
+        if slicing is None and rule.choice_prefix:
+            slicing = {"discriminator": [{"type": "type", "path": "$this"}], "rules": "open"}
+        if slicing is None:
+            return
+
+        for slice_rule in rule.slices.values():
+            discriminators = [self._compile_discriminator(d, slice_rule) for d in slicing.get("discriminator", [])]
+            if not discriminators or None in discriminators:
+                return
+            slice_rule.discriminators = tuple(discriminators)
+        rule.slicing_rules = slicing.get("rules", "open")
+
+    @staticmethod
+    def _compile_discriminator(discriminator, slice_rule):
+        """
+        :return: Tuple (type, path segments, expected value) or None if it cannot be evaluated.
+        """
+        kind = discriminator.get("type")
+        path = discriminator.get("path", "$this")
+        segments = () if path == "$this" else tuple(path.split("."))
+        if any("(" in segment for segment in segments):
+            return None
+
+        target = slice_rule
+        for segment in segments:
+            target = target.children.get(segment) if target is not None else None
+
+        if kind in ("value", "pattern"):
+            if target is not None and target.fixed is not UNSET:
+                return kind, segments, ("fixed", target.fixed)
+            if target is not None and target.pattern is not UNSET:
+                return kind, segments, ("pattern", target.pattern)
+            # Extension slices only name the extension profile, its url is the discriminator value
+            if segments == ("url",) and slice_rule.type_profiles:
+                return kind, segments, ("fixed", slice_rule.type_profiles[0])
+            return None
+        if kind == "exists" and target is not None:
+            return kind, segments, target.min > 0
+        if kind == "type" and target is not None and target.types:
+            return kind, segments, frozenset(target.types)
+        return None
+
+    def validate(self, resource):
+        """
+        Validates a resource against the profile.
+
+        :param resource: Resource dictionary.
+        :return: List of issue messages, empty if the resource is valid.
+        """
+        issues = []
+        if not isinstance(resource, dict) or resource.get("resourceType") != self.type:
+            actual = resource.get("resourceType") if isinstance(resource, dict) else type(resource).__name__
+            issues.append(f"Expected a {self.type} resource, got {actual}")
+            return issues
+        self._validate_children(self.root, resource, self.type, issues)
+        return issues
+
+    def _validate_children(self, rule, value, path, issues):
+        for child in rule.children.values():
+            found = self._collect(child, value)
+            if len(found) < child.min:
+                issues.append(f"{path}.{child.name}: minimum cardinality {child.min}, found {len(found)}")
+            if len(found) > child.max:
+                issues.append(f"{path}.{child.name}: maximum cardinality {child.max}, found {len(found)}")
+
+            for label, item, type_code in found:
+                self._validate_value(child, item, type_code, f"{path}.{label}", issues)
+
+            if child.slicing_rules:
+                self._validate_slices(child, found, path, issues)
+
+    @staticmethod
+    def _collect(rule, value):
+        """
+        Collects the values of an element inside a complex value.
+
+        :return: List of (path label, value, type code or None).
+        """
+        if rule.choice_prefix:
+            prefix = rule.choice_prefix
+            keys = [key for key in value if key.startswith(prefix) and key[len(prefix):len(prefix) + 1].isupper()]
+        else:
+            keys = [rule.name] if rule.name in value else []
+            if not keys and f"_{rule.name}" in value:
+                # Primitive with only an extension and no value
+                return [(f"_{rule.name}", None, None)]
+
+        found = []
+        for key in keys:
+            type_code = None
+            if rule.choice_prefix:
+                type_code = key[len(rule.choice_prefix):]
+                if type_code not in rule.types and type_code[0].lower() + type_code[1:] in PRIMITIVE_TYPES:
+                    type_code = type_code[0].lower() + type_code[1:]
+            items = value[key]
+            if isinstance(items, list):
+                found.extend((f"{key}[{index}]", item, type_code) for index, item in enumerate(items))
+            else:
+                found.append((key, items, type_code))
+        return found
+
+    def _validate_value(self, rule, value, type_code, path, issues):
+        if type_code is None and len(rule.types) == 1:
+            type_code = rule.types[0]
+
+        if rule.types and type_code is not None and type_code not in rule.types:
+            issues.append(f"{path}: type {type_code} not allowed, expected one of {list(rule.types)}")
+        elif value is not None and type_code is not None and not _has_type_shape(value, type_code):
+            issues.append(f"{path}: invalid {type_code} value {value!r}")
+
+        if rule.fixed is not UNSET and value != rule.fixed:
+            issues.append(f"{path}: fixed value {rule.fixed!r} expected, found {value!r}")
+        if rule.pattern is not UNSET and not _matches_pattern(value, rule.pattern):
+            issues.append(f"{path}: value does not match pattern {rule.pattern!r}")
+
+        if isinstance(value, dict) and rule.children:
+            self._validate_children(rule, value, path, issues)
+
+    def _validate_slices(self, rule, found, path, issues):
+        counts = dict.fromkeys(rule.slices, 0)
+        for label, item, type_code in found:
+            slice_name = next(
+                (name for name, slice_rule in rule.slices.items() if self._matches_slice(slice_rule, item, type_code)),
+                None,
+            )
+            if slice_name is None:
+                if rule.slicing_rules == "closed":
+                    issues.append(f"{path}.{label}: does not match any slice of the closed slicing")
+                continue
+            counts[slice_name] += 1
+            self._validate_value(rule.slices[slice_name], item, type_code, f"{path}.{label}", issues)
+
+        for name, slice_rule in rule.slices.items():
+            if counts[name] < slice_rule.min:
+                issues.append(f"{path}.{rule.name}:{name}: minimum cardinality {slice_rule.min}, found {counts[name]}")
+            if counts[name] > slice_rule.max:
+                issues.append(f"{path}.{rule.name}:{name}: maximum cardinality {slice_rule.max}, found {counts[name]}")
+
+    @staticmethod
+    def _matches_slice(slice_rule, value, type_code):
+        for kind, segments, expected in slice_rule.discriminators:
+            found = _values_at(value, segments)
+            if kind in ("value", "pattern"):
+                mode, expected_value = expected
+                if mode == "fixed":
+                    matched = any(item == expected_value for item in found)
+                else:
+                    matched = any(_matches_pattern(item, expected_value) for item in found)
+            elif kind == "exists":
+                matched = bool(found) == expected
+            else:
+                types = {type_code} if not segments else {item.get("resourceType") for item in found if isinstance(item, dict)}
+                matched = bool(types & expected)
+            if not matched:
+                return False
+        return True
+
+
+# Compiled validators per (profile URL, version)
+_validators = {}
+_validators_lock = threading.RLock()
+
+
+def get_structure_validator(url, version=None):
+    """
+    Gets or compiles the validator of a loaded profile.
+    Profiles without snapshot are compiled on top of their baseDefinition, if it is loaded as well.
+
+    :param url: Canonical URL of the profile, may contain "|version".
+    :param version: Optional version of the profile.
+    :return: StructureValidator instance.
+    :raises KeyError: If no profile with this URL and version is loaded.
+    """
+    profile_manager = get_profile_manager()
+    entry = profile_manager.get_by_url(url, version)
+    if entry is None:
+        raise KeyError(f"Profile not loaded: {url}" + (f"|{version}" if version else ""))
+
+    key = (entry["url"], entry.get("version"))
+    validator = _validators.get(key)
+    if validator is not None:
+        return validator
+
+    # Reentrant, compiling a profile compiles its base profile first
+    with _validators_lock:
+        validator = _validators.get(key)
+        if validator is None:
+            structure_definition = profile_manager.load_structure_definition(entry)
+            base_validator = None
+            base_url = structure_definition.get("baseDefinition")
+            if not structure_definition.get("snapshot") and base_url and profile_manager.get_by_url(base_url):
+                base_validator = get_structure_validator(base_url)
+            validator = StructureValidator(structure_definition, base_validator)
+            _validators[key] = validator
+    return validator
@@ -0,0 +1,70 @@
+"""
+Deletion of fixtures after a TestScript or at the end of the run.
+All pending deletes are sent as one batch Bundle. If the server rejects
+the batch, they are sent as parallel DELETE requests instead.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from impl.transactions.transactions import build_delete_batch_bundle
+from utils import log_to_file, response_json
+
+# Status codes of a delete that leave the resource removed (404/410: already gone)
+REMOVED_STATUS_CODES = ("200", "202", "204", "404", "410")
+
+
+def _status_code(status):
+    return str(status or "").split(" ")[0]
+
+
+def _delete_batch(http_client, server_base, references):
+    """
+    :return: Dictionary reference -> status code or None if the batch was rejected.
+    """
+    try:
+        response = http_client.post(
+            server_base,
+            headers={"Content-Type": "application/fhir+json", "Accept": "application/fhir+json"},
+            json=build_delete_batch_bundle(references),
+            operation="delete-batch",
+        )
+    except Exception as e:
+        log_to_file(f"Batch delete failed: {e}")
+        return None
+
+    body = response_json(response)
+    entries = body.get("entry", []) if isinstance(body, dict) and body.get("resourceType") == "Bundle" else []
+    if response.status_code != 200 or len(entries) != len(references):
+        log_to_file(f"Batch delete rejected by the server (HTTP {response.status_code})")
+        return None
+    return {reference: _status_code(entry.get("response", {}).get("status"))
+            for reference, entry in zip(references, entries)}
+
+
+def _delete_single(http_client, server_base, reference):
+    try:
+        return str(http_client.delete(f"{server_base}/{reference}").status_code)
+    except Exception as e:
+        return f"error: {e}"
+
+
+def delete_resources(http_client, server_base, references):
+    """
+    Deletes resources with one batch request, falls back to parallel DELETEs.
+
+    :param http_client: Client used for the requests.
+    :param server_base: Base URL of the FHIR server.
+    :param references: List of relative references, e.g. "Patient/123".
+    :return: Tuple (list of removed references, dictionary failed reference -> status).
+    """
+    if not references:
+        return [], {}
+
+    statuses = _delete_batch(http_client, server_base, references) if len(references) > 1 else None
+    if statuses is None:
+        workers = min(len(references), http_client.settings.get("poolMaxsize", 10))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            statuses = dict(zip(references, pool.map(lambda ref: _delete_single(http_client, server_base, ref), references)))
+
+    removed = [reference for reference in references if statuses[reference] in REMOVED_STATUS_CODES]
+    failed = {reference: status for reference, status in statuses.items() if status not in REMOVED_STATUS_CODES}
+    return removed, failed
@@ -0,0 +1,136 @@
+"""
+Unit tests of the compiled assertions of an execution plan, independent of a FHIR server.
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import profile_manager
+from execution_plan import AssertionStep, compile_testscript, page_checks
+from paging import PagedResponse
+
+PROFILE_URL = "http://example.org/fhir/StructureDefinition/test-plan-patient"
+
+PROFILE = {
+    "resourceType": "StructureDefinition",
+    "id": "test-plan-patient",
+    "url": PROFILE_URL,
+    "type": "Patient",
+    "kind": "resource",
+    "derivation": "constraint",
+    "snapshot": {"element": [
+        {"id": "Patient", "path": "Patient", "min": 0, "max": "*"},
+        {"id": "Patient.name", "path": "Patient.name", "min": 1, "max": "*", "type": [{"code": "HumanName"}]},
+    ]},
+}
+
+PATIENT = {"resourceType": "Patient", "id": "p1", "name": [{"family": "Muster"}]}
+OUTCOME = {"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "not-found"}]}
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    """Profile manager with only the test profile loaded."""
+    path = tmp_path / "StructureDefinition-test-plan-patient.json"
+    path.write_text(json.dumps(PROFILE), encoding="utf-8")
+    manager = profile_manager.ProfileManager()
+    manager.add_profile(PROFILE, path.name, path)
+    monkeypatch.setattr(profile_manager, "_profile_manager", manager)
+    return {"patient-profile": PROFILE_URL}
+
+
+def _response(status_code, body, url="http://server/fhir/Patient"):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode("utf-8")
+    response.url = url
+    return response
+
+
+def _page(number, count):
+    """Searchset page with one Patient, linking to the next page unless it is the last."""
+    bundle = {"resourceType": "Bundle", "type": "searchset", "entry": [
+        {"resource": {"resourceType": "Patient", "id": f"p{number}", "name": [{"family": "Muster"}]}}]}
+    if number < count:
+        bundle["link"] = [{"relation": "next", "url": f"http://server/fhir/Patient?page={number + 1}"}]
+    return bundle
+
+
+class PageServer:
+    """HTTP client stand-in serving the following pages of a search and counting the requests."""
+
+    def __init__(self, count):
+        self.count = count
+        self.requests = 0
+
+    def get(self, url, headers=None, operation=None):
+        self.requests += 1
+        return _response(200, _page(int(url.rsplit("=", 1)[1]), self.count), url)
+
+
+def _assertion(assertion):
+    """Compiles a TestScript with a read followed by the assertion and returns its checks."""
+    testscript = {
+        "resourceType": "TestScript",
+        "name": "plan",
+        "fixture": [{"id": "patient"}],
+        "test": [{"name": "read", "action": [
+            {"operation": {"type": {"code": "read"}, "resource": "Patient", "sourceId": "patient"}},
+            {"assert": assertion},
+        ]}],
+    }
+    step = compile_testscript(testscript).tests[0].steps[1]
+    assert isinstance(step, AssertionStep)
+    return dict(step.checks)
+
+
+def test_request_profile_assertion_validates_request_body(profiles):
+    check = _assertion({"direction": "request", "validateProfileId": "patient-profile"})["validateProfileId"]
+    context = SimpleNamespace(profiles=profiles)
+    # The OperationOutcome of the response does not conform, only the request body is validated
+    check(context, _response(404, OUTCOME), PATIENT)
+
+    with pytest.raises(AssertionError):
+        check(context, _response(200, PATIENT), {"resourceType": "Patient", "id": "p1"})
+
+
+def test_response_profile_assertion_validates_response_body(profiles):
+    check = _assertion({"direction": "response", "validateProfileId": "patient-profile"})["validateProfileId"]
+    context = SimpleNamespace(profiles=profiles)
+    check(context, _response(200, PATIENT), {"resourceType": "Patient", "id": "p1"})
+
+    with pytest.raises(AssertionError):
+        check(context, _response(200, {"resourceType": "Patient", "id": "p1"}), PATIENT)
+
+
+def test_assertions_of_a_search_share_one_walk_over_the_pages(profiles):
+    testscript = {
+        "resourceType": "TestScript",
+        "name": "search",
+        "test": [{"name": "search", "action": [
+            {"operation": {"type": {"code": "search"}, "resource": "Patient", "params": "?family=Muster"}},
+            {"assert": {"direction": "response", "validateProfileId": "patient-profile"}},
+            {"assert": {"direction": "response", "expression": "Bundle.entry.resource.name.family = 'Muster'"}},
+            {"assert": {"direction": "response", "expression": "Bundle.entry.resource.id = 'p1'"}},
+        ]}],
+    }
+    steps = compile_testscript(testscript).tests[0].steps
+    server = PageServer(3)
+    response = PagedResponse(server, _response(200, _page(1, 3)))
+    context = SimpleNamespace(profiles=profiles, get_source=lambda source_id: None)
+    response.page_checks = page_checks(steps[1:])
+
+    results = []
+    for step in steps[1:]:
+        for _, check in step.checks:
+            try:
+                check(context, response, None)
+                results.append(None)
+            except AssertionError as e:
+                results.append(str(e))
+
+    assert server.requests == 2
+    assert results[:2] == [None, None]
+    assert results[2].startswith("Page 2:")
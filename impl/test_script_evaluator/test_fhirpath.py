@@ -0,0 +1,116 @@
+"""
+Unit tests of the FHIRPath evaluator, independent of a FHIR server:
+paths, choice types, operator precedence and functions.
+"""
+import pytest
+
+from fhirpath import evaluate
+from impl.exception.FhirPathError import FhirPathError
+
+PATIENT = {
+    "resourceType": "Patient",
+    "id": "p1",
+    "active": True,
+    "name": [
+        {"use": "official", "family": "Muster", "given": ["Max", "Peter"]},
+        {"use": "nickname", "given": ["Maxi"]},
+    ],
+    "birthDate": "1980-05-17",
+}
+
+OBSERVATION = {
+    "resourceType": "Observation",
+    "status": "final",
+    "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+    "valueQuantity": {"value": 72, "unit": "/min"},
+    "effectiveDateTime": "2024-01-02T10:00:00Z",
+    "component": [
+        {"code": {"text": "a"}, "valueString": "x"},
+        {"code": {"text": "b"}, "valueInteger": 3},
+    ],
+}
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("Patient.id", ["p1"]),
+    ("id", ["p1"]),
+    ("Patient.name.given", ["Max", "Peter", "Maxi"]),
+    ("name.family", ["Muster"]),
+    ("name[1].given", ["Maxi"]),
+    ("name.given[2]", ["Maxi"]),
+    ("name.prefix", []),
+    ("Observation.id", []),
+])
+def test_paths(expression, expected):
+    assert evaluate(expression, PATIENT) == expected
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("Observation.value.value", [72]),
+    ("Observation.value.ofType(Quantity).unit", ["/min"]),
+    ("(Observation.value as Quantity).value", [72]),
+    ("effective", ["2024-01-02T10:00:00Z"]),
+    ("component.value", ["x", 3]),
+    ("component.value.ofType(integer)", [3]),
+])
+def test_choice_types(expression, expected):
+    assert evaluate(expression, OBSERVATION) == expected
+
+
+def test_choice_type_needs_type_suffix():
+    resource = {"resourceType": "CodeSystem", "codeSystem": "http://example.org", "valueSetReference": "x"}
+    assert evaluate("code", resource) == []
+    assert evaluate("value", resource) == []
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("1 + 2 * 3", [7]),
+    ("(1 + 2) * 3", [9]),
+    ("10 - 4 - 3", [3]),
+    ("7 div 2 + 7 mod 2", [4]),
+    ("1 + 1 = 2", [True]),
+    ("1 < 2 and 2 < 3", [True]),
+    ("true or false and false", [True]),
+    ("false implies false or true", [True]),
+    ("-2 + 5", [3]),
+    ("'a' & 'b' = 'ab'", [True]),
+    ("(1 | 2 | 2).count()", [2]),
+])
+def test_operator_precedence(expression, expected):
+    assert evaluate(expression, PATIENT) == expected
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("name.where(use = 'official').family", ["Muster"]),
+    ("name.select(given.first())", ["Max", "Maxi"]),
+    ("name.given.exists()", [True]),
+    ("name.suffix.empty()", [True]),
+    ("name.all(given.exists())", [True]),
+    ("name.given.count()", [3]),
+    ("name.given.distinct().count()", [3]),
+    ("name.given.first()", ["Max"]),
+    ("name.given.last()", ["Maxi"]),
+    ("name.given.tail()", ["Peter", "Maxi"]),
+    ("name.given.skip(1).take(1)", ["Peter"]),
+    ("name.given.join(',')", ["Max,Peter,Maxi"]),
+    ("iif(active, 'yes', 'no')", ["yes"]),
+    ("birthDate.startsWith('1980')", [True]),
+    ("birthDate.substring(5, 2)", ["05"]),
+    ("name.family.upper()", ["MUSTER"]),
+    ("name.family.length()", [6]),
+    ("'12'.toInteger() + 1", [13]),
+    ("active.not()", [False]),
+    ("id.matches('^p[0-9]$')", [True]),
+])
+def test_functions(expression, expected):
+    assert evaluate(expression, PATIENT) == expected
+
+
+def test_variables():
+    assert evaluate("name.where(use = %use).given", PATIENT, {"use": "nickname"}) == ["Maxi"]
+
+
+@pytest.mark.parametrize("expression", ["name.", "name.given(", "name.unknownFunction()"])
+def test_invalid_expressions(expression):
+    with pytest.raises(FhirPathError):
+        evaluate(expression, PATIENT)
@@ -0,0 +1,106 @@
+"""
+Dependency-aware scheduling of the tests inside one TestScript.
+Tests that touch the same fixture keep their order, independent tests
+run concurrently in a thread pool.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils import capture_log, replay_log
+
+# Fields of operation and assert that reference a fixture
+FIXTURE_REFERENCE_FIELDS = ("sourceId", "targetId", "responseId", "compareToSourceId", "minimumId")
+
+
+def collect_fixture_keys(test):
+    """
+    Collects all fixture ids a test reads or writes.
+
+    :param test: Test definition dictionary.
+    :return: Set of fixture ids.
+    """
+    keys = set()
+    for action in test.get("action", []):
+        for step in (action.get("operation"), action.get("assert")):
+            if not step:
+                continue
+            for field in FIXTURE_REFERENCE_FIELDS:
+                if step.get(field):
+                    keys.add(step[field])
+    return keys
+
+
+def build_dependency_graph(tests, fixture_keys=collect_fixture_keys):
+    """
+    Builds the dependency graph of the tests.
+    A test depends on the previous test that used one of its fixtures (the current owner).
+
+    :param tests: List of tests in script order.
+    :param fixture_keys: Function returning the fixture ids of a test.
+    :return: List with a set of dependency indices per test.
+    """
+    owners = {}  # fixture id -> index of the last test using it
+    dependencies = []
+
+    for index, test in enumerate(tests):
+        depends_on = set()
+        for key in fixture_keys(test):
+            if key in owners:
+                depends_on.add(owners[key])
+            owners[key] = index
+        dependencies.append(depends_on)
+
+    return dependencies
+
+
+def run_tests(tests, run_test, max_workers=1, fixture_keys=collect_fixture_keys):
+    """
+    Runs all tests, independent tests concurrently.
+    The log output of every test is buffered and written in script order,
+    so the log file looks the same as with sequential execution.
+
+    :param tests: List of tests in script order (definition dictionaries or compiled tests).
+    :param run_test: Callable that executes one test and returns its result.
+    :param max_workers: Maximum number of tests running at the same time.
+    :param fixture_keys: Function returning the fixture ids of a test.
+    :return: List of results in script order.
+    """
+    if max_workers <= 1 or len(tests) <= 1:
+        return [run_test(test) for test in tests]
+
+    dependencies = build_dependency_graph(tests, fixture_keys)
+    dependents = [[] for _ in tests]
+    for index, depends_on in enumerate(dependencies):
+        for dependency in depends_on:
+            dependents[dependency].append(index)
+
+    remaining = [len(depends_on) for depends_on in dependencies]
+    results = [None] * len(tests)
+    logs = [None] * len(tests)
+    next_to_log = 0
+
+    def run_captured(index):
+        with capture_log() as lines:
+            result = run_test(tests[index])
+        return result, lines
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {pool.submit(run_captured, index): index for index, count in enumerate(remaining) if count == 0}
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                results[index], logs[index] = future.result()
+
+                for dependent in dependents[index]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        running[pool.submit(run_captured, dependent)] = dependent
+
+            # Write the logs of all finished tests that are next in script order
+            while next_to_log < len(tests) and logs[next_to_log] is not None:
+                replay_log(logs[next_to_log])
+                logs[next_to_log] = ()
+                next_to_log += 1
+
+    return results
@@ -1,106 +1,212 @@
 import json
-import requests
 import pytest
 from pathlib import Path
 import os
 from datetime import datetime
 import traceback
+import random
 
-from numpy.ma.testutils import assert_equal
 from impl.transactions.transactions import *
 from impl.exception.TestExecutionError import TestExecutionError
-from profile_manager import ProfileManager
+from impl.exception.InvalidTestScriptError import InvalidTestScriptError
 from validate import *
-from configuration_manager import get_config_manager, get_fhir_server, get_testscript_pairs, has_fhir_server
+from configuration_manager import get_config_manager, get_fhir_server, get_testscript_paths, has_fhir_server
+from execution_context import ExecutionContext
+from execution_plan import OperationStep, compile_testscript, page_checks
+from fixture_manager import content_hash, get_fixture_manager
+from http_client import get_http_client
+from paging import PagedResponse
+from teardown import delete_resources
+from test_scheduler import run_tests
+from report_renderer import render_report_in_background
+from request_metrics import export_request_metrics
+from run_state import get_run_state, run_state_mode, select_changed
 from impl.model.configuration import Configuration
-from impl.transactions.transactions import build_whole_transaction_bundle
-from impl.model.fixture import Fixture
+from impl.transactions.transactions import encode_transaction_bundle
+from impl.model.fixture import Fixture, RELEASED
 from utils import *
 
 
-saved_resource_id = ""
-log_filename = f"test_results_{timestamp}.txt"
-
-profile_manager = ProfileManager()
-profile_manager.make_profile_list(str(BASE_DIR) + "/Profiles")  # Path to profile
-
-FIXTURES = []
-
-# Init logfile
-with open(LOG_FILE_PATH, "w", encoding="utf-8") as f:
-    f.write(f"FHIR Test Log - {datetime.now()}\n\n")
-
-FHIR_SERVER_BASE = get_fhir_server()
-
-def extract_test_source_id(test):
-    """
-    Returns the soruceID
-    """
-    for action in test.get("action", []):
-        op = action.get("operation")
-        if op and "sourceId" in op:
-            return op["sourceId"]
-
-    return None
-
 
 # Execute operation
-def execute_operation(operation, resource, test_id):
+def execute_operation(context, step, resource, test_id):
     """
-    Executes a FHIR operation (CREATE, UPDATE, READ) on the server.
+    Executes a FHIR operation (CREATE, UPDATE, READ, SEARCH, HISTORY) on the server.
 
-    :param operation: Dictionary containing operation details.
+    :param context: ExecutionContext of the current run.
+    :param step: OperationStep of the execution plan.
     :param resource: The FHIR resource to operate on.
-    :return: HTTP response object.
-    :raises: NotImplementedError for unsupported methods.
+    :param test_id: First sourceId of the test, used for logging.
+    :return: HTTP response object or None if the fixture of the operation does not exist.
     """
-    method = operation.get("type", {}).get("code", "").lower()
-    resource_type = operation.get("resource")
-    url = f"{FHIR_SERVER_BASE}/{resource_type}"
-    headers = {
-        "Content-Type": parse_fhir_header(operation.get("contentType")),
-        "Accept": parse_fhir_header(operation.get("accept")),
-    }
+    method = step.method
+    path = step.path
+    headers = dict(step.headers)
+
+    if step.fixture_id:
+        fixture = context.fixtures.get_by_source_id(step.fixture_id)
+        if fixture is None:
+            log_to_file(f"No fixture found in {method}")
+            return None
+        context.fixtures.mark_in_use(fixture)
+        path = path.replace("{id}", fixture.server_id)
+    url = f"{context.fhir_server_base}/{path}" if path else context.fhir_server_base
+
+    log_event("action", fixture=test_id, operation=method, url=url)
 
     if method == "create":
+        if context.config_manager.create_verification in ("representation", "sample"):
+            # The created resource is verified from the response, no extra GET needed
+            headers["Prefer"] = "return=representation"
         log_to_file(f"Executing: {method.upper()} {url}")
-        response = requests.post(url, headers=headers, json=resource)
-        global saved_resource_id
-        try:
-            saved_resource_id = response.json().get("id")
-        except ValueError:
+        response = context.http_client.post(url, headers=headers, json=resource, operation=method)
+        body = response_json(response)
+        if isinstance(body, dict) and body.get("id"):
+            context.saved_resource_id = body.get("id")
+        else:
             location = response.headers.get("Location", "")
             if location:
-                saved_resource_id = location.rstrip("/").split("/")[-3]
-                log_to_file(f"ID from Location header: {saved_resource_id}")
+                context.saved_resource_id = location.rstrip("/").split("/")[-3]
+                log_to_file(f"ID from Location header: {context.saved_resource_id}")
             else:
                 raise ValueError("No ID found in response or Location header")
+
     elif method == "update":
-        fixture = next((fix for fix in FIXTURES if fix.source_id == test_id), None)
-        if fixture is None:
-            log_to_file("no fixture found in update")
-            return None
-        resource_id = fixture.server_id
-        log_to_file(f"Executing: {method.upper()} {url}/{resource_id}")
-        resource["id"] = resource_id
-        response = requests.put(f"{url}/{resource_id}", headers=headers, json=resource)
+        log_to_file(f"Executing: {method.upper()} {url}")
+        # Copy, the same example instance may be updated by concurrent tests
+        resource = dict(resource, id=fixture.server_id)
+        response = context.http_client.put(url, headers=headers, json=resource, operation=method)
 
     elif method == "read":
-        fixture = next((fix for fix in FIXTURES if fix.source_id == test_id), None)
-        if fixture is None:
-            log_to_file("No fixture found in read")
-            return None
-        resource_id = fixture.server_id
-        log_to_file(f"Executing: {method.upper()} {url}/{resource_id}")
-        response = requests.get(f"{url}/{resource_id}", headers=headers)
-    else:
-        raise NotImplementedError(f"Method {method} not implemented")
+        log_to_file(f"Executing: {method.upper()} {url}")
+        response = context.http_client.get(url, headers=headers, operation=method)
+
+    else:  # search and history
+        page_size = context.config_manager.search_page_size
+        if page_size and "_count=" not in url:
+            url = f"{url}{'&' if '?' in url else '?'}_count={page_size}"
+
+        log_to_file(f"Executing: {method.upper()} {url}")
+        # Only the first page is read here, the following pages are read by the assertions
+        response = PagedResponse(
+            context.http_client,
+            context.http_client.get(url, headers=headers, operation=method),
+            request_headers=headers,
+            page_limit=context.config_manager.search_page_limit,
+        )
 
     log_to_file(f"Response: {response.status_code}")
     return response
 
+def verify_created_resource(context, response, resource_type):
+    """
+    Verifies the id and resourceType of a created resource, depending on "createVerification".
+    The body returned by the create is used if present, a GET is only sent
+    if the server returned no resource or the mode is "get".
+
+    :param context: ExecutionContext of the current run.
+    :param response: HTTP response of the create.
+    :param resource_type: Expected resourceType.
+    :return: None
+    """
+    saved_resource_id = context.saved_resource_id
+    assert saved_resource_id, "No ID was saved after create"
+
+    mode = context.config_manager.create_verification
+    if mode == "skip":
+        return
+    if mode == "sample" and random.random() >= context.config_manager.create_verification_sample_rate:
+        return
+
+    data = response_json(response) if mode != "get" else None
+    if isinstance(data, dict) and "resourceType" in data:
+        log_to_file(f"Verifying created resource from response: {resource_type}/{saved_resource_id}")
+        source = "Response"
+    else:
+        # GET for verification
+        read_url = f"{context.fhir_server_base}/{resource_type}/{saved_resource_id}"
+        log_to_file(f"Verifying created resource via GET: {read_url}")
+        get_response = context.http_client.get(read_url, headers={"Accept": "application/fhir+json"}, operation="verify")
+        log_to_file(f"Response: {get_response.status_code}")
+        data = response_json(get_response)
+        assert isinstance(data, dict), "GET response is not valid JSON"
+        source = "GET"
+
+    assert data.get("id") == saved_resource_id, f"{source} returned different ID"
+    assert data.get("resourceType") == resource_type, "ResourceType mismatch"
+
 # Fixture for dynamic test data
-@pytest.fixture(params=get_testscript_pairs())
+@pytest.fixture(scope="session", autouse=True)
+def render_reports():
+    """
+    Renders the report of the run from the event stream in a separate process.
+    Only if "log_format" is set in config.json.
+    """
+    yield
+    report_format = get_config_manager().report_format
+    if report_format:
+        flush_log(wait=True)
+        render_report_in_background(get_event_file_path(), report_format)
+
+@pytest.fixture(scope="session", autouse=True)
+def request_metrics(render_reports):
+    """
+    Logs the timing percentiles of all HTTP exchanges at the end of the session
+    and exports them as OpenMetrics and JSON, before the report is rendered.
+    """
+    yield
+    export_request_metrics(get_event_file_path())
+
+@pytest.fixture(scope="session", autouse=True)
+def shared_fixtures(request_metrics):
+    """
+    Deletes the fixtures shared between the TestScripts at the end of the session,
+    before the report is rendered.
+    """
+    yield
+    config_manager = get_config_manager()
+    get_fixture_manager().close(get_http_client(config_manager.http, config_manager.cassette))
+
+@pytest.fixture(scope="session", autouse=True)
+def run_state():
+    """
+    Writes the inputs and results of the TestScripts of the session to the run state file,
+    the next changed-only run starts from it.
+    """
+    yield
+    get_run_state(get_config_manager().run_state).save()
+
+@pytest.fixture
+def execution_context():
+    """
+    Pytest fixture that provides a fresh ExecutionContext for every TestScript.
+
+    :return: ExecutionContext using the global configuration.
+    """
+    return ExecutionContext(get_config_manager())
+
+def pytest_generate_tests(metafunc):
+    """
+    Parametrizes the tests with the TestScript paths.
+    Only the file names are listed here, the TestScripts are loaded when their test runs,
+    so collecting the tests does not parse the whole IG.
+    In changed-only mode (runState in config.json) the TestScripts are loaded to compare
+    their inputs with the run state, only the affected ones are collected, failed first.
+    """
+    if "testscript_data" in metafunc.fixturenames:
+        config_manager = get_config_manager()
+        if run_state_mode(config_manager.run_state) == "changed-only":
+            pairs = select_changed(get_run_state(config_manager.run_state),
+                                   config_manager.get_testscripts_from_config(), config_manager.fhir_server)
+            paths = [path for path, _ in pairs]
+        else:
+            paths = get_testscript_paths()
+        metafunc.parametrize(
+            "testscript_data", paths, indirect=True,
+            ids=[os.path.splitext(os.path.basename(path))[0] for path in paths],
+        )
+
+@pytest.fixture
 def testscript_data(request):
     """
     Pytest fixture that provides testscript and resource data for parameterized tests.
@@ -108,97 +214,53 @@ def testscript_data(request):
     :param request: Pytest fixture request object.
     :return: Tuple of (testscript, resource) data.
     """
-    testscript_path, resource_path = request.param
+    testscript_path = request.param
     testscript = load_json(testscript_path)
+    resource_path = get_config_manager().get_fixture_paths(testscript)
     if resource_path:
         resources = load_json_list(resource_path)
     else:
         resources = None
     return testscript, resources
 
-def execute_test_actions(test, resource, test_id):
+def execute_test_actions(context, test, resource):
     """
-    Executes all actions for a single test.
+    Executes all steps of a single compiled test.
 
-    :param test: Test definition dictionary.
+    :param context: ExecutionContext of the current run.
+    :param test: TestPlan of the test.
     :param resource: FHIR resource to test with.
     :return: True if test passed, False otherwise.
     """
-    #stop_test_on_fail = test.get("stopTestOnFail", False)
-    test_name = test.get('name', 'Unnamed Test')
-    log_to_file(f"\n ----------- Starting Test: {test_name} -----------")
+    log_to_file(f"\n ----------- Starting Test: {test.name} -----------")
+    log_event("test_start", test=test.name)
 
     response = None
     test_passed = True
 
-    for action_index, action in enumerate(test.get("action", [])):
+    for index, step in enumerate(test.steps):
         try:
             # WHEN – Operation
-            if "operation" in action:
-                operation = action["operation"]
-                response = execute_operation(operation, resource, test_id)
-
-                # Extension: If it was a CREATE operation, then check GET
-                method = operation.get("type", {}).get("code", "").lower()
-                resource_type = operation.get("resource")
-                if method == "create":
-                    global saved_resource_id
-                    assert saved_resource_id, "No ID was saved after create"
-
-                    # GET for verification
-                    read_url = f"{FHIR_SERVER_BASE}/{resource_type}/{saved_resource_id}"
-                    log_to_file(f"Verifying created resource via GET: {read_url}")
-                    get_response = requests.get(read_url, headers={"Accept": "application/fhir+json"})
-
-                    # Output & Assertion
-                    log_to_file(f"Response: {get_response.status_code}")
-                    try:
-                        data = get_response.json()
-                        assert data.get("id") == saved_resource_id, "GET returned different ID"
-                        assert data.get("resourceType") == resource_type, "ResourceType mismatch"
-                    except ValueError:
-                        assert False, "GET response is not valid JSON"
+            if isinstance(step, OperationStep):
+                response = execute_operation(context, step, resource, test.test_id)
+                if step.response_id:
+                    context.responses[step.response_id] = response
+                if isinstance(response, PagedResponse):
+                    # The page checks of the following assertions share one walk over the pages
+                    response.page_checks = [check for check in page_checks(test.steps[index + 1:])
+                                            if check.source(context, response, resource) is response]
+
+                # Extension: If it was a CREATE operation, then verify the created resource
+                if step.method == "create":
+                    verify_created_resource(context, response, step.resource_type)
 
             # THEN - Assertion
-            elif "assert" in action:
-                assertion = action["assert"]
-                stopTestOnFail = assertion.get("stopTestOnFail", False)
-                if "validateProfileId" in assertion:
-                    try:
-                        validate_profile_assertion(assertion.get("validateProfileId"))
-                        log_to_file("✓ Assertion passed")
-                    except AssertionError as e:
-                        if stopTestOnFail:
-                            log_to_file("⚠ stopTestOnFail assertion failed → Test terminated")
-                            raise TestExecutionError(str(e))
-                        else:
-                            test_passed = handle_assertion_error(e, False)
-
-                contentType = False
-                if "contentType" in assertion:
-                    try:
-                        contentType = True
-                        validate_content_type(response, assertion.get("contentType"))
-                        log_to_file("✓ Assertion passed")
-                    except AssertionError as e:
-                        if stopTestOnFail:
-                            log_to_file("⚠ stopTestOnFail assertion failed → Test terminated")
-                            raise TestExecutionError(str(e))
-                        else:
-                            test_passed = handle_assertion_error(e, False)
-
-                if assertion.get("direction") == "response" and not contentType:
-                    try:
-                        validate_response(assertion, response)
-                        log_to_file("✓ Assertion passed")
-                    except AssertionError as e:
-                        if stopTestOnFail:
-                            log_to_file("⚠ stopTestOnFail assertion failed → Test terminated")
-                            raise TestExecutionError(str(e))
-                        else:
-                            test_passed = handle_assertion_error(e, False)
-
-                elif assertion.get("direction") == "request":
+            else:
+                for kind, check in step.checks:
+                    if not run_assertion(test.name, kind, step.stop_test_on_fail, check, context, response, resource):
+                        test_passed = False
+
+                if step.direction == "request":
                     log_to_file("direction request out of scope")
 
 
@@ -211,42 +273,91 @@ def execute_test_actions(test, resource, test_id):
 
     return test_passed
 
-def save_fixtures(jsonFiles, fix_list):
+def save_fixtures(context, jsonFiles, fix_list, modified_ids=()):
     """
     saves fixtures to the server and saves infos for them
+    Fixtures with the same content are shared between the TestScripts of a run,
+    only fixtures in modified_ids get a private copy.
+    :param context: ExecutionContext of the current run
     :param jsonFiles: the json inside the Files
+    :param modified_ids: ids of the fixtures the TestScript updates or deletes
     """
+    fixture_manager = get_fixture_manager()
     bundle_json = [] #die zu erstellenden Fixtures als json
+    bundle_fixtures = []  # Fixture of every bundle entry, in the same order
+    shareable = []  # (content hash, Fixture) of the fixtures that may be shared
     for jsonf, fixture in zip(jsonFiles, fix_list):
         fix_id = jsonf.get("id")
         fix_type = jsonf.get("resourceType")
         fix_source_id = fixture.get("id")
         autocreate = fixture.get("autocreate", True)
         autodelete = fixture.get("autodelete", False)
-        if(autocreate):
-            bundle_json.append(jsonf)
-        FIXTURES.append(Fixture(fix_id,fix_source_id,autodelete, fix_type)) #erstes Anlegen vor bundle
+        fix = context.fixtures.add(Fixture(fix_id,fix_source_id,autodelete, fix_type, resource=jsonf)) #erstes Anlegen vor bundle
+        if not autocreate:
+            continue
 
-    if bundle_json:
-        bundle = build_whole_transaction_bundle(bundle_json)
-
-        response = requests.post(
-            FHIR_SERVER_BASE,
-            headers={"Content-Type": "application/fhir+json", "Accept": "application/fhir+json"},
-            json=json.loads(bundle)
-        )
-
-        results = response.json().get("entry")
-
-        for fix_cont, res in zip(bundle_json, results):
-            resp = res.get("response", {})
-            res_loc = resp.get("location", "")
-            res_id = res_loc.split("/")[1]  # server id
-            fix_id = fix_cont.get("id")  # id inside the Example Instance
-
-            for fix in FIXTURES:
-                if fix_id == fix.fixture_id:
-                    fix.server_id = res_id  # saves der Server id
+        if fix_source_id in modified_ids:
+            bundle_json.append(jsonf)
+            bundle_fixtures.append(fix)
+        else:
+            shareable.append((content_hash(jsonf), fix))
+
+    # Acquired in the order of their content hash, so TestScripts waiting for fixtures
+    # the other one creates cannot deadlock. Fixtures with the same content as an earlier
+    # fixture of this TestScript take their reference after the transaction.
+    shareable.sort(key=lambda item: item[0])
+    reserved = []  # fixtures this TestScript creates for all others
+    duplicates = []
+    acquired_hashes = set()
+    for key, fix in shareable:
+        if key in acquired_hashes:
+            duplicates.append(fix)
+            continue
+        acquired_hashes.add(key)
+        fix.shared = fixture_manager.acquire(context.fhir_server_base, fix.resource, fix.autodelete)
+        if fix.shared is not None:
+            context.fixtures.mark_created(fix, fix.shared.server_id)
+            log_to_file(f"Reusing shared fixture {fix.source_id}: {fix.type}/{fix.server_id} ({fix.shared.users} users)")
+        else:
+            reserved.append(fix)
+            bundle_json.append(fix.resource)
+            bundle_fixtures.append(fix)
+
+    try:
+        if bundle_json:
+            # Reused fixtures are not in the bundle, references to them point to the server resource
+            resolved = {f"{fix.type}/{fix.fixture_id}": f"{fix.type}/{fix.server_id}"
+                        for _, fix in shareable if fix.shared is not None}
+            # Serialized once into compact bytes, the resources themselves stay unchanged
+            body, headers = encode_transaction_bundle(bundle_json, context.http_client.settings.get("gzipMinBytes"), resolved)
+
+            response = context.http_client.post(context.fhir_server_base, headers=headers, data=body, operation="transaction")
+
+            results = response.json().get("entry")
+
+            # The transaction response has one entry per bundle entry, in the same order
+            for fix, fix_cont, res in zip(bundle_fixtures, bundle_json, results):
+                resp = res.get("response", {})
+                res_loc = resp.get("location", "")
+                res_id = res_loc.split("/")[1]  # server id
+
+                context.fixtures.mark_created(fix, res_id)  # saves der Server id
+                if fix.source_id not in modified_ids:
+                    fix.shared = fixture_manager.register(context.fhir_server_base, fix_cont, res_id, fix.autodelete)
+    finally:
+        # Reservations that were not created are given up, waiting TestScripts create them themselves
+        for fix in reserved:
+            if fix.shared is None:
+                fixture_manager.abandon(context.fhir_server_base, fix.resource)
+
+    for fix in duplicates:
+        fix.shared = fixture_manager.acquire(context.fhir_server_base, fix.resource, fix.autodelete)
+        if fix.shared is not None:
+            context.fixtures.mark_created(fix, fix.shared.server_id)
+            log_to_file(f"Reusing shared fixture {fix.source_id}: {fix.type}/{fix.server_id} ({fix.shared.users} users)")
+        else:
+            # The first copy stayed private (see FixtureManager.register), so is this one
+            fixture_manager.abandon(context.fhir_server_base, fix.resource)
 
 def extract_fixture_ids(data):
     fixture_ids = []
@@ -259,6 +370,30 @@ def extract_fixture_ids(data):
 
     return fixture_ids
 
+def run_assertion(test_name, kind, stop_test_on_fail, check, *args):
+    """
+    Runs one assertion check, logs the result and writes an "assertion" event.
+
+    :param test_name: Name of the current test.
+    :param kind: Kind of the assertion, e.g. "responseCode".
+    :param stop_test_on_fail: Stop the test if the assertion fails.
+    :param check: Validation function raising AssertionError on failure.
+    :param args: Arguments of the validation function.
+    :return: True if the assertion passed, False otherwise.
+    :raises: TestExecutionError if the assertion failed and stop_test_on_fail is set.
+    """
+    try:
+        check(*args)
+        log_to_file("✓ Assertion passed")
+        log_event("assertion", test=test_name, kind=kind, passed=True)
+        return True
+    except AssertionError as e:
+        log_event("assertion", test=test_name, kind=kind, passed=False, message=str(e))
+        if stop_test_on_fail:
+            log_to_file("⚠ stopTestOnFail assertion failed → Test terminated")
+            raise TestExecutionError(str(e))
+        return handle_assertion_error(e, False)
+
 def handle_assertion_error(e, stop_test_on_fail):
     """
     Logs the AssertionError and decides whether to stop or continue the test.
@@ -273,63 +408,144 @@ def handle_assertion_error(e, stop_test_on_fail):
         raise TestExecutionError(f"Test stopped due to stopTestOnFail: {str(e)}")
     return False  # Test failed, but continuing allowed
 
-def test_fhir_operations(testscript_data):
+def run_single_test(context, test, resource):
+    """
+    Executes one test and logs its result.
+
+    :param context: ExecutionContext of the current run.
+    :param test: TestPlan of the test.
+    :param resource: FHIR resource to test with.
+    :return: Tuple of (test name, passed).
+    """
+    test_name = test.name
+    try:
+        test_passed = execute_test_actions(context, test, resource)
+
+        if test_passed:
+            log_to_file(f"✓ TEST PASSED: {test_name}")
+        else:
+            log_to_file(f"✗ TEST FAILED: {test_name} (but completed all actions)")
+        log_event("test_end", test=test_name, passed=test_passed)
+        return test_name, test_passed
+
+    except TestExecutionError as e:
+        log_to_file(f"✗ TEST STOPPED: {test_name} - {str(e)}")
+        log_event("test_end", test=test_name, passed=False, stopped=str(e))
+        return test_name, False
+        # Continue with next test even if this one was stopped
+
+    finally:
+        flush_log()
+
+def run_testscript(context, testscript, resources, plan=None):
     """
-    Main test function for FHIR operations testing.
     Executes all tests in a testscript with GIVEN-WHEN-THEN structure.
 
-    :param testscript_data: Tuple containing testscript and resource data.
+    :param context: ExecutionContext of the current run.
+    :param testscript: The TestScript resource.
+    :param resources: List of example instances used as fixtures or None.
+    :param plan: Optional ScriptPlan of the TestScript, compiled if None.
+    :return: List of (test name, passed) tuples.
+    :raises InvalidTestScriptError: If the TestScript is rejected, before any request is sent.
     """
+    if plan is None:
+        try:
+            plan = compile_testscript(testscript)
+        except InvalidTestScriptError as e:
+            log_to_file(f"✗ TESTSCRIPT REJECTED: {str(e)}")
+            flush_log()
+            raise
+
+    testscript_name = plan.name
+    log_event("testscript_start", testscript=testscript_name)
 
-    if not has_fhir_server():
-        log_to_file("✗ TEST SKIPPED: No FHIR server configured")
-        pytest.skip("No FHIR server configured in config.json")
     # GIVEN
-    testscript, resources = testscript_data
     if resources != None:
         resource = resources[0] # later there should be a method that decides which fixture will be taken for the test
     else:
         resource = None
 
+    context.profiles = dict(plan.profiles)
+
     overall_results = []
+    try:
+        fixture_list = plan.fixtures
+        if fixture_list: #falls es fixtures gibt
+            save_fixtures(context, resources, fixture_list, plan.modified_ids)
+
+        # Tests without shared fixtures run concurrently, see test_scheduler
+        overall_results = run_tests(
+            plan.tests,
+            lambda test: run_single_test(context, test, resource),
+            context.config_manager.test_concurrency,
+            fixture_keys=lambda test: test.fixture_keys,
+        )
 
-    fixture_list = get_fixture(testscript)
-    if fixture_list: #falls es fixtures gibt
-        save_fixtures(resources, fixture_list)
+        # Final summary
+        log_to_file("======================")
+        log_to_file("Test Summary:")
+        for test_name, passed in overall_results:
+            status = "PASSED" if passed else "FAILED"
+            log_to_file(f"  {test_name}: {status}")
+
+        log_to_file("Test execution completed")
+    finally:
+        # TEARDOWN, also if creating the fixtures or running the tests failed
+        teardown_fixtures(context)
+        context.reset() #reset for next testscript
+        log_event("testscript_end", testscript=testscript_name,
+                  passed=sum(1 for _, passed in overall_results if passed),
+                  failed=sum(1 for _, passed in overall_results if not passed))
+        flush_log()
+
+    return overall_results
+
+def teardown_fixtures(context):
+    """
+    Deletes the autodelete fixtures of the TestScript with one batch request
+    and releases the shared fixtures, which are deleted at the end of the run.
 
+    :param context: ExecutionContext of the current run.
+    :return: Tuple (list of removed references, dictionary failed reference -> status).
+    """
+    for fix in context.fixtures:
+        if fix.shared is not None and fix.state != RELEASED:
+            get_fixture_manager().release(fix.shared)
+            context.fixtures.mark_released(fix)
+
+    references = [f"{fix.type}/{fix.server_id}" for fix in context.fixtures.pending_deletes()]
+    removed, failed = delete_resources(context.http_client, context.fhir_server_base, references)
+    for reference in removed:
+        context.fixtures.mark_deleted(context.fixtures.get_by_server_id(*reference.split("/", 1)))
+    if references:
+        log_to_file(f"Teardown: removed {len(removed)} of {len(references)} fixtures {removed}")
+    for reference, status in failed.items():
+        log_to_file(f"✗ Teardown: could not delete {reference} ({status})")
+    log_event("teardown", removed=removed, failed=failed)
+    return removed, failed
+
+def test_fhir_operations(testscript_data, execution_context, request):
+    """
+    Main test function for FHIR operations testing.
+    Executes all tests in a testscript with GIVEN-WHEN-THEN structure.
+    The result is recorded in the run state.
 
-    for test in testscript.get("test", []):
-        test_name = test.get('name', 'Unnamed Test')
-        test_id = ""
-        for action in test.get("action", []):
-            operation = action.get("operation")
-            if operation and "sourceId" in operation:
-                test_id = operation["sourceId"]
-                break
-        try:
-            test_passed = execute_test_actions(test, resource, test_id)
+    :param testscript_data: Tuple containing testscript and resource data.
+    :param execution_context: ExecutionContext of this TestScript.
+    :param request: Pytest fixture request object.
+    """
 
-            if test_passed:
-                log_to_file(f"✓ TEST PASSED: {test_name}")
-                overall_results.append((test_name, True))
-            else:
-                log_to_file(f"✗ TEST FAILED: {test_name} (but completed all actions)")
-                overall_results.append((test_name, False))
-
-        except TestExecutionError as e:
-            log_to_file(f"✗ TEST STOPPED: {test_name} - {str(e)}")
-            overall_results.append((test_name, False))
-            # Continue with next test even if this one was stopped
-
-    # Final summary
-    log_to_file("======================")
-    log_to_file("Test Summary:")
-    for test_name, passed in overall_results:
-        status = "PASSED" if passed else "FAILED"
-        log_to_file(f"  {test_name}: {status}")
-
-    log_to_file("Test execution completed")
-    for fix in FIXTURES:
-        if fix.autodelete and fix.server_id != "":
-            requests.delete(f"{FHIR_SERVER_BASE}/{fix.type}/{fix.server_id}")
-    FIXTURES.clear() #reset for next testscript
+    if not has_fhir_server():
+        log_to_file("✗ TEST SKIPPED: No FHIR server configured")
+        pytest.skip("No FHIR server configured in config.json")
+
+    testscript, resources = testscript_data
+    passed = False
+    try:
+        passed = all(test_passed for _, test_passed in run_testscript(execution_context, testscript, resources))
+    finally:
+        config_manager = get_config_manager()
+        get_run_state(config_manager.run_state).record(
+            request.node.callspec.params["testscript_data"], config_manager.get_fixture_paths(testscript),
+            config_manager.fhir_server, passed,
+        )
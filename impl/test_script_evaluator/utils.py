@@ -1,24 +1,182 @@
 from pathlib import Path
 import os
 from datetime import datetime
+from contextlib import contextmanager
 import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from log_writer import get_log_writer
+from parse_cache import get_parse_cache
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 RESULTS_DIR = BASE_DIR / "Results"
-RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
 timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 log_filename = f"test_results_{timestamp}.txt"
 LOG_FILE_PATH = os.path.abspath(RESULTS_DIR / log_filename)
+EVENT_FILE_PATH = os.path.splitext(LOG_FILE_PATH)[0] + ".jsonl"
+
+# The log file is only created with the first message, importing has no side effects
+_log_file_ready = False
+_log_file_lock = threading.Lock()
+
+
+def _ensure_log_file():
+    """Creates Results/ and the log file with its header before the first message."""
+    global _log_file_ready
+    with _log_file_lock:
+        if _log_file_ready:
+            return
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        with open(LOG_FILE_PATH, "w", encoding="utf-8") as f:
+            f.write(f"FHIR Test Log - {datetime.now()}\n\n")
+        _log_file_ready = True
 
-with open(LOG_FILE_PATH, "w", encoding="utf-8") as f:
-    f.write(f"FHIR Test Log - {datetime.now()}\n\n")
+
+def set_log_file(filename):
+    """
+    Redirects log_to_file into a new file inside Results/.
+    Worker processes use this so parallel runs do not write into the same file.
+
+    :param filename: Name of the new log file.
+    :return: Absolute path of the new log file.
+    """
+    global LOG_FILE_PATH, EVENT_FILE_PATH, _log_file_ready
+    with _log_file_lock:
+        LOG_FILE_PATH = os.path.abspath(RESULTS_DIR / filename)
+        EVENT_FILE_PATH = os.path.splitext(LOG_FILE_PATH)[0] + ".jsonl"
+        _log_file_ready = False
+    return LOG_FILE_PATH
+
+
+# Thread-local buffer used while a test runs concurrently with others
+_log_capture = threading.local()
 
 
 def log_to_file(message: str):
-    print(message)
-    with open(LOG_FILE_PATH, "a", encoding="utf-8") as f:
-        f.write(message + "\n")
+    lines = getattr(_log_capture, "lines", None)
+    if lines is not None:
+        lines.append(message)
+        return
+    if not _log_file_ready:
+        _ensure_log_file()
+    get_log_writer().write(LOG_FILE_PATH, message + "\n", echo=message)
+
+
+def log_event(event_type, **fields):
+    """
+    Appends one structured event to the JSONL event stream of the run.
+    Reports are rendered from this stream afterwards, see report_renderer.
+
+    :param event_type: Type of the event, e.g. "test_start" or "assertion".
+    :param fields: Additional fields of the event.
+    """
+    event = {"ts": round(time.time(), 3), "type": event_type}
+    event.update(fields)
+    lines = getattr(_log_capture, "lines", None)
+    if lines is not None:
+        lines.append(event)
+        return
+    _write_event(event)
+
+
+def _write_event(event):
+    if not _log_file_ready:
+        _ensure_log_file()
+    get_log_writer().write(EVENT_FILE_PATH, json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def resource_type_of_url(url, method="GET"):
+    """
+    :param url: Requested URL.
+    :param method: HTTP method.
+    :return: First resource type in the path, "Bundle" for requests to the server base (transaction, batch).
+    """
+    for segment in urlsplit(url).path.split("/"):
+        if segment[:1].isupper() and segment.isalpha():
+            return segment
+    return "Bundle" if method.upper() == "POST" else ""
+
+
+def log_http_exchange(method, url, response, timing, error):
+    """
+    Observer for FhirHttpClient, writes an "http" event for every exchange.
+
+    :param method: HTTP method.
+    :param url: Requested URL.
+    :param response: HTTP response object or None if the request failed.
+    :param timing: ExchangeTiming of the exchange.
+    :param error: Exception of a failed request or None.
+    """
+    fields = {
+        "method": method,
+        "url": url,
+        "operation": timing.operation,
+        "resource": resource_type_of_url(url, method),
+    }
+    if response is not None:
+        fields["status"] = response.status_code
+    fields.update(
+        ms=round(timing.total * 1000, 2),
+        connect_ms=round(timing.connect * 1000, 2),
+        ttfb_ms=round(timing.ttfb * 1000, 2),
+        sent=timing.sent,
+        received=timing.received,
+    )
+    if timing.limit is not None:
+        fields["limit"] = timing.limit
+    if error is not None:
+        fields["error"] = str(error)
+    log_event("http", **fields)
+
+
+def get_event_file_path():
+    """Returns the path of the event stream of this process."""
+    return EVENT_FILE_PATH
+
+
+def flush_log(wait=False):
+    """
+    Flushes the background log writer, called at test boundaries.
+
+    :param wait: Block until everything is written, used before a process ends.
+    """
+    get_log_writer().flush(wait=wait)
+
+
+@contextmanager
+def capture_log():
+    """
+    Buffers all log_to_file messages and log_event events of the current thread instead of writing them.
+
+    :return: List that receives the buffered messages and events.
+    """
+    lines = []
+    _log_capture.lines = lines
+    try:
+        yield lines
+    finally:
+        _log_capture.lines = None
+
+
+def replay_log(lines):
+    """
+    Writes messages and events buffered by capture_log.
+
+    :param lines: List filled by capture_log.
+    """
+    captured = getattr(_log_capture, "lines", None)
+    if captured is not None:
+        # Nested capture, e.g. the tests of a TestScript that runs inside a captured load iteration
+        captured.extend(lines)
+        return
+    for line in lines:
+        if isinstance(line, dict):
+            _write_event(line)
+        else:
+            log_to_file(line)
 
 
 def get_fixture(testscript):
@@ -31,13 +189,13 @@ def get_fixture(testscript):
 def load_json(path):
     """
     Loads a JSON File from the given path.
+    Unchanged files are not parsed again, see parse_cache.
     :param path: The path to the JSON file.
-    :return: Parsed JSON content as dictionary.
+    :return: Parsed JSON content as dictionary, shared with other callers and not to be changed.
     """
     full_path = BASE_DIR / path
     printInfoJson(path)
-    with open(full_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_parse_cache().load(full_path)
 
 def load_json_list(paths):
     json_list = []
@@ -48,9 +206,7 @@ def load_json_list(paths):
     for path in paths:
         full_path = BASE_DIR / path
         printInfoJson(path)
-
-        with open(full_path, "r", encoding="utf-8") as f:
-            json_list.append(json.load(f))
+        json_list.append(get_parse_cache().load(full_path))
 
     return json_list
 
@@ -84,3 +240,20 @@ def parse_fhir_header(value):
     elif value == "xml":
         return "application/fhir+xml"
     return value  # fallback: use whatever it says
+
+def response_json(response):
+    """
+    Parses the JSON body of a response. The result is kept on the response,
+    so several assertions on the same response parse it only once.
+
+    :param response: The HTTP response object or None.
+    :return: Parsed body or None if there is no JSON body.
+    """
+    if response is None:
+        return None
+    if "_parsed_json" not in vars(response):
+        try:
+            response._parsed_json = response.json() if response.content else None
+        except ValueError:
+            response._parsed_json = None
+    return response._parsed_json
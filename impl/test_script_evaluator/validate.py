@@ -1,4 +1,17 @@
-from impl.test_script_evaluator.test_script_evaluator_log_to_file import log_to_file, parse_fhir_header, profile_manager
+import json
+
+from impl.exception.FhirPathError import FhirPathError
+from fhirpath import evaluate
+from profile_manager import get_profile_manager
+from structure_validator import get_structure_validator
+from utils import log_to_file, parse_fhir_header, response_json
+
+# Elements that are assigned by the server and not compared with minimumId
+SERVER_ASSIGNED_ELEMENTS = ("id", "meta", "text")
+
+# Assert operators supported by compare_with_operator
+ASSERT_OPERATORS = ("equals", "notEquals", "in", "notIn", "greaterThan", "lessThan",
+                    "empty", "notEmpty", "contains", "notContains")
 
 
 def validate_content_type(response, expected_type=None):
@@ -37,17 +50,60 @@ def validate_response(assertion, response):
     """
 
     if "responseCode" in assertion:
-        expected_codes = [code.strip() for code in assertion.get("responseCode", "").split(",")]
-        status_code = str(response.status_code)
-        log_to_file(f"Asserting response code {status_code} in {expected_codes}")
-        assert status_code in expected_codes, f"Assertion failed: {status_code} not in {expected_codes}"
+        validate_response_code(parse_response_codes(assertion["responseCode"]), response)
+
+
+def parse_response_codes(response_code):
+    """
+    Splits the 'responseCode' of an assertion, e.g. "200,201".
+
+    :param response_code: Comma separated status codes.
+    :return: Tuple of expected status codes as strings.
+    """
+    return tuple(code.strip() for code in response_code.split(","))
+
+
+def validate_response_code(expected_codes, response):
+    """
+    Validates the status code of a response against already parsed expected codes.
+
+    :param expected_codes: Tuple of expected status codes as strings.
+    :param response: The HTTP response object returned by the server.
+    :return: None
+    """
+    status_code = str(response.status_code)
+    log_to_file(f"Asserting response code {status_code} in {list(expected_codes)}")
+    assert status_code in expected_codes, f"Assertion failed: {status_code} not in {list(expected_codes)}"
+
+
+def resolve_profile(profile_id, profiles=None):
+    """
+    Looks up the profile of a 'validateProfileId'.
+    The id refers to TestScript.profile, whose reference is the canonical URL of the profile.
+    Ids that are not declared in the TestScript are looked up among the ids of the loaded profiles.
+
+    :param profile_id: The profile ID (from 'validateProfileId').
+    :param profiles: Dictionary TestScript.profile id -> canonical URL.
+    :return: Profile entry of the ProfileManager or None.
+    """
+    profile_manager = get_profile_manager()
+    reference = (profiles or {}).get(profile_id)
+    if reference:
+        entry = profile_manager.get_by_url(reference)
+        if entry is not None:
+            return entry
+    return profile_manager.get_by_id(profile_id)
 
 
-def validate_profile_assertion(profile_id):
+def validate_profile_assertion(profile_id, response=None, profiles=None):
     """
-    Validates whether the profile specified in 'validateProfileId' exists.
+    Validates the response resource against the profile specified in 'validateProfileId'.
+    If the response contains no resource, only the existence of the profile is checked.
 
     :param profile_id: The profile ID to validate (from 'validateProfileId').
+    :param response: The HTTP response object of the last operation, a resource
+                     (e.g. one page of a search) or None.
+    :param profiles: Dictionary TestScript.profile id -> canonical URL.
     :return: None
     """
 
@@ -55,7 +111,171 @@ def validate_profile_assertion(profile_id):
         log_to_file("Skipping profile validation (no validateProfileId provided).")
         return True
 
-    available_ids = [p[1] for p in profile_manager.get_profiles()]
+    profile_manager = get_profile_manager()
+    log_to_file(f"Asserting profile Id '{profile_id}' in {len(profile_manager.get_profiles())} loaded profiles")
+    entry = resolve_profile(profile_id, profiles)
+    assert entry is not None, f"Profile ID '{profile_id}' not found in loaded profiles!\n"
+
+    resource = response if isinstance(response, dict) else response_json(response)
+    if not isinstance(resource, dict) or "resourceType" not in resource:
+        log_to_file("No resource in the response, only the existence of the profile was checked")
+        return
+
+    validator = get_structure_validator(entry["url"], entry.get("version"))
+    if resource["resourceType"] == "Bundle" and entry.get("type") != "Bundle":
+        # Search and history results: every entry of the profiled type is validated
+        issues = []
+        for index, bundle_entry in enumerate(resource.get("entry", [])):
+            entry_resource = bundle_entry.get("resource", {})
+            if entry_resource.get("resourceType") == entry.get("type"):
+                issues.extend(f"entry[{index}]: {issue}" for issue in validator.validate(entry_resource))
+    else:
+        issues = validator.validate(resource)
+    log_to_file(f"Validating {resource['resourceType']} against {entry['url']}: {len(issues)} issue(s)")
+    assert not issues, f"Resource does not conform to profile '{profile_id}':\n" + "\n".join(issues)
+
+
+def compare_with_operator(operator, actual, expected):
+    """
+    Compares an actual value with the expected value of an assertion.
+
+    :param operator: TestScript assert operator code, "equals" if None.
+    :param actual: Actual value as string or None if there is no value.
+    :param expected: Expected value as string.
+    :return: True if the comparison holds.
+    :raises ValueError: For unsupported operators.
+    """
+    operator = operator or "equals"
+    if operator == "empty":
+        return actual in (None, "")
+    if operator == "notEmpty":
+        return actual not in (None, "")
+    if actual is None:
+        return operator in ("notEquals", "notIn", "notContains")
+
+    if operator == "equals":
+        return actual == expected
+    if operator == "notEquals":
+        return actual != expected
+    if operator in ("in", "notIn"):
+        found = actual in [value.strip() for value in expected.split(",")]
+        return found if operator == "in" else not found
+    if operator in ("contains", "notContains"):
+        found = expected in actual
+        return found if operator == "contains" else not found
+    if operator in ("greaterThan", "lessThan"):
+        try:
+            actual, expected = float(actual), float(expected)
+        except ValueError:
+            pass  # Strings, e.g. dates, are compared lexicographically
+        return actual > expected if operator == "greaterThan" else actual < expected
+    raise ValueError(f"Unsupported assert operator '{operator}'")
+
+
+def _to_assert_value(values):
+    """
+    Converts the first result of a FHIRPath evaluation into the string form of assert values.
+    """
+    if not values:
+        return None
+    value = values[0]
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return str(value)
+
+
+def validate_expression(assertion, resource, compare_resource=None):
+    """
+    Evaluates the FHIRPath 'expression' of an assertion.
+    Without value and compareToSourceExpression the expression has to evaluate to true,
+    otherwise its first result is compared with the value or with the result of
+    'compareToSourceExpression' on the compareToSourceId fixture.
+
+    :param assertion: Assertion dictionary with 'expression'.
+    :param resource: Resource the expression is evaluated against (response or sourceId).
+    :param compare_resource: Resource of 'compareToSourceId' or None.
+    :return: None
+    """
+    expression = assertion["expression"]
+    operator = assertion.get("operator")
+    try:
+        result = evaluate(expression, resource)
+        if "compareToSourceExpression" in assertion:
+            expected = _to_assert_value(evaluate(assertion["compareToSourceExpression"], compare_resource))
+        else:
+            expected = assertion.get("value")
+    except FhirPathError as e:
+        raise AssertionError(f"FHIRPath expression '{expression}' failed: {e}")
+
+    log_to_file(f"Evaluating expression '{expression}': {result}")
+
+    if operator in ("empty", "notEmpty"):
+        assert bool(result) == (operator == "notEmpty"), \
+            f"Expression '{expression}' evaluated to {result}, expected {operator}"
+        return
+
+    if expected is None and "compareToSourceExpression" not in assertion:
+        assert result == [True], f"Expression '{expression}' evaluated to {result}, expected true"
+        return
+
+    actual = _to_assert_value(result)
+    log_to_file(f"Asserting {actual!r} {operator or 'equals'} {expected!r}")
+    assert compare_with_operator(operator, actual, expected), \
+        f"Expression '{expression}': got {actual!r}, expected {operator or 'equals'} {expected!r}"
+
+
+def validate_header_field(assertion, response):
+    """
+    Validates a header of the response against the value of the assertion.
+    Without value the header only has to be present.
+
+    :param assertion: Assertion dictionary with 'headerField'.
+    :param response: The HTTP response object returned by the server.
+    :return: None
+    """
+    header = assertion["headerField"]
+    operator = assertion.get("operator")
+    expected = assertion.get("value")
+    actual = response.headers.get(header) if response is not None else None
+    if expected is None and operator not in ("empty", "notEmpty"):
+        operator = "notEmpty"
+
+    log_to_file(f"Asserting header '{header}': {actual!r} {operator or 'equals'} {expected!r}")
+    assert compare_with_operator(operator, actual, expected), \
+        f"Header '{header}': got {actual!r}, expected {operator or 'equals'} {expected!r}"
+
+
+def _contains_minimum(actual, minimum):
+    """
+    Checks whether a value contains at least the content of the minimum value.
+    Every entry of a minimum list has to be contained in an entry of the actual list.
+    """
+    if isinstance(minimum, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and _contains_minimum(actual[key], value) for key, value in minimum.items()
+        )
+    if isinstance(minimum, list):
+        return isinstance(actual, list) and all(
+            any(_contains_minimum(item, value) for item in actual) for value in minimum
+        )
+    return actual == minimum
+
+
+def validate_minimum_id(minimum, resource):
+    """
+    Validates that a resource contains at least the content of the 'minimumId' fixture.
+    Elements assigned by the server (id, meta, text) are not compared.
+
+    :param minimum: Resource of the minimumId fixture.
+    :param resource: Resource to validate (response or sourceId).
+    :return: None
+    """
+    assert minimum is not None, "minimumId fixture not found"
+    assert isinstance(resource, dict), "No resource to compare with the minimumId fixture"
 
-    log_to_file(f"Asserting profile Id '{profile_id}' in {available_ids}")
-    assert profile_id in available_ids, f"Profile ID '{profile_id}' not found in loaded profiles!\n"
+    missing = [key for key, value in minimum.items()
+               if key not in SERVER_ASSIGNED_ELEMENTS and not _contains_minimum(resource.get(key), value)]
+    log_to_file(f"Asserting minimum content of {minimum.get('resourceType')}: {len(missing)} element(s) missing")
+    assert not missing, f"Resource does not contain the minimum content of the fixture, missing or different: {missing}"
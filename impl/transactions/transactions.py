@@ -1,6 +1,10 @@
+import gzip
 import json
 import uuid
 
+# Compact JSON, no whitespace between tokens
+COMPACT_SEPARATORS = (",", ":")
+
 def prefix_references_with_urn_uuid(obj):
     """
      Recursively prefixes all reference fields in a FHIR resource with 'urn:uuid:'.
@@ -19,6 +23,33 @@ def prefix_references_with_urn_uuid(obj):
             prefix_references_with_urn_uuid(item)
 
 
+def with_urn_uuid_references(obj, resolved=None):
+    """
+    Returns a copy of a FHIR resource with all reference fields prefixed with 'urn:uuid:'.
+    Unlike prefix_references_with_urn_uuid the given resource is not changed.
+    Lists and dictionaries are copied, all other values are shared with the original.
+
+    :param obj: The dictionary or list to process.
+    :param resolved: Optional dictionary reference -> server reference for resources that are
+                     not part of the bundle (e.g. shared fixtures), these are replaced instead of prefixed.
+    :return: Copy with prefixed references.
+    """
+    if isinstance(obj, dict):
+        copy = {}
+        for key, value in obj.items():
+            if key == "reference" and isinstance(value, str):
+                if resolved and value in resolved:
+                    copy[key] = resolved[value]
+                else:
+                    copy[key] = value if value.startswith("urn:uuid:") else f"urn:uuid:{value}"
+            else:
+                copy[key] = with_urn_uuid_references(value, resolved)
+        return copy
+    if isinstance(obj, list):
+        return [with_urn_uuid_references(item, resolved) for item in obj]
+    return obj
+
+
 def create_bundle_entry(resource):
     """
     Creates a Bundle entry for a FHIR resource.
@@ -40,16 +71,15 @@ def create_bundle_entry(resource):
     }
 
 
-def build_transaction_bundle(resources):
+def build_transaction_bundle(resources, resolved=None):
     """
     Builds a FHIR transaction bundle from a list of resources.
 
     :param resources: List of FHIR resource dictionaries.
+    :param resolved: Optional dictionary reference -> server reference of resources outside the bundle.
     :return: Complete transaction bundle dictionary.
     """
-    for res in resources:
-        prefix_references_with_urn_uuid(res)
-    entries = [create_bundle_entry(res) for res in resources]
+    entries = [create_bundle_entry(with_urn_uuid_references(res, resolved)) for res in resources]
     return {
         "resourceType": "Bundle",
         "type": "transaction",
@@ -69,5 +99,39 @@ def build_whole_transaction_bundle(jsonFiles):
 
     bundle = build_transaction_bundle(all_resources)
 
-    bundle_json = json.dumps(bundle, indent=2, ensure_ascii=False)
+    bundle_json = json.dumps(bundle, separators=COMPACT_SEPARATORS, ensure_ascii=False)
     return bundle_json
+
+
+def encode_transaction_bundle(resources, gzip_min_bytes=None, resolved=None):
+    """
+    Builds a transaction bundle and serializes it once into the request body.
+    The resources are not changed, the body is compact UTF-8 JSON and is
+    gzip-compressed if it has at least gzip_min_bytes bytes.
+
+    :param resources: List of FHIR resource dictionaries.
+    :param gzip_min_bytes: Minimum body size for compression, None disables it.
+    :param resolved: Optional dictionary reference -> server reference of resources outside the bundle.
+    :return: Tuple of (body bytes, request headers).
+    """
+    bundle = build_transaction_bundle(resources, resolved)
+    body = json.dumps(bundle, separators=COMPACT_SEPARATORS, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/fhir+json; charset=utf-8", "Accept": "application/fhir+json"}
+    if gzip_min_bytes is not None and len(body) >= gzip_min_bytes:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def build_delete_batch_bundle(references):
+    """
+    Builds a FHIR batch bundle that deletes several resources in one request.
+
+    :param references: List of relative references, e.g. "Patient/123".
+    :return: Batch bundle dictionary.
+    """
+    return {
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [{"request": {"method": "DELETE", "url": reference}} for reference in references]
+    }